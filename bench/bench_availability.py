@@ -0,0 +1,99 @@
+# bench/bench_availability.py
+# Compare the old find_slot scan (every 30-min candidate × every busy range) with
+# AvailabilityIndex on synthetic dense calendars.
+#
+#   python bench/bench_availability.py [--events 100 1000 5000] [--queries 200] [--json out.json]
+import argparse, json, os, random, sys, time
+from datetime import datetime, timedelta, time as dtime, date as ddate
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.availability import AvailabilityIndex
+
+TZ = ZoneInfo("Africa/Tunis")
+WS, WE = dtime(9, 0), dtime(18, 0)
+
+def legacy_find(busy_ranges, now, due, duration):
+    """The pre-index algorithm, kept here as the baseline."""
+    step = timedelta(minutes=30)
+    day, last_day = now.date(), due.date()
+    while day <= last_day:
+        day_start = datetime.combine(day, WS, tzinfo=TZ)
+        day_end = datetime.combine(day, WE, tzinfo=TZ)
+        if day == now.date():
+            day_start = max(day_start, now)
+        if day == last_day:
+            day_end = min(day_end, due)
+        if day_start < day_end:
+            slot_start = day_start
+            while slot_start + timedelta(minutes=duration) <= day_end:
+                slot_end = slot_start + timedelta(minutes=duration)
+                if not any(s < slot_end and e > slot_start for s, e in busy_ranges):
+                    return slot_start, slot_end
+                slot_start += step
+        day = ddate.fromordinal(day.toordinal() + 1)
+    return None
+
+def synthetic_calendar(n, now, days=30, seed=0):
+    """n events packed into the work hours of the next `days` days (dense → few gaps)."""
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        day = now.date() + timedelta(days=rnd.randrange(days))
+        start = datetime.combine(day, WS, tzinfo=TZ) + timedelta(minutes=15 * rnd.randrange(36))
+        out.append((start, start + timedelta(minutes=rnd.choice((15, 30, 45, 60, 90, 120)))))
+    return out
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    results = [fn(q) for q in queries]
+    return (time.perf_counter() - t0) / len(queries), results
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, nargs="+", default=[100, 1000, 5000])
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--json", help="write results here as JSON")
+    args = ap.parse_args()
+
+    now = datetime(2026, 1, 5, 9, 7, tzinfo=TZ)
+    rnd = random.Random(1)
+    rows = []
+    for n in args.events:
+        busy = synthetic_calendar(n, now)
+        queries = [(now + timedelta(days=rnd.randint(1, 29), hours=rnd.randint(0, 8)), rnd.choice((30, 60, 120, 240, 360)))
+                   for _ in range(args.queries)]
+
+        t0 = time.perf_counter()
+        index = AvailabilityIndex(busy)
+        build = time.perf_counter() - t0
+
+        legacy_q = queries[: max(5, min(len(queries), 20000 // max(n, 1)))]  # keep the baseline bearable
+        legacy_s, legacy_res = timed(lambda q: legacy_find(busy, now, q[0], q[1]), legacy_q)
+        index_s, index_res = timed(lambda q: index.earliest_slot(now, q[0], q[1], WS, WE, 30), queries)
+        assert legacy_res == index_res[: len(legacy_res)], "index disagrees with the legacy scan"
+
+        t0 = time.perf_counter()
+        for s, e in busy[:200]:
+            index.remove(s, e)
+            index.add(s, e)
+        update_s = (time.perf_counter() - t0) / (2 * min(200, len(busy)))
+
+        rows.append({
+            "events": n,
+            "legacy_query_ms": round(legacy_s * 1000, 3),
+            "index_build_ms": round(build * 1000, 3),
+            "index_query_ms": round(index_s * 1000, 4),
+            "index_update_us": round(update_s * 1e6, 2),
+            "speedup": round(legacy_s / index_s, 1) if index_s else None,
+        })
+        print(f"{n:>7} events | legacy {rows[-1]['legacy_query_ms']:>10} ms/query | "
+              f"index {rows[-1]['index_query_ms']:>8} ms/query (build {rows[-1]['index_build_ms']} ms, "
+              f"update {rows[-1]['index_update_us']} µs) | x{rows[-1]['speedup']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# bench/bench_clean.py
+# Email body cleaning: the old BeautifulSoup get_text() vs. src/mail_clean.py
+# (stdlib parser, and lxml when installed). Reports parse time and how much text
+# would be sent to the LLM.
+#
+#   python bench/bench_clean.py [--corpus DIR] [--count 500] [--json out.json]
+#
+# --corpus: a directory of .html / .txt bodies (or .json files holding Graph message
+# JSON); without it a synthetic corpus of Outlook/Gmail-style replies is generated.
+import argparse, glob, json, os, random, statistics, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bs4 import BeautifulSoup
+from src import mail_clean
+
+ASKS = [
+    "Could you prepare the Q3 budget review slides by Friday 5pm? It should take about 2 hours.",
+    "Please send me the signed contract before 2026-02-10, it's a 30 min job.",
+    "Can you review the onboarding doc by tomorrow? Should be 1h.",
+    "We need the vendor comparison ready for Monday's meeting (around 3h of work).",
+    "No action needed, just keeping you in the loop.",
+]
+STYLE = "<style>" + " ".join(f".c{i}{{font-family:Calibri;margin:{i}px}}" for i in range(80)) + "</style>"
+SIGNATURE = ("<div>Best regards,</div><div><b>Sami Ben Ali</b><br>Senior Project Manager | ACME Corp<br>"
+             "Tel: +216 71 000 000<br><a href='https://acme.example'>acme.example</a></div>"
+             "<p style='font-size:8pt;color:gray'>CONFIDENTIALITY NOTICE: This e-mail and any attachments are "
+             "confidential and intended solely for the addressee. " + "If you are not the intended recipient, "
+             "please delete it. " * 6 + "</p>")
+
+def _quoted(rnd, depth):
+    if depth == 0:
+        return ""
+    body = " ".join(rnd.choice(ASKS) for _ in range(rnd.randint(2, 6)))
+    if rnd.random() < 0.5:  # Outlook
+        return ("<div id='appendonsend'></div><hr style='display:inline-block;width:98%'>"
+                "<div id='divRplyFwdMsg'><b>From:</b> Someone &lt;someone@example.com&gt;<br><b>Sent:</b> Monday, "
+                "January 5, 2026 9:14 AM<br><b>To:</b> Me<br><b>Subject:</b> RE: Project</div>"
+                f"<div>{body}</div>{SIGNATURE}{_quoted(rnd, depth - 1)}")
+    return ("<div class='gmail_quote'><div class='gmail_attr'>On Mon, Jan 5, 2026 at 9:14 AM Someone "
+            f"&lt;someone@example.com&gt; wrote:<br></div><blockquote class='gmail_quote'>{body}"
+            f"{_quoted(rnd, depth - 1)}</blockquote></div>")
+
+def synthetic_corpus(n, seed=0):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        ask = rnd.choice(ASKS)
+        html = (f"<html><head><meta charset='utf-8'>{STYLE}</head><body><div class='WordSection1'>"
+                f"<p class='MsoNormal'>Hi,&nbsp;</p><p class='MsoNormal'>{ask}</p>"
+                f"<p class='MsoNormal'>&nbsp;</p>{SIGNATURE}{_quoted(rnd, rnd.randint(0, 6))}</div></body></html>")
+        out.append(("html", html))
+    return out
+
+def load_corpus(path):
+    out = []
+    for f in sorted(glob.glob(os.path.join(path, "*"))):
+        with open(f, "r", encoding="utf-8", errors="replace") as fh:
+            raw = fh.read()
+        if f.endswith(".json"):
+            body = (json.loads(raw).get("body") or {})
+            out.append((body.get("contentType", "text").lower(), body.get("content", "")))
+        else:
+            out.append(("html" if f.endswith((".html", ".htm")) else "text", raw))
+    return out
+
+def legacy_clean(ctype, content):
+    """What _clean_body did before mail_clean."""
+    return BeautifulSoup(content, "html.parser").get_text() if ctype == "html" else content
+
+def run(name, fn, corpus):
+    times, sizes = [], []
+    for ctype, content in corpus:
+        t0 = time.perf_counter()
+        text = fn(ctype, content)
+        times.append((time.perf_counter() - t0) * 1000)
+        sizes.append(len(text))
+    times.sort()
+    return {
+        "cleaner": name,
+        "ms_mean": round(statistics.mean(times), 3),
+        "ms_p95": round(times[int(0.95 * (len(times) - 1))], 3),
+        "out_chars_mean": round(statistics.mean(sizes), 1),
+        "approx_tokens_mean": round(statistics.mean(sizes) / 4, 1),
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="directory of email bodies (default: synthetic)")
+    ap.add_argument("--count", type=int, default=500, help="synthetic corpus size")
+    ap.add_argument("--max-chars", type=int, default=mail_clean.CLEAN_MAX_CHARS)
+    ap.add_argument("--json", help="write results here as JSON")
+    args = ap.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    in_chars = statistics.mean(len(c) for _, c in corpus)
+    print(f"{len(corpus)} emails, {in_chars:.0f} chars of body on average")
+
+    rows = [run("bs4 get_text (old)", legacy_clean, corpus),
+            run("mail_clean stdlib", lambda t, c: mail_clean.clean_email_body(c, t, args.max_chars, "stdlib"), corpus)]
+    if mail_clean._lxml_html is not None:
+        rows.append(run("mail_clean lxml", lambda t, c: mail_clean.clean_email_body(c, t, args.max_chars, "lxml"), corpus))
+    for r in rows:
+        r["input_chars_mean"] = round(in_chars, 1)
+        print(f"{r['cleaner']:<20} | {r['ms_mean']:>7} ms mean, {r['ms_p95']:>7} ms p95 | "
+              f"{r['out_chars_mean']:>8} chars (~{r['approx_tokens_mean']} tokens) to the LLM")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# bench/bench_e2e.py
+# End-to-end benchmark against local fake servers (bench/fake_servers.py): no Microsoft
+# or Google account needed. Latency and error rates are injected on the fake side.
+# - cycle/<mode>: one get_emails_with_tasks over a synthetic mailbox (serial, pipeline,
+#   pipeline with batched LLM calls) → emails/s, per-stage p50/p95/p99, RPCs per email
+# - scheduler: find_slot (mirror and plain Graph), _try_make_room and process_task
+#   at scale on a dense synthetic calendar
+# Every run also reports peak memory. --json writes everything machine-readable;
+# --baseline compares against an earlier --json and exits 1 on regressions.
+#
+#   python bench/bench_e2e.py [--emails 200] [--events 150] [--json e2e.json] [--baseline old.json]
+import argparse, contextlib, gc, io, json, math, os, platform, random, resource, subprocess, sys, tempfile, time, tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from bench.fake_servers import FakeGraph, fake_gemini, start_server, TZ
+from clients.mcp_client import MCPClient
+from src import email_mcp, event_store, scheduler_mcp
+from src.calendar_mirror import CalendarMirror
+from src.task_parser import ExtractedTask
+from src.triage import Triage
+
+MODES = ("serial", "pipeline", "batch")
+
+# ---------- measurement ----------
+class Recorder:
+    """Per-stage durations (ms) and client-side RPC counts, filled by the patched functions."""
+    def __init__(self):
+        self.ms = defaultdict(list)
+        self.rpc = Counter()
+
+    def wrap(self, name, fn):
+        def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.ms[name].append((time.perf_counter() - t0) * 1000)
+        return timed
+
+    def summary(self):
+        return {name: stats(v) for name, v in sorted(self.ms.items())}
+
+def stats(values):
+    v = sorted(values)
+    pick = lambda q: round(v[max(0, math.ceil(q * len(v)) - 1)], 3)
+    return {"count": len(v), "mean": round(sum(v) / len(v), 3), "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+@contextlib.contextmanager
+def instrumented(rec: Recorder):
+    """Time the agent's stages and count/time RPCs for the duration of the block."""
+    patches = [
+        (email_mcp, "fetch_new_messages", rec.wrap("fetch list", email_mcp.fetch_new_messages)),
+        (email_mcp, "_clean_body", rec.wrap("clean", email_mcp._clean_body)),
+        (email_mcp, "extract_task", rec.wrap("extract", email_mcp.extract_task)),
+        (email_mcp, "extract_tasks", rec.wrap("extract batch", email_mcp.extract_tasks)),
+        (email_mcp, "process_task", rec.wrap("schedule", email_mcp.process_task)),
+        (Triage, "check", rec.wrap("triage", Triage.check)),
+    ]
+    call, call_batch, stream = MCPClient.call, MCPClient.call_batch, MCPClient.stream
+
+    def counted_call(self, method, params=None):
+        rec.rpc[method] += 1
+        return rec.wrap(f"rpc {method}", call)(self, method, params)
+
+    def counted_stream(self, method, params=None):
+        rec.rpc[method] += 1
+        return stream(self, method, params)
+
+    def counted_batch(self, calls, return_exceptions=False):
+        calls = list(calls)
+        for method, _ in calls:
+            rec.rpc[method] += 1
+        return rec.wrap("rpc batch", call_batch)(self, calls, return_exceptions)
+
+    patches += [(MCPClient, "call", counted_call), (MCPClient, "call_batch", counted_batch),
+                (MCPClient, "stream", counted_stream)]
+    saved = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    for obj, name, fn in patches:
+        setattr(obj, name, fn)
+    try:
+        yield rec
+    finally:
+        for obj, name, fn in saved:
+            setattr(obj, name, fn)
+
+@contextlib.contextmanager
+def fresh_state(verbose):
+    """Empty working directory for the agent's stores; agent output silenced unless verbose."""
+    cwd = os.getcwd()
+    work = tempfile.mkdtemp(prefix="bench_e2e_")
+    os.chdir(work)
+    event_store.close_all()
+    email_mcp._mirrors.clear()
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with out:
+            yield work
+    finally:
+        event_store.close_all()
+        os.chdir(cwd)
+
+@contextlib.contextmanager
+def memory(row, trace):
+    gc.collect()
+    if trace:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if trace:
+            row["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+            tracemalloc.stop()
+        # ru_maxrss is KiB on Linux, bytes on macOS; it only ever grows over the process
+        scale = 2**20 if sys.platform == "darwin" else 2**10
+        row["rss_peak_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+def servers(args, seed, emails=0):
+    graph = FakeGraph(args.graph_latency_ms, args.graph_error_rate, seed)
+    graph.add_events(args.events, args.agent_share)
+    graph.add_emails(emails)
+    gemini, llm_calls = fake_gemini(args.llm_latency_ms, args.llm_error_rate, seed)
+    return graph, llm_calls, start_server(graph.handle, name="MCP-FakeGraph"), start_server(gemini, name="MCP-FakeGemini")
+
+# ---------- scenarios ----------
+def run_cycle(mode, args):
+    graph, llm_calls, graph_port, llm_port = servers(args, args.seed, args.emails)
+    events_before = len(graph.events)
+    row = {"name": f"cycle/{mode}", "emails": args.emails}
+    rec = Recorder()
+    saved_batch = email_mcp.EXTRACT_BATCH
+    email_mcp.EXTRACT_BATCH = args.batch if mode == "batch" else 1
+    try:
+        with fresh_state(args.verbose), instrumented(rec), memory(row, args.trace_memory):
+            t0 = time.perf_counter()
+            handled = email_mcp.get_emails_with_tasks("127.0.0.1", graph_port, "127.0.0.1", llm_port,
+                                                      pipeline=(mode != "serial"))
+            wall = time.perf_counter() - t0
+    finally:
+        email_mcp.EXTRACT_BATCH = saved_batch
+    rpcs = sum(graph.calls.values()) + sum(llm_calls.values())
+    row.update({
+        "handled": handled,
+        "wall_s": round(wall, 3),
+        "emails_per_s": round(args.emails / wall, 2),
+        "events_created": len(graph.events) - events_before,
+        "rpc_per_email": round(rpcs / max(1, args.emails), 3),
+        "llm_rpcs": sum(llm_calls.values()),
+        "rpc": dict(sorted((graph.calls + llm_calls).items())),
+        "stages": rec.summary(),
+    })
+    return row
+
+def run_scheduler(args):
+    graph, _, graph_port, _ = servers(args, args.seed + 1)
+    rnd = random.Random(args.seed)
+    row = {"name": "scheduler", "events": len(graph.events), "queries": args.queries}
+    rec = Recorder()
+    made_room = 0
+    with fresh_state(args.verbose), instrumented(rec), memory(row, args.trace_memory):
+        client = MCPClient(port=graph_port)
+        mirror = CalendarMirror(client, store=event_store.default_store())
+        rec.wrap("mirror load", mirror.load)()
+        now = datetime.now(TZ)
+
+        def due():
+            return (now + timedelta(days=rnd.randint(1, 25))).replace(hour=rnd.randint(10, 18), minute=0, second=0, microsecond=0)
+
+        find_mirror = rec.wrap("find_slot (mirror)", scheduler_mcp.find_slot)
+        find_graph = rec.wrap("find_slot (graph)", scheduler_mcp.find_slot)
+        make_room = rec.wrap("make_room", scheduler_mcp._try_make_room)
+        process = rec.wrap("process_task", scheduler_mcp.process_task)
+        for _ in range(args.queries):
+            find_mirror(mirror, due(), rnd.choice([30, 60, 120, 180]))
+        for _ in range(max(1, args.queries // 4)):
+            find_graph(client, due(), rnd.choice([30, 60, 120, 180]))
+        for _ in range(max(1, args.queries // 4)):
+            start = due().replace(hour=rnd.randint(9, 16))
+            made_room += bool(make_room(mirror, start, start + timedelta(minutes=rnd.choice([30, 60, 90]))))
+        for i in range(args.queries):
+            d = due()
+            has_time = rnd.random() < 0.3
+            process(mirror, ExtractedTask(f"Bench task {i}", d, rnd.choice([30, 60, 120]), has_time))
+    row.update({
+        "make_room_success": round(made_room / max(1, args.queries // 4), 3),
+        "events_after": len(graph.events),
+        "rpc": dict(sorted(graph.calls.items())),
+        "stages": rec.summary(),
+    })
+    return row
+
+# ---------- output ----------
+def show(row):
+    head = f"== {row['name']}"
+    if "emails_per_s" in row:
+        head += (f": {row['emails']} emails in {row['wall_s']} s = {row['emails_per_s']} emails/s, "
+                 f"{row['rpc_per_email']} RPCs/email ({row['llm_rpcs']} to the LLM), {row['events_created']} events created")
+    else:
+        head += f": {row['events']} events, make-room success {row['make_room_success']:.0%}"
+    mem = f"peak RSS {row['rss_peak_mb']} MB" + (f", Python peak {row['py_peak_mb']} MB" if "py_peak_mb" in row else "")
+    print(f"{head} ({mem})")
+    for name, s in row["stages"].items():
+        print(f"   {name:<28} n={s['count']:<5} p50 {s['p50']:>9} ms | p95 {s['p95']:>9} ms | p99 {s['p99']:>9} ms")
+    print(f"   RPCs: {', '.join(f'{m}={n}' for m, n in row['rpc'].items())}")
+
+def compare(runs, baseline, tolerance):
+    """Regressions beyond tolerance: emails/s down, RPCs/email or stage p95 up."""
+    old = {r["name"]: r for r in baseline.get("runs", [])}
+    found = []
+    for r in runs:
+        b = old.get(r["name"])
+        if not b:
+            continue
+        if "emails_per_s" in b and r["emails_per_s"] < b["emails_per_s"] * (1 - tolerance):
+            found.append(f"{r['name']}: emails/s {b['emails_per_s']} → {r['emails_per_s']}")
+        if "rpc_per_email" in b and r["rpc_per_email"] > b["rpc_per_email"] * (1 + tolerance):
+            found.append(f"{r['name']}: RPCs/email {b['rpc_per_email']} → {r['rpc_per_email']}")
+        for stage, s in r["stages"].items():
+            bs = b.get("stages", {}).get(stage)
+            # sub-millisecond stages are noise-dominated
+            if bs and s["p95"] > max(bs["p95"] * (1 + tolerance), bs["p95"] + 1):
+                found.append(f"{r['name']}: {stage} p95 {bs['p95']} → {s['p95']} ms")
+    return found
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--emails", type=int, default=200, help="synthetic mailbox size per cycle")
+    ap.add_argument("--events", type=int, default=150, help="synthetic calendar size (next 30 days)")
+    ap.add_argument("--agent-share", type=float, default=0.3, help="share of calendar events the agent may move")
+    ap.add_argument("--queries", type=int, default=200, help="scheduler calls per operation")
+    ap.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    ap.add_argument("--batch", type=int, default=4, help="AGENT_EXTRACT_BATCH for the batch mode")
+    ap.add_argument("--graph-latency-ms", type=float, default=20)
+    ap.add_argument("--llm-latency-ms", type=float, default=300)
+    ap.add_argument("--graph-error-rate", type=float, default=0.0)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--skip-scheduler", action="store_true")
+    ap.add_argument("--trace-memory", action="store_true", help="also report Python heap peak (tracemalloc; slower)")
+    ap.add_argument("--verbose", action="store_true", help="show the agent's own output")
+    ap.add_argument("--json", help="write results here as JSON")
+    ap.add_argument("--baseline", help="earlier --json output to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed relative slowdown before flagging")
+    args = ap.parse_args()
+
+    runs = [run_cycle(mode, args) for mode in args.modes]
+    if not args.skip_scheduler:
+        runs.append(run_scheduler(args))
+    for r in runs:
+        show(r)
+
+    result = {
+        "meta": {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+                 "timestamp": datetime.now().isoformat(timespec="seconds"), "args": vars(args)},
+        "runs": runs,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(runs, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No regressions beyond {args.tolerance:.0%} vs. {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# bench/bench_planner.py
+# Make-room on synthetic calendars: the old greedy depth-2 _try_make_room (replayed
+# in memory, counting the calendar RPCs it would have made) vs. the planner.
+# "freed" = the wanted window really is free afterwards and no deadline was broken.
+#
+#   python bench/bench_planner.py [--agent 20 100 400] [--fixed 100] [--requests 200] [--json out.json]
+import argparse, json, os, random, statistics, sys, time
+from datetime import datetime, timedelta, time as dtime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.availability import AvailabilityIndex
+from src.planner import plan_make_room
+
+TZ = ZoneInfo("Africa/Tunis")
+WS, WE = dtime(9, 0), dtime(18, 0)
+
+def synthetic(n_fixed, n_agent, now, days=28, seed=0):
+    """Fixed meetings plus our own events, each placed somewhere before its deadline."""
+    rnd = random.Random(seed)
+    def slot():
+        day = now.date() + timedelta(days=rnd.randrange(1, days))
+        start = datetime.combine(day, WS, tzinfo=TZ) + timedelta(minutes=30 * rnd.randrange(16))
+        return start, start + timedelta(minutes=rnd.choice((30, 60, 90)))
+    fixed = [slot() for _ in range(n_fixed)]
+    index = AvailabilityIndex(fixed)
+    agent = []
+    for _ in range(50 * n_agent):  # stop early if the calendar is full
+        if len(agent) == n_agent:
+            break
+        s, e = slot()
+        if not index.is_free(s, e):
+            continue
+        index.add(s, e)
+        deadline = e + timedelta(hours=rnd.choice((1, 4, 24, 72, 240)))
+        agent.append({"id": f"a{len(agent)}", "subject": f"task {len(agent)}", "start": s, "end": e,
+                      "deadline": deadline, "duration_min": int((e - s).total_seconds() // 60)})
+    return fixed, agent
+
+def legacy_make_room(fixed, agent, want_start, want_end, now, depth=2, rpc=None):
+    """The pre-planner algorithm: move one overlapping event at a time, recursing up to depth 2."""
+    rpc = rpc if rpc is not None else [0]
+
+    def find(deadline, dur, exclude):
+        rpc[0] += 1  # calendar.list
+        index = AvailabilityIndex(fixed + [(m["start"], m["end"]) for m in agent] + [exclude])
+        return index.earliest_slot(now, deadline, dur, WS, WE, 30)
+
+    def attempt(ws, we, depth):
+        rpc[0] += 1  # calendar.list
+        cands = [m for m in agent if m["start"] < we and m["end"] > ws and m["start"] >= now]
+        rpc[0] += len([m for m in agent if m["start"] < we and m["end"] > ws])  # calendar.get each
+        cands.sort(key=lambda c: (c["deadline"] - c["end"]).total_seconds())
+        for c in cands:
+            slot = find(c["deadline"], c["duration_min"], (ws, we))
+            if slot:
+                c["start"], c["end"] = slot
+                rpc[0] += 1  # calendar.update
+                return True
+        if depth > 0:
+            for c in cands:
+                if not find(c["deadline"], c["duration_min"], (ws, we)):
+                    if attempt(c["start"], c["end"], depth - 1):
+                        slot = find(c["deadline"], c["duration_min"], (ws, we))
+                        if slot:
+                            c["start"], c["end"] = slot
+                            rpc[0] += 1
+                            return True
+        return False
+
+    ok = attempt(want_start, want_end, depth)
+    return ok, rpc[0]
+
+def window_free(fixed, agent, ws, we):
+    return AvailabilityIndex(fixed + [(m["start"], m["end"]) for m in agent]).is_free(ws, we)
+
+def deadlines_ok(agent):
+    return all(m["end"] <= m["deadline"] for m in agent)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--agent", type=int, nargs="+", default=[20, 100, 400])
+    ap.add_argument("--fixed", type=int, default=100)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--budget-ms", type=float, default=500)
+    ap.add_argument("--json", help="write results here as JSON")
+    args = ap.parse_args()
+
+    now = datetime(2026, 1, 5, 8, 0, tzinfo=TZ)
+    rows = []
+    for n in args.agent:
+        fixed, agent = synthetic(args.fixed, n, now, seed=n)
+        rnd = random.Random(n)
+        stats = {"legacy_freed": 0, "legacy_claimed": 0, "legacy_ms": [], "legacy_rpcs": [],
+                 "plan_freed": 0, "plan_ms": [], "plan_moves": [], "plan_bad": 0}
+        for _ in range(args.requests):
+            # Ask for a window that overlaps at least one of our events
+            target = rnd.choice(agent)
+            ws = target["start"] - timedelta(minutes=30 * rnd.randrange(2))
+            we = ws + timedelta(minutes=rnd.choice((30, 60, 120)))
+
+            snapshot = [dict(m) for m in agent]
+            t0 = time.perf_counter()
+            ok, rpcs = legacy_make_room(fixed, snapshot, ws, we, now)
+            stats["legacy_ms"].append((time.perf_counter() - t0) * 1000)
+            stats["legacy_rpcs"].append(rpcs)
+            stats["legacy_claimed"] += ok
+            stats["legacy_freed"] += ok and window_free(fixed, snapshot, ws, we) and deadlines_ok(snapshot)
+
+            t0 = time.perf_counter()
+            plan = plan_make_room(fixed, agent, ws, we, now, WS, WE, 30, budget_s=args.budget_ms / 1000)
+            stats["plan_ms"].append((time.perf_counter() - t0) * 1000)
+            if plan["moves"] is not None:
+                after = {m["id"]: dict(m) for m in agent}
+                for mv in plan["moves"]:
+                    after[mv["id"]]["start"], after[mv["id"]]["end"] = mv["to"]
+                after = list(after.values())
+                if window_free(fixed, after, ws, we) and deadlines_ok(after):
+                    stats["plan_freed"] += 1
+                    stats["plan_moves"].append(len(plan["moves"]))
+                else:
+                    stats["plan_bad"] += 1
+
+        q = args.requests
+        p95 = lambda xs: sorted(xs)[int(0.95 * (len(xs) - 1))] if xs else 0
+        rows.append({
+            "agent_events": len(agent), "fixed_events": args.fixed, "requests": q,
+            "legacy_claimed_pct": round(100 * stats["legacy_claimed"] / q, 1),
+            "legacy_freed_pct": round(100 * stats["legacy_freed"] / q, 1),
+            "legacy_rpcs_mean": round(statistics.mean(stats["legacy_rpcs"]), 1),
+            "legacy_ms_p95": round(p95(stats["legacy_ms"]), 3),
+            "planner_freed_pct": round(100 * stats["plan_freed"] / q, 1),
+            "planner_invalid": stats["plan_bad"],
+            "planner_moves_mean": round(statistics.mean(stats["plan_moves"]), 2) if stats["plan_moves"] else 0,
+            "planner_ms_p50": round(statistics.median(stats["plan_ms"]), 3),
+            "planner_ms_p95": round(p95(stats["plan_ms"]), 3),
+        })
+        r = rows[-1]
+        print(f"{len(agent):>5} agent events | legacy: claimed {r['legacy_claimed_pct']}% freed {r['legacy_freed_pct']}% "
+              f"~{r['legacy_rpcs_mean']} RPCs, p95 {r['legacy_ms_p95']} ms | planner: freed {r['planner_freed_pct']}% "
+              f"({r['planner_moves_mean']} moves, p50 {r['planner_ms_p50']} ms, p95 {r['planner_ms_p95']} ms, "
+              f"invalid {r['planner_invalid']})")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench/bench_throttle.py
+# The Graph server's request layer against a throttling Graph stub (bench/graph_stub.py),
+# calling the server's own functions (email.get / email.get_many), with the layer off
+# ("naive": no limiter, no retries, no breaker) and on ("layer"):
+# - burst: worker threads hammer one mailbox harder than the stub's per-mailbox limit
+# - outage: the stub answers 503 for a while; how many calls still reach it, how they fail
+#   and how fast calls succeed again once it's back
+#
+#   python bench/bench_throttle.py [--limit 50] [--workers 8] [--ops 10] [--json out.json]
+import argparse, json, os, sys, threading, time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.graph_stub import GraphStub, serve
+import servers.graph_mcp_server as graph
+
+def configure(base, layer: bool, rate: float):
+    graph.GRAPH_BASE = base
+    graph.GRAPH_RATE = rate if layer else 0
+    graph.GRAPH_CONCURRENCY = 4 if layer else 0
+    graph.GRAPH_RETRIES = 4 if layer else 0
+    graph.BREAKER_FAILURES = 5 if layer else 10**9
+    graph.BREAKER_COOLDOWN = 1.0
+    graph._buckets.clear(); graph._breakers.clear(); graph._mailbox_slots.clear()
+    mgr = graph._token_manager(None)  # skip MSAL: the stub only reads the bearer token
+    mgr._token, mgr._expires_at = {"access_token": "bench"}, time.time() + 3600
+
+def burst(mode, args):
+    stub = GraphStub(args.limit, args.window, concurrency=4, latency_ms=args.latency_ms, messages=400)
+    configure(serve(stub), mode == "layer", args.rate or 0.8 * args.limit / args.window)
+    ids = sorted(stub.messages)
+    outcome = Counter()
+
+    def worker(w):
+        for op in range(args.ops):
+            try:
+                if op % 2:
+                    items = graph.get_messages(ids[(w * 20) % len(ids):][:20])
+                    bad = sum(1 for it in items if "error" in it)
+                    outcome["items ok"] += len(items) - bad
+                    outcome["items failed"] += bad
+                else:
+                    graph.get_message(ids[(w + op) % len(ids)])
+                    outcome["items ok"] += 1
+                outcome["ops ok"] += 1
+            except Exception:
+                outcome["ops failed"] += 1
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(args.workers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - t0
+    return {"scenario": "burst", "mode": mode, "wall_s": round(wall, 2), "ops_ok": outcome["ops ok"],
+            "ops_failed": outcome["ops failed"], "items_failed": outcome["items failed"],
+            "stub_429": stub.status[429], "stub_requests": sum(stub.status.values())}
+
+def outage(mode, args):
+    stub = GraphStub(10**6, 1.0, concurrency=0, latency_ms=args.latency_ms)
+    configure(serve(stub), mode == "layer", 0)
+    stub.outage(args.outage)
+    ids = sorted(stub.messages)
+    outcome, recovered = Counter(), []
+    t0 = time.monotonic()
+
+    def worker(w):
+        n = 0
+        while time.monotonic() - t0 < args.outage + 2:
+            n += 1
+            try:
+                graph.get_message(ids[(w + n) % len(ids)])
+                outcome["ok"] += 1
+                if time.monotonic() - t0 >= args.outage:
+                    recovered.append(time.monotonic() - t0 - args.outage)
+            except graph.GraphUnavailable:
+                outcome["failed fast"] += 1
+            except Exception:
+                outcome["failed at Graph"] += 1
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=worker, args=(w,)) for w in range(4)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return {"scenario": "outage", "mode": mode, "calls_ok": outcome["ok"], "failed_fast": outcome["failed fast"],
+            "failed_at_graph": outcome["failed at Graph"], "stub_503": stub.status[503],
+            "first_ok_after_s": round(min(recovered), 2) if recovered else None}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit", type=int, default=50, help="stub: requests per window per mailbox")
+    ap.add_argument("--window", type=float, default=1.0, help="stub: seconds")
+    ap.add_argument("--latency-ms", type=float, default=5)
+    ap.add_argument("--rate", type=float, default=0, help="layer's requests/s (default 80%% of the stub's limit)")
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--ops", type=int, default=10, help="operations per worker (alternating get / get_many of 20)")
+    ap.add_argument("--outage", type=float, default=3, help="seconds of 503s in the outage scenario")
+    ap.add_argument("--json", help="write results here as JSON")
+    args = ap.parse_args()
+
+    rows = [burst(m, args) for m in ("naive", "layer")] + [outage(m, args) for m in ("naive", "layer")]
+    for r in rows:
+        if r["scenario"] == "burst":
+            print(f"burst  {r['mode']:<6} | {r['wall_s']:>6} s | ops ok {r['ops_ok']:>4}, failed {r['ops_failed']:>4} | "
+                  f"items failed {r['items_failed']:>5} | stub 429s {r['stub_429']:>5} of {r['stub_requests']}")
+        else:
+            print(f"outage {r['mode']:<6} | ok {r['calls_ok']:>4} | failed fast {r['failed_fast']:>4}, at Graph "
+                  f"{r['failed_at_graph']:>4} | stub 503s {r['stub_503']:>4} | first ok {r['first_ok_after_s']} s after it ended")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# bench/bench_wire.py
+# Large MCP results over the wire: one email.list-sized reply of N messages with HTML
+# bodies, fetched through MCPClient against an in-process MCP server, per wire mode:
+# - lines: one JSON line per reply (what old clients/servers speak)
+# - frames: length-prefixed, read into one preallocated buffer
+# - frames+zlib: frames compressed above MCP_COMPRESS_MIN
+# - streamed: frames+zlib, result sent page by page via MCPClient.stream
+# Reports latency per call, bytes on the wire and the Python peak while a call runs
+# (client and server share the process, so the peak covers both ends).
+#
+#   python bench/bench_wire.py [--messages 1000] [--body-kb 8] [--calls 20] [--json out.json]
+import argparse, json, os, statistics, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.fake_servers import start_server
+from clients.mcp_client import MCPClient
+from src import wire
+
+MODES = {  # name: (framing, compress, streamed)
+    "lines": (False, "", False),
+    "frames": (True, "", False),
+    "frames+zlib": (True, "zlib", False),
+    "streamed": (True, "zlib", True),
+}
+
+def mailbox(n, body_kb):
+    para = "<p>Hi team, please find the notes from today's sync below. Action items are at the end.</p>\n"
+    body = "<html><body>" + para * max(1, body_kb * 1024 // len(para)) + "</body></html>"
+    return [{"id": f"msg-{i:06d}", "subject": f"Status update {i}", "from": {"emailAddress": {"address": f"user{i % 50}@contoso.com"}},
+             "receivedDateTime": "2026-01-05T09:00:00Z", "body": {"contentType": "html", "content": body}} for i in range(n)]
+
+def handler(messages, page_size):
+    def handle(req):
+        p = req.get("params") or {}
+        top = p.get("top", len(messages))
+        if p.get("stream"):
+            def pages():
+                for i in range(0, top, page_size):
+                    yield messages[i:min(top, i + page_size)]
+                return {}
+            return pages()
+        return messages[:top]
+    return handle
+
+def wire_bytes(messages, framing, compress, page_size, streamed):
+    def size(result):
+        payload = wire.dumps({"jsonrpc": "2.0", "id": 1, "result": result})
+        return len(wire.encode(payload, bool(compress))) if framing else len(payload) + 1
+    if not streamed:
+        return size(messages)
+    return sum(size(messages[i:i + page_size]) for i in range(0, len(messages), page_size))
+
+def run(mode, messages, args):
+    framing, compress, streamed = MODES[mode]
+    wire.FRAMING, wire.COMPRESS = framing, compress  # read by both ends when a connection negotiates
+    port = start_server(handler(messages, args.page_size), name=f"MCP-{mode}")
+    client = MCPClient(port=port, timeout=120)
+    fetch = (lambda: sum(len(p) for p in client.stream("email.list", {"top": len(messages)}))) if streamed \
+        else (lambda: len(client.call("email.list", {"top": len(messages)})))
+    assert fetch() == len(messages)  # warm-up: connect + negotiate
+    ms = []
+    for _ in range(args.calls):
+        t0 = time.perf_counter()
+        fetch()
+        ms.append((time.perf_counter() - t0) * 1000)
+    tracemalloc.start()
+    fetch()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"mode": mode, "p50_ms": round(statistics.median(ms), 2), "max_ms": round(max(ms), 2),
+            "wire_mb": round(wire_bytes(messages, framing, compress, args.page_size, streamed) / 2**20, 2),
+            "py_peak_mb": round(peak / 2**20, 1)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=1000)
+    ap.add_argument("--body-kb", type=int, default=8, help="HTML body size per message")
+    ap.add_argument("--page-size", type=int, default=50, help="messages per streamed page")
+    ap.add_argument("--calls", type=int, default=20)
+    ap.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    ap.add_argument("--json", help="write results here as JSON")
+    args = ap.parse_args()
+
+    messages = mailbox(args.messages, args.body_kb)
+    saved = wire.FRAMING, wire.COMPRESS
+    try:
+        rows = [run(mode, messages, args) for mode in args.modes]
+    finally:
+        wire.FRAMING, wire.COMPRESS = saved
+    print(f"{args.messages} messages x {args.body_kb} KB bodies, {args.calls} calls per mode")
+    for r in rows:
+        print(f"{r['mode']:<12} | p50 {r['p50_ms']:>9} ms | max {r['max_ms']:>9} ms | "
+              f"wire {r['wire_mb']:>7} MB | py peak {r['py_peak_mb']:>7} MB")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
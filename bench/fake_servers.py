@@ -0,0 +1,378 @@
+# bench/fake_servers.py
+# Local stand-ins for the Graph and Gemini MCP servers, speaking the same JSON-RPC
+# protocol (servers/mcp_core.py), for benchmarks and offline runs.
+# - FakeGraph: synthetic mailbox + calendar behind email.* / calendar.* (delta links,
+#   $batch-sized get_many/apply_changes), with injected latency and error rate
+# - FakeModel: plugged into the real Gemini server (set_model_factory), so llm.* goes
+#   through its cache, coalescing and upstream limiter; answers from the email text
+#
+# Standalone, on the default ports, for running main_mcp.py without accounts:
+#   python bench/fake_servers.py [--emails 50] [--events 200] [--graph-latency-ms 20] [--llm-latency-ms 400]
+import argparse, asyncio, json, os, random, re, socket, sys, threading, time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from servers.mcp_core import MCPServer
+from src.task_parser import parse_local
+
+TZ = ZoneInfo(os.getenv("AGENT_TZ", "Africa/Tunis"))
+TAG = "[AGENT]"
+GRAPH_BATCH_LIMIT = 20  # sub-requests per Graph $batch call, as in graph_mcp_server
+
+THINGS = ["Q3 budget slides", "vendor comparison", "onboarding doc", "release notes", "hiring plan",
+          "security review", "client proposal", "roadmap draft", "board memo", "test report"]
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds")
+
+def _parse(iso: str) -> datetime:
+    dt = datetime.fromisoformat(iso.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+def _span(ev):
+    return _parse(ev["start"]["dateTime"]), _parse(ev["end"]["dateTime"])
+
+# ---------- synthetic data ----------
+def synthetic_email(rnd, i, now, received=None):
+    """
+    One Graph message; the mix is roughly what an inbox sees (a quarter is bulk). "loose"
+    requests pass triage but are too vague for the local parser, so they go to the LLM.
+    """
+    day = (now + timedelta(days=rnd.randint(1, 20))).date()
+    thing = rnd.choice(THINGS)
+    kind = rnd.choices(["deadline", "fixed", "vague", "loose", "newsletter", "fyi"], [25, 15, 10, 15, 25, 10])[0]
+    sender, headers = "colleague@acme.example", []
+    if kind == "deadline":
+        subject, text = f"{thing}", f"Hi, could you prepare the {thing} by {day.isoformat()}? It should take about {rnd.choice([1, 2, 3])} hours."
+    elif kind == "fixed":
+        subject, text = f"Meeting: {thing}", f"Please join the {thing} meeting on {day.isoformat()} at {rnd.randint(9, 16)}:00, it takes 1h."
+    elif kind == "vague":
+        subject, text = f"Re: {thing}", f"We need the {thing} soon-ish, can you help when you get a chance?"
+    elif kind == "loose":
+        first, second = rnd.sample(["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], 2)
+        subject, text = f"Re: {thing}", f"Can you look into the {thing}? Ideally by {first}, though {second} works too."
+    elif kind == "newsletter":
+        sender = "newsletter@news.example"
+        headers = [{"name": "List-Unsubscribe", "value": "<mailto:unsub@news.example>"}]
+        subject, text = "Weekly digest", f"Top stories this week about {thing}. Unsubscribe or manage preferences."
+    else:
+        subject, text = f"FYI {thing}", "No action needed, just keeping you in the loop."
+    html = (f"<html><head><style>p{{margin:0}}</style></head><body><p>{text}</p>"
+            f"<div>Best regards,<br>Sami</div><div class='gmail_quote'>On Mon someone wrote:"
+            f"<blockquote>Earlier thread about the {thing}.</blockquote></div></body></html>")
+    return {
+        "id": f"msg{i}",
+        "subject": subject,
+        "from": {"emailAddress": {"address": sender}},
+        "receivedDateTime": _utc(received or now) + "Z",
+        "isRead": False,
+        "internetMessageHeaders": headers,
+        "body": {"contentType": "html", "content": html},
+    }
+
+def synthetic_calendar(rnd, n, now, agent_share=0.3, days=30):
+    """n non-overlapping events on the 30-minute grid inside 09:00-18:00, a share of them ours."""
+    taken, out, attempts = set(), [], 0
+    base = now.astimezone(TZ).replace(hour=9, minute=0, second=0, microsecond=0)
+    while len(out) < n and attempts < 50 * n:
+        attempts += 1
+        start = base + timedelta(days=rnd.randint(0, days), minutes=30 * rnd.randint(0, 15))
+        slots = rnd.choice([1, 2, 3])
+        cells = {start + timedelta(minutes=30 * k) for k in range(slots)}
+        if cells & taken or (start + timedelta(minutes=30 * slots)).hour > 18:
+            continue
+        taken |= cells
+        end = start + timedelta(minutes=30 * slots)
+        ev = {"subject": f"Busy {len(out)}", "start": start, "end": end, "body": None}
+        if rnd.random() < agent_share:
+            deadline = end + timedelta(days=rnd.randint(1, 5))
+            ev["subject"] = f"{rnd.choice(THINGS)} ({len(out)})"
+            ev["body"] = {"contentType": "text",
+                          "content": f"{TAG} deadline={deadline.isoformat()} duration_min={30 * slots}"}
+        out.append(ev)
+    return out
+
+# ---------- Graph ----------
+class FakeGraph:
+    """In-memory mailbox + calendar behind the graph_mcp_server methods."""
+    def __init__(self, latency_ms: float=20, error_rate: float=0.0, seed: int=0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.calls = Counter()
+        self.messages = []       # newest last; delta links are positions in this list
+        self._by_id = {}         # message id -> message
+        self.events = {}         # id -> event json
+        self._changes = []       # (version, id) of every calendar write, for delta links
+        self._version = 0
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    # --- setup ---
+    def add_emails(self, n, now=None):
+        now = now or datetime.now(timezone.utc)
+        start = len(self.messages)
+        for i in range(n):
+            m = synthetic_email(self.rnd, start + i, now, now - timedelta(seconds=n - i))
+            self.messages.append(m)
+            self._by_id[m["id"]] = m
+
+    def add_events(self, n, agent_share=0.3, now=None):
+        for ev in synthetic_calendar(self.rnd, n, now or datetime.now(timezone.utc), agent_share):
+            self._create(ev["subject"], ev["start"].isoformat(), ev["end"].isoformat(), ev["body"])
+
+    # --- plumbing ---
+    def _sleep(self, calls=1):
+        if self.latency_ms:
+            time.sleep(calls * self.latency_ms * self.rnd.uniform(0.5, 1.5) / 1000)
+
+    def _fail(self):
+        return self.error_rate and self.rnd.random() < self.error_rate
+
+    def handle(self, req: dict):
+        method = req.get("method")
+        params = req.get("params") or {}
+        self.calls[method] += 1
+        many = len(params.get("ids") or params.get("changes") or [])
+        self._sleep(max(1, -(-many // GRAPH_BATCH_LIMIT)))
+        if method not in ("email.get_many", "calendar.get_many", "calendar.apply_changes") and self._fail():
+            raise RuntimeError("Injected Graph error: 503 Service Unavailable")
+        with self._lock:
+            result = self._dispatch(method, params)
+        if params.get("stream") and method in ("email.list", "email.delta", "calendar.list"):
+            return self._paged(method, result, params.get("page_size", 100 if method == "calendar.list" else 50))
+        return result
+
+    def _paged(self, method, result, size):
+        """Like the real server with stream=true: one Graph page at a time, one latency each."""
+        items = result["messages"] if method == "email.delta" else result
+        for i in range(0, len(items), size):
+            if i:
+                self._sleep(1)
+            page = items[i:i + size]
+            yield {"messages": page, "removed": []} if method == "email.delta" else page
+        return {"deltaLink": result["deltaLink"]} if method == "email.delta" else {}
+
+    def _dispatch(self, method, p):
+        if method == "email.list":
+            return [self._stub(m) for m in self.messages[::-1][:p.get("top", 10)]]
+        if method == "email.get":
+            return self._message(p["id"])
+        if method == "email.get_many":
+            return [self._item(i, self._message) for i in p["ids"]]
+        if method == "email.delta":
+            pos = int(p["deltaLink"].rsplit(":", 1)[1]) if p.get("deltaLink") else 0
+            msgs = self.messages[pos:]
+            if p.get("since") and not p.get("deltaLink"):
+                msgs = [m for m in msgs if m["receivedDateTime"] >= p["since"]]
+            return {"messages": [self._stub(m) for m in msgs], "removed": [],
+                    "deltaLink": f"fake-mail:{len(self.messages)}"}
+        if method == "calendar.list":
+            start, end = _parse(p["start"]), _parse(p["end"])
+            return [self._select(ev, p.get("select")) for ev in self.events.values() if self._overlaps(ev, start, end)]
+        if method == "calendar.get":
+            return self._event(p["id"])
+        if method == "calendar.get_many":
+            return [self._item(i, self._event) for i in p["ids"]]
+        if method == "calendar.delta":
+            return self._delta(p)
+        if method == "calendar.create":
+            return self._create(p["subject"], p["start"], p["end"], p.get("body"))
+        if method == "calendar.update":
+            return self._update(p["id"], p["start"], p["end"])
+        if method == "calendar.delete":
+            return self._delete(p["id"])
+        if method == "calendar.apply_changes":
+            return [self._item(ch.get("id"), lambda _, ch=ch: self._apply(ch)) for ch in p["changes"]]
+        raise RuntimeError(f"Unknown method: {method}")
+
+    def _item(self, key, fn):
+        """One $batch sub-request: failures come back in place, like graph_mcp_server._batch_item."""
+        if self._fail():
+            return {"id": key, "error": {"status": 503, "message": "Injected Graph error"}}
+        try:
+            return fn(key)
+        except KeyError:
+            return {"id": key, "error": {"status": 404, "message": "Not found"}}
+
+    # --- mail ---
+    @staticmethod
+    def _stub(m):
+        return {k: m[k] for k in ("id", "subject", "from", "receivedDateTime", "isRead")}
+
+    def _message(self, msg_id):
+        return self._by_id[msg_id]
+
+    # --- calendar ---
+    @staticmethod
+    def _overlaps(ev, start, end):
+        s, e = _span(ev)
+        return s < end and e > start
+
+    @staticmethod
+    def _select(ev, select):
+        return {k: v for k, v in ev.items() if k == "id" or k in select} if select else ev
+
+    def _event(self, ev_id):
+        return self.events[ev_id]
+
+    def _touch(self, ev_id):
+        self._version += 1
+        self._changes.append((self._version, ev_id))
+
+    def _create(self, subject, start, end, body=None):
+        self._next_id += 1
+        ev_id = f"evt{self._next_id}"
+        ev = {"id": ev_id, "subject": subject,
+              "start": {"dateTime": _utc(_parse(start)), "timeZone": "UTC"},
+              "end": {"dateTime": _utc(_parse(end)), "timeZone": "UTC"},
+              "body": body or {"contentType": "text", "content": ""}}  # Graph always has one
+        self.events[ev_id] = ev
+        self._touch(ev_id)
+        return ev
+
+    def _update(self, ev_id, start, end):
+        ev = self.events[ev_id]
+        ev["start"] = {"dateTime": _utc(_parse(start)), "timeZone": "UTC"}
+        ev["end"] = {"dateTime": _utc(_parse(end)), "timeZone": "UTC"}
+        self._touch(ev_id)
+        return ev
+
+    def _delete(self, ev_id):
+        del self.events[ev_id]
+        self._touch(ev_id)
+        return {"ok": True}
+
+    def _apply(self, ch):
+        op = ch.get("op")
+        if op == "create":
+            return self._create(ch["subject"], ch["start"], ch["end"], ch.get("body"))
+        if op == "update":
+            return self._update(ch["id"], ch["start"], ch["end"])
+        if op == "delete":
+            return self._delete(ch["id"])
+        raise KeyError(op)
+
+    def _delta(self, p):
+        if p.get("deltaLink"):
+            _, version, start, end = p["deltaLink"].split("|")
+            version, start, end = int(version), _parse(start), _parse(end)
+            changed = {ev_id for v, ev_id in self._changes if v > version}
+            events = [self.events[i] for i in changed if i in self.events and self._overlaps(self.events[i], start, end)]
+            removed = [i for i in changed if i not in self.events]
+        else:
+            start, end = _parse(p["start"]), _parse(p["end"])
+            events = [ev for ev in self.events.values() if self._overlaps(ev, start, end)]
+            removed = []
+        link = f"fake-cal|{self._version}|{start.isoformat()}|{end.isoformat()}"
+        return {"events": events, "removed": removed, "deltaLink": link}
+
+# ---------- Gemini ----------
+class _Reply:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModel:
+    """generate_content() for the Gemini server: latency, errors, and answers read off the email."""
+    def __init__(self, latency_ms: float=400, error_rate: float=0.0, seed: int=0):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        with self._lock:
+            jitter, fail = self.rnd.uniform(0.5, 1.5), self.rnd.random() < self.error_rate
+        time.sleep(self.latency_ms * jitter / 1000)
+        if fail:
+            raise RuntimeError("Injected LLM error: 429 Resource exhausted")
+        if "### EMAIL" in prompt:
+            emails = re.split(r"^### EMAIL (\d+)\n", prompt, flags=re.MULTILINE)[1:]
+            rows = []
+            for idx, text in zip(emails[::2], emails[1::2]):
+                task = self._answer(text)
+                rows.append({"index": int(idx), "none": True} if task is None else
+                            {"index": int(idx), "task": task[0], "deadline": task[1], "duration": task[2]})
+            return _Reply(json.dumps(rows))
+        task = self._answer(prompt.split("EMAIL:", 1)[-1])
+        return _Reply("(NONE)" if task is None else f"({task[0]}, {task[1]}, {task[2]})")
+
+    @staticmethod
+    def _answer(text):
+        text = text.strip()
+        if not text or re.search(r"no action needed|unsubscribe", text, re.IGNORECASE):
+            return None
+        parsed = parse_local(text, TZ)
+        if parsed:
+            return parsed.task.replace(",", ""), parsed.due.strftime("%Y-%m-%d %H:%M"), f"{parsed.duration_min}min"
+        due = (datetime.now(TZ) + timedelta(days=3)).replace(hour=17, minute=0)
+        task = re.sub(r"[^\w ]", "", text.split(".")[0])[:60].strip() or "Follow up"
+        return task, due.strftime("%Y-%m-%d %H:%M"), "1h"
+
+def fake_gemini(latency_ms: float=400, error_rate: float=0.0, seed: int=0):
+    """The real Gemini server's handler, backed by FakeModel. Returns (handler, call counter)."""
+    from servers import gemini_mcp_server as gemini
+    gemini.set_model_factory(lambda name: FakeModel(latency_ms, error_rate, seed))
+    calls = Counter()
+
+    def handle(req):
+        calls[req.get("method")] += 1
+        return gemini.handle_request(req)
+    return handle, calls
+
+# ---------- servers ----------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(handler, port: int=0, name: str="MCP-Fake"):
+    """Serve `handler` over the MCP transport on a background thread. Returns the port."""
+    port = port or free_port()
+    server = MCPServer(handler, "127.0.0.1", port, name)
+    threading.Thread(target=lambda: asyncio.run(server.serve_forever()), name=name, daemon=True).start()
+    for _ in range(100):  # until it accepts connections
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.02)
+    return port
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Graph + Gemini MCP servers")
+    ap.add_argument("--graph-port", type=int, default=int(os.getenv("MCP_GRAPH_PORT", "8765")))
+    ap.add_argument("--gemini-port", type=int, default=int(os.getenv("MCP_GEMINI_PORT", "8766")))
+    ap.add_argument("--emails", type=int, default=50)
+    ap.add_argument("--events", type=int, default=200)
+    ap.add_argument("--agent-share", type=float, default=0.3)
+    ap.add_argument("--graph-latency-ms", type=float, default=20)
+    ap.add_argument("--llm-latency-ms", type=float, default=400)
+    ap.add_argument("--graph-error-rate", type=float, default=0.0)
+    ap.add_argument("--llm-error-rate", type=float, default=0.0)
+    ap.add_argument("--new-mail-every", type=float, default=0, help="seconds between new synthetic emails (0 = none)")
+    args = ap.parse_args()
+
+    graph = FakeGraph(args.graph_latency_ms, args.graph_error_rate)
+    graph.add_emails(args.emails)
+    graph.add_events(args.events, args.agent_share)
+    gemini, _ = fake_gemini(args.llm_latency_ms, args.llm_error_rate)
+    start_server(graph.handle, args.graph_port, "MCP-FakeGraph")
+    start_server(gemini, args.gemini_port, "MCP-FakeGemini")
+    print(f"🧪 Fake Graph on :{args.graph_port} ({len(graph.messages)} emails, {len(graph.events)} events), "
+          f"fake Gemini on :{args.gemini_port}. Ctrl+C to stop.")
+    try:
+        while True:
+            if args.new_mail_every:
+                time.sleep(args.new_mail_every)
+                with graph._lock:
+                    graph.add_emails(1)
+            else:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
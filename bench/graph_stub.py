@@ -0,0 +1,190 @@
+# bench/graph_stub.py
+# A local HTTP stand-in for the bits of Microsoft Graph the Graph MCP server calls, with
+# Graph-style throttling, so the request layer can be exercised without a tenant:
+# - at most `limit` requests per `window` seconds per mailbox (bearer token); beyond that
+#   429 with Retry-After (seconds until the window has room)
+# - at most `concurrency` requests in flight per mailbox, else 429 (MailboxConcurrency)
+# - outage(seconds): every request gets 503 until it's over; error_rate: random 503s
+# - $batch sub-requests count one each and are throttled one by one, like Graph
+# Serves /v1.0/me/messages[/{id}], /v1.0/me/events[/{id}] and /v1.0/$batch.
+#
+#   python bench/graph_stub.py --port 8780 --limit 50 --window 1
+#   MS_GRAPH_BASE=http://127.0.0.1:8780/v1.0 python servers/graph_mcp_server.py
+import argparse, json, math, random, re, threading, time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+class GraphStub:
+    def __init__(self, limit=50, window=1.0, concurrency=4, error_rate=0.0, latency_ms=5, messages=200, seed=0):
+        self.limit = limit
+        self.window = window
+        self.concurrency = concurrency
+        self.error_rate = error_rate
+        self.latency_ms = latency_ms
+        self.rnd = random.Random(seed)
+        self.fail_until = 0.0
+        self.status = Counter()        # status code -> responses (sub-requests included)
+        self.seen = defaultdict(deque)  # mailbox -> recent request times
+        self.inflight = Counter()
+        self.messages = {f"msg-{i:05d}": {"id": f"msg-{i:05d}", "subject": f"Message {i}",
+                                          "body": {"contentType": "text", "content": f"Body {i}"}} for i in range(messages)}
+        self.events = {}
+        self._lock = threading.Lock()
+
+    def outage(self, seconds: float):
+        self.fail_until = time.monotonic() + seconds
+
+    # ---------- throttling ----------
+    def _admit(self, mailbox):
+        """None if the request may run, else (status, Retry-After seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            if now < self.fail_until or (self.error_rate and self.rnd.random() < self.error_rate):
+                return 503, None
+            q = self.seen[mailbox]
+            while q and q[0] <= now - self.window:
+                q.popleft()
+            if len(q) >= self.limit:
+                return 429, max(1, math.ceil(q[0] + self.window - now))
+            q.append(now)
+        return None
+
+    # ---------- resources ----------
+    def _route(self, method, path, query, body):
+        """(status, json body) for one REST call."""
+        m = re.fullmatch(r"/v1\.0/me/messages/([^/]+)", path)
+        if m and method == "GET":
+            msg = self.messages.get(m.group(1))
+            return (200, msg) if msg else (404, {"error": {"code": "ErrorItemNotFound", "message": "Not found"}})
+        if path == "/v1.0/me/messages" and method == "GET":
+            top = int((query.get("$top") or ["10"])[0])
+            skip = int((query.get("$skip") or ["0"])[0])
+            ids = sorted(self.messages)[skip:skip + top]
+            out = {"value": [self.messages[i] for i in ids]}
+            if skip + top < len(self.messages):
+                out["@odata.nextLink"] = f"{self.base}/me/messages?$top={top}&$skip={skip + top}"
+            return 200, out
+        if path == "/v1.0/me/events" and method == "POST":
+            ev = dict(body or {}, id=f"evt-{len(self.events):05d}")
+            self.events[ev["id"]] = ev
+            return 201, ev
+        m = re.fullmatch(r"/v1\.0/me/events/([^/]+)", path)
+        if m and m.group(1) in self.events:
+            if method == "GET":
+                return 200, self.events[m.group(1)]
+            if method == "PATCH":
+                self.events[m.group(1)].update(body or {})
+                return 200, self.events[m.group(1)]
+            if method == "DELETE":
+                del self.events[m.group(1)]
+                return 204, None
+        if m:
+            return 404, {"error": {"code": "ErrorItemNotFound", "message": "Not found"}}
+        return 400, {"error": {"code": "BadRequest", "message": f"Unsupported {method} {path}"}}
+
+    def _throttled(self, status, retry_after):
+        if status == 503:
+            body = {"error": {"code": "ServiceUnavailable", "message": "Service unavailable"}}
+        elif retry_after is None:
+            body = {"error": {"code": "ApplicationThrottled", "message": "Application is over its MailboxConcurrency limit."}}
+        else:
+            body = {"error": {"code": "ApplicationThrottled", "message": "Application is over its MailboxRequests limit."}}
+        return status, body, ({"Retry-After": str(retry_after)} if retry_after is not None else {})
+
+    def handle(self, method, raw_path, mailbox, body):
+        """(status, json body, extra headers) for one HTTP request."""
+        url = urlparse(raw_path)
+        with self._lock:
+            self.inflight[mailbox] += 1
+            busy = self.concurrency and self.inflight[mailbox] > self.concurrency
+        try:
+            if busy:
+                self.status[429] += 1
+                return self._throttled(429, None)
+            if url.path == "/v1.0/$batch" and method == "POST":
+                return self._batch(mailbox, body)
+            denied = self._admit(mailbox)
+            if denied:
+                self.status[denied[0]] += 1
+                return self._throttled(*denied)
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000)
+            status, out = self._route(method, url.path, parse_qs(url.query), body)
+            self.status[status] += 1
+            return status, out, {}
+        finally:
+            with self._lock:
+                self.inflight[mailbox] -= 1
+
+    def _batch(self, mailbox, body):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        responses, failed = [], set()
+        for r in (body or {}).get("requests", []):
+            if any(d in failed for d in r.get("dependsOn") or []):
+                failed.add(r["id"])
+                self.status[424] += 1
+                responses.append({"id": r["id"], "status": 424, "body": {"error": {"code": "FailedDependency"}}})
+                continue
+            denied = self._admit(mailbox)
+            if denied:
+                status, out, headers = self._throttled(*denied)
+            else:
+                url = urlparse("/v1.0" + r["url"])
+                (status, out), headers = self._route(r["method"], url.path, parse_qs(url.query), r.get("body")), {}
+            if status >= 400:
+                failed.add(r["id"])
+            self.status[status] += 1
+            responses.append({"id": r["id"], "status": status, "headers": headers, "body": out})
+        return 200, {"responses": responses}, {}
+
+def serve(stub: GraphStub, port: int=0):
+    """Run the stub on a background thread; returns its base URL (…/v1.0)."""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like Graph
+
+        def _any(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(n)) if n else None
+            status, out, headers = stub.handle(self.command, self.path, self.headers.get("Authorization", ""), body)
+            data = json.dumps(out).encode("utf-8") if out is not None else b""
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _any
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="graph-stub", daemon=True).start()
+    stub.base = f"http://127.0.0.1:{server.server_address[1]}/v1.0"
+    return stub.base
+
+def main():
+    ap = argparse.ArgumentParser(description="Throttling Microsoft Graph stub")
+    ap.add_argument("--port", type=int, default=8780)
+    ap.add_argument("--limit", type=int, default=50, help="requests per window per mailbox")
+    ap.add_argument("--window", type=float, default=1.0, help="seconds")
+    ap.add_argument("--concurrency", type=int, default=4, help="requests in flight per mailbox (0 = no cap)")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 503")
+    ap.add_argument("--latency-ms", type=float, default=5)
+    args = ap.parse_args()
+    stub = GraphStub(args.limit, args.window, args.concurrency, args.error_rate, args.latency_ms)
+    print(f"🧪 Graph stub on {serve(stub, args.port)} ({args.limit} requests/{args.window:g}s per mailbox)")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"   responses: {dict(stub.status)}")
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
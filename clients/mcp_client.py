@@ -1,41 +1,351 @@
-
 # clients/mcp_client.py
 # A super-lightweight JSON-RPC over TCP client to talk to our local MCP servers.
 # This is NOT the official MCP SDK; it's a pragmatic minimal transport for your project.
+#
+# By default calls go over long-lived pooled connections: one JSON request per
+# line, responses matched back to callers by JSON-RPC id, so several threads can
+# have requests in flight on the same socket. persistent=False keeps the old
+# one-connection-per-call behaviour (send, half-close, read until EOF).
+#
+# A pooled connection first offers length-prefixed framing with zlib compression
+# (mcp.negotiate, see src/wire.py) and falls back to lines if the server declines.
+# stream() consumes a result the server sends page by page (partial responses).
+#
+# Every call is timed into src/metrics (mcp_client_* by method), and the current
+# trace id, if any, is sent along as params["trace_id"]. A client made for one
+# mailbox (account=...) tags its requests with params["account"]. params["timeout"]
+# tells the server how long this client waits, so it never retries past that.
+import itertools
 import json
+import os
+import queue
 import socket
 import threading
+from concurrent.futures import Future
 
-class MCPClient:
-    def __init__(self, host="127.0.0.1", port=8765, timeout=30):
+from src import wire
+from src.metrics import registry, current_trace
+
+POOL_SIZE = int(os.environ.get("MCP_POOL_SIZE", "2"))  # sockets per host:port
+TIMEOUT = float(os.environ.get("MCP_TIMEOUT", "30"))   # seconds per call (per page for streams)
+
+# Ids are process-wide so clients sharing a pooled connection never collide.
+_ids = itertools.count(1)
+
+
+class _Connection:
+    """One long-lived socket with a reader thread dispatching responses by id."""
+
+    def __init__(self, host, port, timeout):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.framed = False
+        self.compress = False
+        if wire.FRAMING:
+            self._negotiate()
+        # Per-call timeouts are enforced on the futures; the reader just blocks.
+        self.sock.settimeout(None)
+        self.closed = False
+        self._pending = {}   # id -> Future, or a Queue for a stream
+        self._plock = threading.Lock()
+        self._wlock = threading.Lock()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _negotiate(self):
+        """Offer frames before anything else is sent; the reply is the only thing in flight."""
+        req = {"jsonrpc": "2.0", "id": next(_ids), "method": wire.NEGOTIATE, "params": wire.offer()}
+        self.sock.sendall(wire.dumps(req) + b"\n")
+        buf = bytearray()
+        while not buf.endswith(b"\n"):
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("MCP server closed the connection")
+            buf += chunk
+        result = json.loads(buf).get("result") or {}  # an error = old server: stay on lines
+        self.framed = result.get("framing") == wire.FRAMED
+        self.compress = bool(result.get("compress"))
+
+    @property
+    def load(self):
+        return len(self._pending)
+
+    def send(self, rid, payload: bytes, stream: bool=False):
+        """Send one JSON message; returns a Future for the reply (a Queue of messages if stream)."""
+        waiter = queue.Queue() if stream else Future()
+        data = wire.encode(payload, self.compress) if self.framed else payload + b"\n"
+        with self._plock:
+            if self.closed:
+                raise ConnectionError("MCP connection is closed")
+            self._pending[rid] = waiter
+        try:
+            with self._wlock:
+                self.sock.sendall(data)
+        except OSError as e:
+            self._fail(e)
+            raise
+        return waiter
+
+    def forget(self, rid):
+        with self._plock:
+            self._pending.pop(rid, None)
+
+    def _messages(self):
+        if not self.framed:
+            with self.sock.makefile("rb") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+        head = bytearray(wire.HEADER.size)
+        while True:
+            if not self._recv_into(memoryview(head)):
+                return
+            n, flags = wire.header(head)
+            buf = bytearray(n)  # sized from the header: one allocation, no re-copying
+            if n and not self._recv_into(memoryview(buf)):
+                return
+            yield wire.decode(buf, flags)
+
+    def _recv_into(self, view) -> bool:
+        got = 0
+        while got < len(view):
+            n = self.sock.recv_into(view[got:])
+            if not n:
+                if got:
+                    raise ConnectionError("MCP server closed the connection mid-frame")
+                return False
+            got += n
+        return True
+
+    def _read_loop(self):
+        err = None
+        try:
+            for resp in self._messages():
+                with self._plock:
+                    if isinstance(resp, list):
+                        # Batch replies are filed under any of their member ids.
+                        rid = next((r.get("id") for r in resp if r.get("id") in self._pending), None)
+                    else:
+                        rid = resp.get("id")
+                    if isinstance(resp, dict) and "partial" in resp:
+                        waiter = self._pending.get(rid)
+                    else:
+                        waiter = self._pending.pop(rid, None)
+                if isinstance(waiter, Future):
+                    waiter.set_result(resp)
+                elif waiter is not None:
+                    waiter.put(resp)
+        except Exception as e:
+            err = e
+        self._fail(err or ConnectionError("MCP server closed the connection"))
+
+    def _fail(self, exc):
+        with self._plock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for waiter in pending.values():
+            if isinstance(waiter, Future):
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            else:
+                waiter.put(exc)
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class _Pool:
+    """A few connections per host:port; new calls go to the least-loaded one."""
+
+    def __init__(self, host, port, timeout, size):
         self.host = host
         self.port = port
         self.timeout = timeout
-        self._req_id = 0
+        self.size = max(1, size)
+        self._conns = []
         self._lock = threading.Lock()
 
-    def call(self, method: str, params: dict|None=None):
-        if params is None:
-            params = {}
+    def acquire(self) -> _Connection:
         with self._lock:
-            self._req_id += 1
-            rid = self._req_id
+            self._conns = [c for c in self._conns if not c.closed]
+            idle = min(self._conns, key=lambda c: c.load, default=None)
+            if idle is None or (idle.load > 0 and len(self._conns) < self.size):
+                idle = _Connection(self.host, self.port, self.timeout)
+                self._conns.append(idle)
+            return idle
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(host, port, timeout) -> _Pool:
+    with _pools_lock:
+        pool = _pools.get((host, port))
+        if pool is None:
+            pool = _pools[(host, port)] = _Pool(host, port, timeout, POOL_SIZE)
+        return pool
+
+
+def _tagged(params, account=None, timeout=None):
+    params = params or {}
+    trace = current_trace()
+    if trace and "trace_id" not in params:
+        params = dict(params, trace_id=trace)
+    if account and "account" not in params:
+        params = dict(params, account=account)
+    if timeout and "timeout" not in params:
+        params = dict(params, timeout=timeout)
+    return params
+
+
+class MCPClient:
+    def __init__(self, host="127.0.0.1", port=8765, timeout=TIMEOUT, persistent=True, account: str|None=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.persistent = persistent
+        self.account = account
+
+    def call(self, method: str, params: dict|None=None):
+        params = _tagged(params, self.account, self.timeout)
+        rid = next(_ids)
         req = {"jsonrpc": "2.0", "id": rid, "method": method, "params": params}
-        data = (json.dumps(req) + "\n").encode("utf-8")
+        data = wire.dumps(req)
+        with registry.timed("mcp_client", method=method):
+            if self.persistent:
+                resp = self._call_pooled(rid, data)
+            else:
+                resp = self._call_oneshot(data)
+            if "error" in resp:
+                raise RuntimeError(f"MCP error: {resp['error']}")
+        return resp.get("result")
+
+    def call_batch(self, calls, return_exceptions=False):
+        """
+        Send several calls as one JSON-RPC batch (a single round trip).
+        - calls: iterable of (method, params) pairs
+        Returns results in the same order. A failed call raises, unless
+        return_exceptions=True, in which case its RuntimeError is returned in place.
+        """
+        calls = list(calls)
+        if not calls:
+            return []
+        reqs = [
+            {"jsonrpc": "2.0", "id": next(_ids), "method": method, "params": _tagged(params, self.account, self.timeout)}
+            for method, params in calls
+        ]
+        data = wire.dumps(reqs)
+        with registry.timed("mcp_client", method="batch"):
+            if self.persistent:
+                resp = self._call_pooled(reqs[0]["id"], data)
+            else:
+                resp = self._call_oneshot(data)
+            if isinstance(resp, dict):
+                # The whole batch was rejected (e.g. parse error).
+                raise RuntimeError(f"MCP error: {resp.get('error')}")
+        by_id = {r.get("id"): r for r in resp}
+        results = []
+        for req in reqs:
+            r = by_id.get(req["id"])
+            if r is None:
+                err = RuntimeError(f"MCP error: no response for {req['method']}")
+            elif "error" in r:
+                err = RuntimeError(f"MCP error: {r['error']}")
+            else:
+                results.append(r.get("result"))
+                continue
+            if not return_exceptions:
+                raise err
+            results.append(err)
+        return results
+
+    def stream(self, method: str, params: dict|None=None):
+        """
+        Call a method whose result the server sends page by page; iterate for the pages.
+        After the loop, .result holds the final summary (e.g. a deltaLink). A server that
+        doesn't stream this method answers in one piece: that's the only page and .result.
+        """
+        return _Stream(self, method, dict(params or {}, stream=True))
+
+    def _send_pooled(self, rid, data: bytes, stream: bool=False):
+        pool = _get_pool(self.host, self.port, self.timeout)
+        try:
+            conn = pool.acquire()
+            return conn, conn.send(rid, data, stream)
+        except OSError:
+            # A pooled socket may have died while idle; nothing was delivered, retry once.
+            conn = pool.acquire()
+            return conn, conn.send(rid, data, stream)
+
+    def _call_pooled(self, rid, data: bytes):
+        conn, fut = self._send_pooled(rid, data)
+        try:
+            return fut.result(timeout=self.timeout)
+        finally:
+            conn.forget(rid)
+
+    def _call_oneshot(self, data: bytes):
         with socket.create_connection((self.host, self.port), timeout=self.timeout) as s:
-            s.sendall(data)
+            s.sendall(data + b"\n")
             s.shutdown(socket.SHUT_WR)
-            buf = b""
+            chunks = []
             while True:
                 chunk = s.recv(65536)
                 if not chunk:
                     break
-                buf += chunk
-        if not buf:
+                chunks.append(chunk)
+        buf = b"".join(chunks)
+        if not buf.strip():
             raise RuntimeError("Empty response from MCP server")
-        lines = buf.decode("utf-8").splitlines()
-        # take the last complete line
-        resp = json.loads(lines[-1])
-        if "error" in resp:
-            raise RuntimeError(f"MCP error: {resp['error']}")
-        return resp.get("result")
+        # One request, one reply line
+        return json.loads(buf.split(b"\n", 1)[0])
+
+
+class _Stream:
+    """Pages of one streamed call, as they arrive; .result once it's done."""
+
+    def __init__(self, client: MCPClient, method, params):
+        self.client = client
+        self.method = method
+        self.params = params
+        self.result = None
+        self.pages = 0
+
+    def __iter__(self):
+        c = self.client
+        if not c.persistent:
+            self.result = c.call(self.method, self.params)
+            self.pages = 1
+            yield self.result
+            return
+        rid = next(_ids)
+        req = {"jsonrpc": "2.0", "id": rid, "method": self.method, "params": _tagged(self.params, c.account, c.timeout)}
+        with registry.timed("mcp_client", method=self.method):
+            conn, q = c._send_pooled(rid, wire.dumps(req), stream=True)
+            try:
+                while True:
+                    try:
+                        resp = q.get(timeout=c.timeout)  # per page, not for the whole stream
+                    except queue.Empty:
+                        raise TimeoutError(f"MCP stream {self.method}: no page in {c.timeout}s")
+                    if isinstance(resp, Exception):
+                        raise resp
+                    if "partial" in resp:
+                        self.pages += 1
+                        yield resp["partial"]
+                        continue
+                    if "error" in resp:
+                        raise RuntimeError(f"MCP error: {resp['error']}")
+                    result = resp.get("result")
+                    if isinstance(result, dict) and result.get("stream_end"):
+                        self.result = result
+                    else:
+                        # Not streamed by this server: the whole result is the one page
+                        self.result = result
+                        self.pages += 1
+                        yield result
+                    return
+            finally:
+                conn.forget(rid)
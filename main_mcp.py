@@ -1,21 +1,99 @@
-import time
+import os, time
+from datetime import datetime, timezone
+from clients.mcp_client import MCPClient
 from src.email_mcp import get_emails_with_tasks
+from src.ingest import AdaptivePoll, NotificationReceiver, NOTIFY_CLIENT_STATE, POLL_MAX, POLL_MAX_PUSH
+from src.accounts import load_accounts
+from src.processed_store import ProcessedStore
+from src import metrics
 
-POLL_INTERVAL = 60
+# Public HTTPS URL that forwards to the local receiver (e.g. a tunnel); without it the
+# receiver only hears local senders and no Graph subscription is created
+NOTIFY_URL = os.getenv("AGENT_NOTIFY_URL", "")
+# Push: wake on Graph change notifications; the adaptive poll below stays on as the fallback.
+# On by default only when Graph can reach the receiver (AGENT_NOTIFY_URL).
+PUSH = os.getenv("AGENT_PUSH", "1" if NOTIFY_URL else "0") in ("1","true","True","yes","YES")
+NOTIFY_DEBOUNCE = float(os.getenv("AGENT_NOTIFY_DEBOUNCE", "0.2"))  # coalesce notification bursts
+RENEW_BEFORE = 3600  # renew the subscription when it has less than this many seconds left
+METRICS_PORT = int(os.getenv("AGENT_METRICS_PORT", "0"))  # Prometheus /metrics for the agent, 0 = off
+
+def _expires_in(sub):
+    exp = datetime.fromisoformat(sub["expirationDateTime"][:19]).replace(tzinfo=timezone.utc)
+    return (exp - datetime.now(timezone.utc)).total_seconds()
+
+def _keep_subscribed(graph, sub):
+    """Create the mail subscription, or renew it when it's close to expiring. Returns the current one."""
+    try:
+        if sub is None:
+            sub = graph.call("subscription.create", {"notificationUrl": NOTIFY_URL, "clientState": NOTIFY_CLIENT_STATE})
+            print(f"🔔 Subscribed to inbox notifications until {sub['expirationDateTime']}")
+        elif _expires_in(sub) < RENEW_BEFORE:
+            sub = graph.call("subscription.renew", {"id": sub["id"]})
+            print(f"🔔 Subscription renewed until {sub['expirationDateTime']}")
+    except Exception as e:
+        print(f"⚠️ Push subscription unavailable, polling only: {e}")
+        return None
+    return sub
+
+def _not_processed(ids):
+    """Notified message ids the last cycle didn't get to (delta can lag the notification)."""
+    if not ids:
+        return []
+    processed = ProcessedStore()
+    try:
+        return [i for i in ids if i not in processed]
+    finally:
+        processed.close()
 
 def main():
+    accounts = load_accounts()
+    if accounts:
+        # Several mailboxes (AGENT_ACCOUNTS / AGENT_ACCOUNTS_FILE): sharded worker pool
+        from src.supervisor import supervise
+        return supervise(accounts)
     print("🟢 AI Task Agent (MCP) is now running... (Ctrl+C to stop)")
-    while True:
-        try:
-            get_emails_with_tasks()
-            print(f"⏳ Waiting {POLL_INTERVAL} seconds...\n")
-            time.sleep(POLL_INTERVAL)
-        except KeyboardInterrupt:
-            print("🛑 Stopped by user.")
-            break
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            time.sleep(POLL_INTERVAL)
+    if METRICS_PORT:
+        metrics.serve_http(METRICS_PORT)
+    receiver = NotificationReceiver().start() if PUSH else None
+    graph = MCPClient() if receiver and NOTIFY_URL else None
+    sub = None
+    poll = AdaptivePoll()
+    wait = 0
+    try:
+        while True:
+            try:
+                notified = []
+                if receiver:
+                    if receiver.wake.wait(wait):
+                        time.sleep(NOTIFY_DEBOUNCE)
+                        notified = receiver.take()
+                        print(f"🔔 Notified about {len(notified)} message(s).")
+                else:
+                    time.sleep(wait)
+                if graph:
+                    sub = _keep_subscribed(graph, sub)
+                # Long idle waits only while Graph notifies us; polling alone keeps the old interval
+                poll.max_s = POLL_MAX_PUSH if sub else POLL_MAX
+                handled = get_emails_with_tasks()
+                missed = _not_processed(notified)
+                if missed:
+                    print(f"🔔 {len(missed)} notified message(s) not in the mailbox delta yet; looking again soon.")
+                wait = poll.activity() if handled or missed else poll.idle()
+                print(f"⏳ Next check in {wait:.0f} seconds{' (or on notification)' if receiver else ''}...\n")
+            except KeyboardInterrupt:
+                print("🛑 Stopped by user.")
+                break
+            except Exception as e:
+                wait = poll.error()
+                print(f"❌ Error: {e} (retrying in {wait:.0f} seconds)")
+    finally:
+        if graph and sub:
+            try:
+                graph.call("subscription.delete", {"id": sub["id"]})
+            except Exception:
+                pass
+        if receiver:
+            receiver.stop()
 
 if __name__ == "__main__":
     main()
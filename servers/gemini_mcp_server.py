@@ -1,7 +1,14 @@
 # Minimal JSON-RPC TCP server exposing Gemini generate_content as MCP-style tool.
-import json, os, socket, threading
+import os, sys, threading
+from collections import deque
+from concurrent.futures import Future
 from datetime import datetime
 
+# Allow `python servers/<name>.py` as well as `import servers.<name>` from the repo root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from servers.mcp_core import serve
+from servers.llm_cache import LLMCache, cache_key
+
 # You need: pip install google-generativeai (or google-genai for your variant)
 try:
     import google.generativeai as genai
@@ -11,72 +18,210 @@ except Exception:
 
 HOST = os.environ.get("MCP_GEMINI_HOST", "127.0.0.1")
 PORT = int(os.environ.get("MCP_GEMINI_PORT", "8766"))
+METRICS_PORT = int(os.environ.get("MCP_GEMINI_METRICS_PORT", "0"))  # Prometheus /metrics, 0 = off
+
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")  # set in your env
 
-def llm_generate(model: str, prompt: str):
-    if not HAS_LIB:
-        raise RuntimeError("google-generativeai not installed. pip install google-generativeai")
-    if not GEMINI_API_KEY:
-        raise RuntimeError("GEMINI_API_KEY env var is not set.")
-    genai.configure(api_key=GEMINI_API_KEY)
-    m = genai.GenerativeModel(model)
-    resp = m.generate_content(prompt)
-    return {"text": getattr(resp, "text", "").strip()}
+# Opt-in response cache (see servers/llm_cache.py)
+CACHE_ENABLED = os.environ.get("GEMINI_CACHE", "0") in ("1", "true", "True", "yes", "YES")
+CACHE_PATH = os.environ.get("GEMINI_CACHE_PATH", "llm_cache.db")
+CACHE_TTL = float(os.environ.get("GEMINI_CACHE_TTL", str(7 * 86400)))  # seconds
+CACHE_MEM_ENTRIES = int(os.environ.get("GEMINI_CACHE_MEM_ENTRIES", "512"))
+CACHE_MAX_MB = float(os.environ.get("GEMINI_CACHE_MAX_MB", "64"))
+
+_cache = LLMCache(CACHE_PATH, CACHE_TTL, CACHE_MEM_ENTRIES, int(CACHE_MAX_MB * 2**20)) if CACHE_ENABLED else None
+
+# The extraction prompt lives here so the agent only sends the email and a date:
+# with the date (not the current second) in the prompt, the cache key is stable all day.
+EXTRACT_PROMPT = """
+You are a Task Manager. Extract the task, due date, and estimate (max 4h).
+Today's date is: {weekday} {date}.
+Return EXACTLY in this format: (TASK, YYYY-MM-DD HH:MM, DURATION)
+- Use 24h time (HH:MM)
+- Convert relative times like "tomorrow 3pm" to concrete date and 24h time
+- If no explicit time is present, use 17:00 as a reasonable default for a deadline
+
+EMAIL:
+{text}
+"""
+
+# Several emails per call: the instructions are paid once and answers come back keyed by index.
+EXTRACT_BATCH_PROMPT = """
+You are a Task Manager. For EACH email below, extract the task, due date, and estimate (max 4h).
+Today's date is: {weekday} {date}.
+- Use 24h time (HH:MM)
+- Convert relative times like "tomorrow 3pm" to concrete date and 24h time
+- If no explicit time is present, use 17:00 as a reasonable default for a deadline
+Return ONLY a JSON array with exactly {count} objects, one per email, in any order:
+[{{"index": 0, "task": "...", "deadline": "YYYY-MM-DD HH:MM", "duration": "2h"}},
+ {{"index": 1, "none": true}}]
+Use {{"index": N, "none": true}} when an email contains no task.
+
+{emails}"""
+
+# Upstream protection: at most this many Gemini calls at once, the rest wait in FIFO order
+UPSTREAM_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENT", "4"))
+UPSTREAM_WAIT_TIMEOUT = float(os.environ.get("GEMINI_QUEUE_TIMEOUT", "120"))  # seconds
+
+class _FifoLimiter:
+    """Counting semaphore that hands free slots to waiters strictly in arrival order."""
+
+    def __init__(self, slots: int):
+        self._free = max(1, slots)
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float|None=None) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            ev = threading.Event()
+            self._waiters.append(ev)
+        if ev.wait(timeout):
+            return True
+        with self._lock:
+            if ev.is_set():  # slot handed over just as we timed out
+                return True
+            self._waiters.remove(ev)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()  # pass the slot straight to the next in line
+            else:
+                self._free += 1
+
+    def waiting(self):
+        return len(self._waiters)
+
+_limiter = _FifoLimiter(UPSTREAM_CONCURRENCY)
+_models = {}
+_models_lock = threading.Lock()
+_model_factory = None
+_inflight = {}  # cache key -> Future shared by identical concurrent requests
+_inflight_lock = threading.Lock()
+_counters = {"upstream_calls": 0, "coalesced": 0, "queue_timeouts": 0}
+_counters_lock = threading.Lock()  # bumped from many executor threads
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+def set_model_factory(factory):
+    """
+    Swap the Gemini backend, e.g. for tests or benchmarks.
+    factory(model_name) -> object with generate_content(prompt) returning something with .text
+    """
+    global _model_factory
+    with _models_lock:
+        _model_factory = factory
+        _models.clear()
+
+def _get_model(model: str):
+    # Configure once and build each GenerativeModel once; both are safe to share across threads.
+    with _models_lock:
+        m = _models.get(model)
+        if m is None:
+            if _model_factory is not None:
+                m = _model_factory(model)
+            else:
+                if not HAS_LIB:
+                    raise RuntimeError("google-generativeai not installed. pip install google-generativeai")
+                if not GEMINI_API_KEY:
+                    raise RuntimeError("GEMINI_API_KEY env var is not set.")
+                if not _models:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                m = genai.GenerativeModel(model)
+            _models[model] = m
+        return m
+
+def _call_model(model: str, prompt: str):
+    m = _get_model(model)
+    if not _limiter.acquire(UPSTREAM_WAIT_TIMEOUT):
+        _count("queue_timeouts")
+        raise RuntimeError("Gemini upstream busy: timed out waiting for a slot")
+    try:
+        _count("upstream_calls")
+        resp = m.generate_content(prompt)
+    finally:
+        _limiter.release()
+    return {"text": (getattr(resp, "text", "") or "").strip()}
+
+def _call_coalesced(key: str, model: str, prompt: str, store: bool=True):
+    # Single flight: identical concurrent requests share one upstream call and its result
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = _inflight[key] = Future()
+    if not leader:
+        _count("coalesced")
+        return fut.result()
+    try:
+        result = _call_model(model, prompt)
+        if store and _cache is not None and result.get("text"):
+            _cache.put(key, result)  # don't pin empty/failed generations; use_cache=False opts out
+        fut.set_result(result)
+        return result
+    except Exception as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+def llm_generate(model: str, prompt: str, use_cache: bool=True):
+    key = cache_key(model, prompt)
+    if _cache is not None and use_cache:
+        hit = _cache.get(key)
+        if hit is not None:
+            return hit
+    return _call_coalesced(key, model, prompt, store=use_cache)
+
+def extract_task(model: str, text: str, reference_date: str|None=None, use_cache: bool=True):
+    ref = datetime.strptime(reference_date, "%Y-%m-%d") if reference_date else datetime.now()
+    prompt = EXTRACT_PROMPT.format(weekday=ref.strftime("%A"), date=ref.strftime("%Y-%m-%d"), text=text)
+    return llm_generate(model, prompt, use_cache)
+
+def extract_tasks(model: str, texts: list, reference_date: str|None=None, use_cache: bool=True):
+    ref = datetime.strptime(reference_date, "%Y-%m-%d") if reference_date else datetime.now()
+    emails = "\n".join(f"### EMAIL {i}\n{t}\n" for i, t in enumerate(texts))
+    prompt = EXTRACT_BATCH_PROMPT.format(weekday=ref.strftime("%A"), date=ref.strftime("%Y-%m-%d"),
+                                         count=len(texts), emails=emails)
+    return llm_generate(model, prompt, use_cache)
+
+def llm_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    return {**counters, "upstream_waiting": _limiter.waiting(), "upstream_limit": UPSTREAM_CONCURRENCY,
+            "inflight_keys": len(_inflight)}
+
+def cache_stats():
+    if _cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_cache.stats()}
 
 def handle_request(req: dict):
     method = req.get("method")
     params = req.get("params") or {}
     if method == "llm.generate":
-        return llm_generate(params.get("model","gemini-1.5-flash"), params["prompt"])
+        return llm_generate(params.get("model","gemini-1.5-flash"), params["prompt"], params.get("cache", True))
+    if method == "llm.extract_task":
+        return extract_task(params.get("model","gemini-1.5-flash"), params["text"],
+                            params.get("reference_date"), params.get("cache", True))
+    if method == "llm.extract_tasks":
+        return extract_tasks(params.get("model","gemini-1.5-flash"), params["texts"],
+                             params.get("reference_date"), params.get("cache", True))
+    if method == "cache.stats":
+        return cache_stats()
+    if method == "llm.stats":
+        return llm_stats()
     raise RuntimeError(f"Unknown method: {method}")
 
-def serve_client(conn):
-    try:
-        data = b""
-        while True:
-            chunk = conn.recv(65536)
-            if not chunk:
-                break
-            data += chunk
-        if not data:
-            return
-
-        # Take the last complete line for robustness
-        try:
-            req = json.loads(data.decode("utf-8").splitlines()[-1])
-        except Exception as e:
-            resp = {
-                "jsonrpc": "2.0",
-                "id": None,
-                "error": {"code": -32700, "message": f"Parse error: {e}"}
-            }
-            conn.sendall((json.dumps(resp) + "\n").encode("utf-8"))
-            return
-
-        try:
-            result = handle_request(req)
-            resp = {"jsonrpc": "2.0", "id": req.get("id"), "result": result}
-        except Exception as e:
-            resp = {
-                "jsonrpc": "2.0",
-                "id": req.get("id"),
-                "error": {"code": -32000, "message": str(e)}
-            }
-
-        conn.sendall((json.dumps(resp) + "\n").encode("utf-8"))
-    finally:
-        conn.close()
-
-
 def run():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(20)
-        print(f"[MCP-Gemini] Listening on {HOST}:{PORT}")
-        while True:
-            conn, _ = s.accept()
-            threading.Thread(target=serve_client, args=(conn,), daemon=True).start()
+    serve(handle_request, HOST, PORT, name="MCP-Gemini", metrics_port=METRICS_PORT)
 
 if __name__ == "__main__":
     run()
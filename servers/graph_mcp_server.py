@@ -1,82 +1,203 @@
 # servers/graph_mcp_server.py
 # Minimal JSON-RPC TCP server exposing Microsoft Graph as MCP-style tools.
 # Adds get/update/delete so the scheduler can reshuffle events.
+# Serves several mailboxes: a request's params["account"] picks that account's token
+# cache (MS_TOKEN_CACHE_DIR/token_cache.<account>.bin); without it, MS_TOKEN_CACHE.
+# Sign an account in ahead of time with: python servers/graph_mcp_server.py --login <account>
+# Every Graph call goes through _send(): a token bucket per mailbox and resource, a cap on
+# concurrent requests per mailbox, retries that honor Retry-After (jittered backoff
+# otherwise) and a circuit breaker per resource that fails fast while Graph is degraded.
+# No wait runs past the caller's deadline (params["timeout"], else MCP_TIMEOUT, less a
+# margin, counted from when the request reached mcp_core, queueing included): past it a
+# call fails at once with the Retry-After hint instead of sleeping on.
 
-import json, os, socket, threading
+import contextvars, inspect, os, random, re, sys, threading, time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 
 import requests
+import requests.adapters
 import msal
 
+# Allow `python servers/<name>.py` as well as `import servers.<name>` from the repo root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from servers.mcp_core import arrival, serve
+from src.metrics import registry
+
 CLIENT_ID = os.environ.get("MS_CLIENT_ID", "0aa6072a-91f8-4729-8018-499d07d54bbf")
 AUTHORITY = os.environ.get("MS_AUTHORITY", "https://login.microsoftonline.com/consumers")
 SCOPE = ["Mail.Read", "Calendars.ReadWrite", "Calendars.Read"]
 TOKEN_CACHE_PATH = os.environ.get("MS_TOKEN_CACHE", "token_cache.bin")
+TOKEN_CACHE_DIR = os.environ.get("MS_TOKEN_CACHE_DIR", "")  # per-account caches; "" = next to MS_TOKEN_CACHE
+REFRESH_MARGIN = int(os.environ.get("MS_TOKEN_REFRESH_MARGIN", "300"))  # refresh this many seconds before expiry
+EXPIRY_SKEW = 60  # never hand out a token with less than this left
 
 HOST = os.environ.get("MCP_GRAPH_HOST", "127.0.0.1")
 PORT = int(os.environ.get("MCP_GRAPH_PORT", "8765"))
+METRICS_PORT = int(os.environ.get("MCP_GRAPH_METRICS_PORT", "0"))  # Prometheus /metrics, 0 = off
+
+GRAPH_BASE = os.environ.get("MS_GRAPH_BASE", "https://graph.microsoft.com/v1.0").rstrip("/")
+GRAPH_BATCH_LIMIT = 20  # Graph's cap on sub-requests per $batch call
+HTTP_POOL_SIZE = int(os.environ.get("MS_HTTP_POOL", "16"))
+
+# One keep-alive session for every handler: no TLS handshake per Graph call.
+_session = requests.Session()
+_session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE))
+_batch_executor = ThreadPoolExecutor(max_workers=4)
+
+# Throttling: Outlook allows ~10k requests per 10 minutes and 4 concurrent requests per app and mailbox
+GRAPH_RATE = float(os.environ.get("MS_GRAPH_RATE", "15"))            # requests/s per mailbox and resource, 0 = no limit
+GRAPH_BURST = int(os.environ.get("MS_GRAPH_BURST", "40"))            # bucket size (a full $batch costs 20)
+GRAPH_CONCURRENCY = int(os.environ.get("MS_GRAPH_CONCURRENCY", "4"))  # requests in flight per mailbox, 0 = no cap
+GRAPH_RETRIES = int(os.environ.get("MS_GRAPH_RETRIES", "4"))
+GRAPH_BACKOFF_MAX = float(os.environ.get("MS_GRAPH_BACKOFF_MAX", "30"))   # seconds, jittered backoff ceiling
+GRAPH_MAX_WAIT = float(os.environ.get("MS_GRAPH_MAX_WAIT", "120"))        # longer Retry-After → fail now, with the hint
+BREAKER_FAILURES = int(os.environ.get("MS_GRAPH_BREAKER_FAILURES", "5"))  # consecutive failures that open the circuit
+BREAKER_COOLDOWN = float(os.environ.get("MS_GRAPH_BREAKER_COOLDOWN", "30"))  # seconds open before one trial call
+CLIENT_TIMEOUT = float(os.environ.get("MCP_TIMEOUT", "30"))  # MCPClient's per-call timeout, for callers that don't send one
+DEADLINE_MARGIN = 2.0  # seconds kept back for the reply to reach the caller
 
 # Optional: prefer a timezone for Outlook responses
 PREFER_TZ = os.environ.get("AGENT_TZ", None)  # e.g., "Africa/Tunis"
 
-def load_cache():
+def cache_path(account: str|None=None):
+    if account is None:
+        return TOKEN_CACHE_PATH
+    folder = TOKEN_CACHE_DIR or os.path.dirname(TOKEN_CACHE_PATH)
+    safe = re.sub(r"[^\w.@-]", "_", account)
+    return os.path.join(folder, f"token_cache.{safe}.bin")
+
+def load_cache(path: str=TOKEN_CACHE_PATH):
     cache = msal.SerializableTokenCache()
-    if os.path.exists(TOKEN_CACHE_PATH):
+    if os.path.exists(path):
         # Try UTF-8 text first
         try:
-            with open(TOKEN_CACHE_PATH, "r", encoding="utf-8") as f:
+            with open(path, "r", encoding="utf-8") as f:
                 cache.deserialize(f.read())
                 return cache
         except Exception:
             pass
         # Try binary → decode best-effort
         try:
-            with open(TOKEN_CACHE_PATH, "rb") as f:
+            with open(path, "rb") as f:
                 raw = f.read()
             cache.deserialize(raw.decode("utf-8", errors="ignore"))
             return cache
         except Exception:
             # Corrupt cache: remove and start fresh
             try:
-                os.remove(TOKEN_CACHE_PATH)
+                os.remove(path)
             except Exception:
                 pass
             cache = msal.SerializableTokenCache()
     return cache
 
-def save_cache(cache):
+def save_cache(cache, path: str=TOKEN_CACHE_PATH):
     if cache.has_state_changed:
-        with open(TOKEN_CACHE_PATH, "w", encoding="utf-8") as f:
+        with open(path, "w", encoding="utf-8") as f:
             f.write(cache.serialize())
 
 
-def get_token():
-    cache = load_cache()
-    app = msal.PublicClientApplication(CLIENT_ID, authority=AUTHORITY, token_cache=cache)
+class _TokenManager:
+    """
+    Keeps one MSAL app and the current access token in memory for all request
+    threads, per account. The token is refreshed in the background REFRESH_MARGIN
+    seconds before it expires; the cache file is only rewritten when MSAL changed it.
+    """
 
-    try:
-        accounts = app.get_accounts()
-    except Exception:
-        # If MSAL still chokes, start clean
-        cache = msal.SerializableTokenCache()
-        app = msal.PublicClientApplication(CLIENT_ID, authority=AUTHORITY, token_cache=cache)
-        accounts = []
-
-    if accounts:
-        result = app.acquire_token_silent(SCOPE, account=accounts[0])
-        if result:
-            save_cache(cache)
-            return result
-
-    # Fallback: device code flow
-    flow = app.initiate_device_flow(scopes=SCOPE)
-    if "message" not in flow:
-        raise RuntimeError(f"Failed to initiate device flow: {flow}")
-    print("== Microsoft login required ==")
-    print(flow["message"])
-    result = app.acquire_token_by_device_flow(flow)
-    save_cache(cache)
-    return result
+    def __init__(self, account: str|None=None):
+        self.account = account
+        self.path = cache_path(account)
+        self._lock = threading.Lock()
+        self._cache = None
+        self._app = None
+        self._token = None
+        self._expires_at = 0.0
+        self._timer = None
+
+    def get(self):
+        tok = self._token
+        if tok and time.time() < self._expires_at - EXPIRY_SKEW:
+            return tok  # fast path: no lock, no disk, no MSAL
+        with self._lock:
+            if self._token and time.time() < self._expires_at - EXPIRY_SKEW:
+                return self._token
+            return self._acquire(interactive=True)
+
+    def _ensure_app(self):
+        if self._app is not None:
+            return
+        self._cache = load_cache(self.path)
+        self._app = msal.PublicClientApplication(CLIENT_ID, authority=AUTHORITY, token_cache=self._cache)
+        try:
+            self._app.get_accounts()
+        except Exception:
+            # If MSAL still chokes, start clean
+            self._cache = msal.SerializableTokenCache()
+            self._app = msal.PublicClientApplication(CLIENT_ID, authority=AUTHORITY, token_cache=self._cache)
+
+    def _acquire(self, interactive: bool, force_refresh: bool=False):
+        # Caller holds self._lock
+        self._ensure_app()
+        accounts = self._app.get_accounts()
+        if self.account:
+            # A shared cache may hold several sign-ins; prefer the one for this mailbox
+            accounts = [a for a in accounts if (a.get("username") or "").lower() == self.account.lower()] or accounts
+        result = None
+        if accounts:
+            result = self._app.acquire_token_silent(SCOPE, account=accounts[0], force_refresh=force_refresh)
+
+        if not result or "access_token" not in result:
+            if not interactive:
+                return None
+            # Fallback: device code flow
+            flow = self._app.initiate_device_flow(scopes=SCOPE)
+            if "message" not in flow:
+                raise RuntimeError(f"Failed to initiate device flow: {flow}")
+            print(f"== Microsoft login required{f' for {self.account}' if self.account else ''} ==")
+            print(flow["message"])
+            result = self._app.acquire_token_by_device_flow(flow)
+            if "access_token" not in result:
+                raise RuntimeError(f"Login failed: {result.get('error_description') or result}")
+
+        save_cache(self._cache, self.path)  # no-op unless MSAL changed the cache
+        self._token = result
+        self._expires_at = time.time() + int(result.get("expires_in", 3600))
+        self._schedule_refresh()
+        return result
+
+    def _schedule_refresh(self):
+        if self._timer:
+            self._timer.cancel()
+        delay = max(0.0, self._expires_at - REFRESH_MARGIN - time.time())
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+        # Silent only: if the refresh token is gone, the next request prompts.
+        with self._lock:
+            try:
+                self._acquire(interactive=False, force_refresh=True)
+            except Exception as e:
+                print(f"[MCP-Graph] Background token refresh failed{f' ({self.account})' if self.account else ''}: {e}")
+
+_tokens = {}   # account (None = the single mailbox) -> _TokenManager
+_tokens_lock = threading.Lock()
+_account = contextvars.ContextVar("account", default=None)  # set per request in handle_request
+
+def _token_manager(account: str|None):
+    with _tokens_lock:
+        mgr = _tokens.get(account)
+        if mgr is None:
+            mgr = _tokens[account] = _TokenManager(account)
+        return mgr
+
+def get_token():
+    return _token_manager(_account.get()).get()
 
 def auth_headers():
     tok = get_token()
@@ -85,132 +206,647 @@ def auth_headers():
         h["Prefer"] = f'outlook.timezone="{PREFER_TZ}"'
     return h
 
-def list_messages(top=10):
-    url = f"https://graph.microsoft.com/v1.0/me/messages?$top={int(top)}"
-    res = requests.get(url, headers=auth_headers())
-    res.raise_for_status()
-    return res.json().get("value", [])
+# ------------ Throttling-aware request layer -------------
+RETRY_STATUS = (429, 503, 504)
+IDEMPOTENT = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+class GraphUnavailable(RuntimeError):
+    """Raised without calling Graph while the circuit for a resource is open."""
+
+class GraphThrottled(RuntimeError):
+    """Raised when a call would have to wait past the caller's deadline for its turn."""
+
+_deadline = contextvars.ContextVar("deadline", default=None)  # time.monotonic() by which the caller wants an answer
+
+def _past_deadline(wait: float) -> bool:
+    """Would sleeping `wait` seconds now outlast the caller?"""
+    deadline = _deadline.get()
+    return deadline is not None and time.monotonic() + wait > deadline
+
+class _TokenBucket:
+    """Requests per second with bursts; pause() holds everyone back after a 429."""
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self._at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, cost: int=1, deadline: float|None=None):
+        """Wait for `cost` tokens; GraphThrottled if they won't be there by `deadline`."""
+        if self.rate <= 0:
+            return
+        cost = min(float(cost), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._at) * self.rate)
+                self._at = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.tokens >= cost:
+                        self.tokens -= cost
+                        return
+                    wait = (cost - self.tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise GraphThrottled(f"Graph throttled (retry after {max(1, round(wait))}s)")
+            registry.observe("graph_limiter_wait_seconds", wait)
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+class _Breaker:
+    """closed → open after BREAKER_FAILURES straight failures → one trial after the cooldown."""
+    def __init__(self, resource: str):
+        self.resource = resource
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def check(self) -> bool:
+        """Raise while open; True if this caller got the half-open trial (it must record() or release())."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            left = self.opened_at + BREAKER_COOLDOWN - time.monotonic()
+            if left <= 0 and not self._trial:
+                self._trial = True  # half-open: this caller probes, the rest keep failing fast
+                return True
+        registry.inc("graph_breaker_rejected_total", resource=self.resource)
+        raise GraphUnavailable(f"Graph {self.resource} unavailable after {self.failures} failures; "
+                               f"retry in {max(0.0, left):.0f}s")
+
+    def release(self):
+        """The trial ended without reaching Graph (e.g. throttled locally): let the next caller probe."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            self._trial = False
+            if ok:
+                if self.opened_at is not None:
+                    print(f"[MCP-Graph] Circuit closed for {self.resource}")
+                    registry.gauge_set("graph_breaker_open", 0, resource=self.resource)
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.failures >= BREAKER_FAILURES:
+                if self.opened_at is None:
+                    print(f"[MCP-Graph] Circuit open for {self.resource} after {self.failures} failures")
+                    registry.gauge_set("graph_breaker_open", 1, resource=self.resource)
+                self.opened_at = time.monotonic()  # a failed trial restarts the cooldown
+
+_buckets, _breakers, _mailbox_slots = {}, {}, {}
+_limits_lock = threading.Lock()
+
+def _limits(resource: str):
+    """(bucket for this mailbox+resource, concurrency slots for this mailbox, breaker for this resource)."""
+    account = _account.get()
+    with _limits_lock:
+        bucket = _buckets.get((account, resource))
+        if bucket is None:
+            bucket = _buckets[(account, resource)] = _TokenBucket(GRAPH_RATE, GRAPH_BURST)
+        slots = _mailbox_slots.get(account)
+        if slots is None and GRAPH_CONCURRENCY > 0:
+            slots = _mailbox_slots[account] = threading.BoundedSemaphore(GRAPH_CONCURRENCY)
+        breaker = _breakers.get(resource)
+        if breaker is None:
+            breaker = _breakers[resource] = _Breaker(resource)
+    return bucket, slots, breaker
+
+def _resource(url: str):
+    """Which limit a call counts against: mail, calendar, subscriptions, ..."""
+    path = url[len(GRAPH_BASE):] if url.startswith(GRAPH_BASE) else url
+    part = path.lstrip("/").split("?")[0].split("/")
+    name = part[1] if part[0] == "me" and len(part) > 1 else part[0]
+    if name in ("messages", "mailFolders"):
+        return "mail"
+    if name in ("events", "calendarview", "calendarView", "calendar"):
+        return "calendar"
+    return name or "other"
+
+def _retry_after(headers) -> float|None:
+    """Seconds from a Retry-After header (delta-seconds or an HTTP date)."""
+    value = (headers or {}).get("Retry-After") or (headers or {}).get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+def _backoff(attempt: int) -> float:
+    return random.uniform(0, min(GRAPH_BACKOFF_MAX, 0.5 * 2 ** attempt))  # full jitter
+
+def _retriable(status: int, method: str, idempotent: bool|None) -> bool:
+    if status == 429:
+        return True  # throttled requests were not executed
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT
+    return status in RETRY_STATUS and idempotent
+
+def _send(method: str, url: str, headers: dict, json=None, cost: int=1, idempotent: bool|None=None,
+          resource: str|None=None):
+    """
+    One Graph call through the limiter, retries and breaker. Returns the final Response
+    (callers check its status as before); raises GraphUnavailable while the circuit is
+    open, GraphThrottled if its turn would come after the caller's deadline, or the last
+    connection error.
+    - cost: requests it counts as (sub-requests of a $batch)
+    - idempotent: safe to repeat after a 5xx or a dropped connection (default: by HTTP method)
+    """
+    resource = resource or _resource(url)
+    bucket, slots, breaker = _limits(resource)
+    deadline = _deadline.get()
+    for attempt in range(GRAPH_RETRIES + 1):
+        trial = breaker.check()
+        try:
+            bucket.acquire(cost, deadline)
+            if slots and not slots.acquire(timeout=None if deadline is None else max(0.0, deadline - time.monotonic())):
+                raise GraphThrottled(f"Graph {resource}: too many requests in flight for this mailbox")
+        except BaseException:
+            if trial:
+                breaker.release()
+            raise
+        try:
+            with registry.timed("graph_http", resource=resource):
+                res = _session.request(method, url, headers=headers, json=json)
+        except requests.RequestException as e:
+            breaker.record(False)
+            wait = _backoff(attempt)
+            if (attempt >= GRAPH_RETRIES or not (idempotent if idempotent is not None else method in IDEMPOTENT)
+                    or _past_deadline(wait)):
+                raise
+            print(f"[MCP-Graph] {method} {resource}: {e}; retry {attempt + 1} in {wait:.1f}s")
+        else:
+            breaker.record(res.status_code < 500)
+            res.retries = attempt
+            if attempt >= GRAPH_RETRIES or not _retriable(res.status_code, method, idempotent):
+                return res
+            hint = _retry_after(res.headers)
+            wait = hint if hint is not None else _backoff(attempt)
+            if res.status_code == 429:
+                registry.inc("graph_throttled_total", resource=resource)
+                if hint is not None and hint > GRAPH_MAX_WAIT:
+                    return res  # not worth holding a server thread; the error carries the status
+                bucket.pause(wait)
+            if _past_deadline(wait):
+                return res  # the caller gives up before then; _check hands it the Retry-After
+            print(f"[MCP-Graph] {method} {resource}: HTTP {res.status_code}; retry {attempt + 1} in {wait:.1f}s")
+        finally:
+            if slots:
+                slots.release()
+        registry.inc("graph_retries_total", resource=resource)
+        time.sleep(wait)
+
+def _check(res):
+    """raise_for_status() with Graph's Retry-After in the message, so it reaches the agent."""
+    if res.status_code >= 400:
+        hint = _retry_after(res.headers)
+        raise RuntimeError(f"Graph HTTP {res.status_code}{f' (retry after {hint:.0f}s)' if hint is not None else ''}: "
+                           f"{res.text[:300]}")
+
+def _pages(url: str, headers: dict, limit: int|None=None):
+    """Yield each page's items, following @odata.nextLink (stopping after `limit` items)."""
+    n = 0
+    while url:
+        res = _send("GET", url, headers)
+        _check(res)
+        data = res.json()
+        items = data.get("value", [])
+        if limit is not None:
+            items = items[:limit - n]
+        n += len(items)
+        yield items
+        url = data.get("@odata.nextLink") if limit is None or n < limit else None
+
+def _flatten(pages):
+    return [it for page in pages for it in page]
+
+def iter_messages(top=10, page_size: int=50):
+    """Newest `top` messages, one Graph page at a time (headers are taken now, for this account)."""
+    url = f"{GRAPH_BASE}/me/messages?$top={min(int(top), int(page_size))}"
+    return _pages(url, auth_headers(), int(top))
+
+def list_messages(top=10, page_size: int=50):
+    return _flatten(iter_messages(top, page_size))
+
+# What the agent reads from a full message; Graph only returns internetMessageHeaders when selected
+MESSAGE_SELECT = "id,subject,body,from,sender,receivedDateTime,internetMessageHeaders,inferenceClassification,importance"
 
 def get_message(msg_id: str):
-    url = f"https://graph.microsoft.com/v1.0/me/messages/{msg_id}"
-    res = requests.get(url, headers=auth_headers())
-    res.raise_for_status()
+    url = f"{GRAPH_BASE}/me/messages/{msg_id}?$select={MESSAGE_SELECT}"
+    res = _send("GET", url, auth_headers())
+    _check(res)
     return res.json()
 
-def list_events(start_iso: str, end_iso: str):
-    qs = urlencode({"startDateTime": start_iso, "endDateTime": end_iso})
-    url = f"https://graph.microsoft.com/v1.0/me/calendarview?{qs}"
-    res = requests.get(url, headers=auth_headers())
-    res.raise_for_status()
-    return res.json().get("value", [])
+def iter_events(start_iso: str, end_iso: str, select: list|None=None, page_size: int=100):
+    """calendarView over [start, end), page by page; `select` projects fields (add "body" to get event tags)."""
+    q = {"startDateTime": start_iso, "endDateTime": end_iso}
+    h = auth_headers()
+    prefer = [h.get("Prefer"), f"odata.maxpagesize={int(page_size)}"]
+    if select:
+        q["$select"] = ",".join(select)
+        if "body" in select:
+            prefer.append('outlook.body-content-type="text"')
+    h["Prefer"] = ", ".join(filter(None, prefer))
+    return _pages(f"{GRAPH_BASE}/me/calendarview?{urlencode(q)}", h)
+
+def list_events(start_iso: str, end_iso: str, select: list|None=None, page_size: int=100):
+    return _flatten(iter_events(start_iso, end_iso, select, page_size))
 
 def get_event(event_id: str):
-    url = f"https://graph.microsoft.com/v1.0/me/events/{event_id}"
-    res = requests.get(url, headers=auth_headers())
-    res.raise_for_status()
+    url = f"{GRAPH_BASE}/me/events/{event_id}"
+    res = _send("GET", url, auth_headers())
+    _check(res)
     return res.json()
 
-def create_event(subject: str, start_iso: str, end_iso: str, tz: str="UTC", body: dict|None=None):
-    url = "https://graph.microsoft.com/v1.0/me/events"
-    payload = {
-        "subject": subject,
+def _delta_headers(page_size: int):
+    h = auth_headers()
+    prefer = [f"odata.maxpagesize={int(page_size)}"]
+    if "Prefer" in h:
+        prefer.insert(0, h["Prefer"])
+    h["Prefer"] = ", ".join(prefer)
+    return h
+
+def _delta_pages(h: dict, delta_link: str|None, start_url):
+    """
+    Walk a Graph delta query page by page: yields (items, removed ids) per
+    @odata.nextLink page and returns the new deltaLink.
+    An expired link (410) restarts from start_url(); pages already yielded are
+    replayed by the restart, so consumers must tolerate repeats.
+    """
+    url = delta_link or start_url()
+    new_link = None
+    while url:
+        res = _send("GET", url, h)
+        if res.status_code == 410 and delta_link:
+            # Sync state expired on Graph's side: start over.
+            delta_link, url = None, start_url()
+            continue
+        _check(res)
+        data = res.json()
+        items, removed = [], []
+        for it in data.get("value", []):
+            if "@removed" in it:
+                removed.append(it["id"])
+            else:
+                items.append(it)
+        yield items, removed
+        url = data.get("@odata.nextLink")
+        new_link = data.get("@odata.deltaLink", new_link)
+    return new_link
+
+def _follow_delta(delta_link: str|None, start_url, page_size: int):
+    """
+    Walk a Graph delta query: every @odata.nextLink page until the deltaLink.
+    Returns (items, removed ids, new deltaLink).
+    """
+    pages = _delta_pages(_delta_headers(page_size), delta_link, start_url)
+    items, removed, seen = [], [], set()
+    while True:
+        try:
+            page, gone = next(pages)
+        except StopIteration as stop:
+            return items, removed, stop.value
+        # A 410 restart replays earlier pages: keep each id once
+        items.extend(it for it in page if it.get("id") not in seen)
+        seen.update(it.get("id") for it in page)
+        removed.extend(gone)
+
+def message_delta(delta_link: str|None=None, since: str|None=None, page_size: int=50):
+    """
+    email.delta: new/changed inbox messages since the last sync.
+    - delta_link: the deltaLink returned by the previous call (None = start a new sync)
+    - since: ISO timestamp; on a new sync only messages received after it are returned
+    Returns {"messages": [...], "removed": [ids], "deltaLink": "..."}.
+    """
+    messages, removed, link = _follow_delta(delta_link, _inbox_delta_url(since), page_size)
+    return {"messages": messages, "removed": removed, "deltaLink": link}
+
+def _inbox_delta_url(since: str|None):
+    def start_url():
+        qs = {"$select": "id,subject,from,receivedDateTime,isRead"}
+        if since:
+            qs["$filter"] = f"receivedDateTime ge {since}"
+        return f"{GRAPH_BASE}/me/mailFolders/inbox/messages/delta?{urlencode(qs)}"
+    return start_url
+
+def stream_message_delta(delta_link: str|None=None, since: str|None=None, page_size: int=50):
+    """
+    email.delta with stream=true: one {"messages", "removed"} per Graph page as it
+    arrives; the stream's final result carries the deltaLink.
+    """
+    def pages(inner):
+        while True:
+            try:
+                items, removed = next(inner)
+            except StopIteration as stop:
+                return {"deltaLink": stop.value}
+            yield {"messages": items, "removed": removed}
+
+    return pages(_delta_pages(_delta_headers(page_size), delta_link, _inbox_delta_url(since)))
+
+def event_delta(start_iso: str|None=None, end_iso: str|None=None, delta_link: str|None=None, page_size: int=100):
+    """
+    calendar.delta: calendar view changes for a fixed [start, end) window.
+    The first call (no delta_link) returns every event in the window.
+    Returns {"events": [...], "removed": [ids], "deltaLink": "..."}.
+    """
+    def start_url():
+        if not (start_iso and end_iso):
+            raise RuntimeError("calendar.delta needs start/end to begin a sync")
+        qs = urlencode({"startDateTime": start_iso, "endDateTime": end_iso})
+        return f"{GRAPH_BASE}/me/calendarView/delta?{qs}"
+
+    events, removed, link = _follow_delta(delta_link, start_url, page_size)
+    return {"events": events, "removed": removed, "deltaLink": link}
+
+def _event_payload(start_iso: str, end_iso: str, tz: str="UTC"):
+    return {
         "start": {"dateTime": start_iso, "timeZone": tz},
         "end": {"dateTime": end_iso, "timeZone": tz},
     }
+
+def create_event(subject: str, start_iso: str, end_iso: str, tz: str="UTC", body: dict|None=None):
+    url = f"{GRAPH_BASE}/me/events"
+    payload = {"subject": subject, **_event_payload(start_iso, end_iso, tz)}
     if body:
         payload["body"] = body  # {"contentType":"text","content":"..."}
-    res = requests.post(url, headers=auth_headers(), json=payload)
+    res = _send("POST", url, auth_headers(), json=payload)
     if res.status_code not in (200, 201):
         raise RuntimeError(f"Event creation failed: {res.status_code} {res.text}")
     return res.json()
 
 def update_event_time(event_id: str, start_iso: str, end_iso: str, tz: str="UTC"):
-    url = f"https://graph.microsoft.com/v1.0/me/events/{event_id}"
-    payload = {
-        "start": {"dateTime": start_iso, "timeZone": tz},
-        "end": {"dateTime": end_iso, "timeZone": tz},
-    }
-    res = requests.patch(url, headers=auth_headers(), json=payload)
+    url = f"{GRAPH_BASE}/me/events/{event_id}"
+    payload = _event_payload(start_iso, end_iso, tz)
+    res = _send("PATCH", url, auth_headers(), json=payload, idempotent=True)  # sets absolute times
     if res.status_code not in (200, 202):
         raise RuntimeError(f"Event update failed: {res.status_code} {res.text}")
     return res.json()
 
 def delete_event(event_id: str):
-    url = f"https://graph.microsoft.com/v1.0/me/events/{event_id}"
-    res = requests.delete(url, headers=auth_headers())
-    if res.status_code not in (204,):
+    url = f"{GRAPH_BASE}/me/events/{event_id}"
+    res = _send("DELETE", url, auth_headers())
+    # 404 after a retry: the first attempt deleted it but its reply was lost
+    if res.status_code != 204 and not (res.status_code == 404 and res.retries):
         raise RuntimeError(f"Event delete failed: {res.status_code} {res.text}")
     return {"ok": True}
 
-# ------------ JSON-RPC TCP loop -------------
+# ------------ Change notifications (push) -------------
+SUBSCRIPTION_MINUTES = int(os.getenv("AGENT_NOTIFY_MINUTES", "4200"))  # Graph caps mail subscriptions just under 3 days
+
+def _expiry(minutes: int):
+    return (datetime.now(timezone.utc) + timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:%S.0000000Z")
+
+def create_subscription(notification_url: str, client_state: str="", resource: str="me/mailFolders('inbox')/messages",
+                        change_type: str="created", minutes: int|None=None):
+    """Graph validates notification_url (validationToken handshake) before answering."""
+    payload = {
+        "changeType": change_type,
+        "notificationUrl": notification_url,
+        "resource": resource,
+        "expirationDateTime": _expiry(minutes or SUBSCRIPTION_MINUTES),
+    }
+    if client_state:
+        payload["clientState"] = client_state
+    res = _send("POST", f"{GRAPH_BASE}/subscriptions", auth_headers(), json=payload)
+    if res.status_code not in (200, 201):
+        raise RuntimeError(f"Subscription create failed: {res.status_code} {res.text}")
+    return res.json()
+
+def renew_subscription(sub_id: str, minutes: int|None=None):
+    res = _send("PATCH", f"{GRAPH_BASE}/subscriptions/{sub_id}", auth_headers(), idempotent=True,
+                json={"expirationDateTime": _expiry(minutes or SUBSCRIPTION_MINUTES)})
+    if res.status_code != 200:
+        raise RuntimeError(f"Subscription renew failed: {res.status_code} {res.text}")
+    return res.json()
+
+def delete_subscription(sub_id: str):
+    res = _send("DELETE", f"{GRAPH_BASE}/subscriptions/{sub_id}", auth_headers())
+    if res.status_code not in (204, 404):
+        raise RuntimeError(f"Subscription delete failed: {res.status_code} {res.text}")
+    return {"ok": True}
+
+# ------------ Graph JSON $batch -------------
+def graph_batch(sub_requests: list, ordered: bool=False):
+    """
+    Run sub-requests through Graph's $batch endpoint, GRAPH_BATCH_LIMIT per HTTP call.
+    Each sub-request is {"method": "GET", "url": "/me/...", "body": {...}?, "key": ...?}.
+    Returns [(status, body)] in input order. Chunks are sent concurrently unless
+    `ordered`, in which case they go one after another and sub-requests sharing a
+    "key" are chained with dependsOn (Graph otherwise runs them in any order).
+    Sub-requests Graph throttles (429, or 503/504 for reads; 424 behind them when
+    ordered) are sent again, after the longest Retry-After among them.
+    """
+    headers = auth_headers()
+    sub_headers = {k: v for k, v in headers.items() if k == "Prefer"}
+
+    def post(chunk):
+        """[(status, body, headers)] for one $batch call."""
+        reqs, last_for_key = [], {}
+        for n, sub in enumerate(chunk):
+            r = {"id": str(n), "method": sub["method"], "url": sub["url"], "headers": dict(sub_headers)}
+            if sub.get("body") is not None:
+                r["body"] = sub["body"]
+                r["headers"]["Content-Type"] = "application/json"
+            key = sub.get("key")
+            if ordered and key is not None:
+                if key in last_for_key:
+                    r["dependsOn"] = [last_for_key[key]]
+                last_for_key[key] = r["id"]
+            reqs.append(r)
+        res = _send("POST", f"{GRAPH_BASE}/$batch", headers, json={"requests": reqs}, cost=len(chunk),
+                    idempotent=all(sub["method"] == "GET" for sub in chunk), resource=_resource(chunk[0]["url"]))
+        _check(res)
+        out = [(0, None, None)] * len(chunk)
+        # Graph may answer sub-requests in any order; put them back by id.
+        for r in res.json().get("responses", []):
+            out[int(r["id"])] = (int(r.get("status", 0)), r.get("body"), r.get("headers"))
+        return out
+
+    def send_chunk(offset):
+        chunk = sub_requests[offset:offset + GRAPH_BATCH_LIMIT]
+        out = [(0, None)] * len(chunk)
+        todo = list(range(len(chunk)))
+        for attempt in range(GRAPH_RETRIES + 1):
+            retry, hints = [], []
+            for i, (status, body, sub_hdrs) in zip(todo, post([chunk[i] for i in todo])):
+                out[i] = (status, body)
+                if attempt < GRAPH_RETRIES and (_retriable(status, chunk[i]["method"], None)
+                                                or (ordered and status == 424)):
+                    retry.append(i)
+                    hints.append(_retry_after(sub_hdrs))
+            if not retry:
+                break
+            wait = max((h for h in hints if h is not None), default=None)
+            if wait is not None and wait > GRAPH_MAX_WAIT:
+                break  # leave them as errors rather than hold the thread
+            wait = wait if wait is not None else _backoff(attempt)
+            if _past_deadline(wait):
+                break  # the caller gives up before then
+            if any(out[i][0] == 429 for i in retry):
+                registry.inc("graph_throttled_total", len(retry), resource=_resource(chunk[0]["url"]))
+            registry.inc("graph_retries_total", len(retry), resource=_resource(chunk[0]["url"]))
+            time.sleep(wait)
+            todo = retry
+        return out
+
+    offsets = range(0, len(sub_requests), GRAPH_BATCH_LIMIT)
+    if ordered:
+        parts = map(send_chunk, offsets)
+    else:
+        # Pool threads don't inherit contextvars: each chunk runs in a copy (account, deadline)
+        futures = [_batch_executor.submit(contextvars.copy_context().run, send_chunk, o) for o in offsets]
+        parts = (f.result() for f in futures)
+    results = []
+    for part in parts:
+        results.extend(part)
+    return results
+
+def _batch_item(key, status, body, ok=(200,)):
+    if status in ok:
+        return body if body is not None else {"ok": True}
+    err = (body or {}).get("error", {}) if isinstance(body, dict) else {}
+    return {"id": key, "error": {"status": status, "message": err.get("message") or f"HTTP {status}"}}
+
+def get_messages(ids: list):
+    """email.get_many: full messages in input order; failures become {"id", "error"} items."""
+    subs = [{"method": "GET", "url": f"/me/messages/{i}?$select={MESSAGE_SELECT}"} for i in ids]
+    return [_batch_item(i, st, body) for i, (st, body) in zip(ids, graph_batch(subs))]
+
+def get_events(ids: list):
+    """calendar.get_many: full events in input order; failures become {"id", "error"} items."""
+    subs = [{"method": "GET", "url": f"/me/events/{i}"} for i in ids]
+    return [_batch_item(i, st, body) for i, (st, body) in zip(ids, graph_batch(subs))]
+
+def apply_changes(changes: list):
+    """
+    calendar.apply_changes: create/update/delete events in as few HTTP calls as possible.
+    Each change is {"op": "create", "subject", "start", "end", "tz"?, "body"?},
+    {"op": "update", "id", "start", "end", "tz"?} or {"op": "delete", "id"}.
+    Returns one result per change, in order (event JSON, {"ok": True} or {"id", "error"}).
+    """
+    subs, oks = [], []
+    for ch in changes:
+        op = ch.get("op")
+        tz = ch.get("tz", "UTC")
+        if op == "create":
+            payload = {"subject": ch["subject"], **_event_payload(ch["start"], ch["end"], tz)}
+            if ch.get("body"):
+                payload["body"] = ch["body"]
+            subs.append({"method": "POST", "url": "/me/events", "body": payload})
+            oks.append((200, 201))
+        elif op == "update":
+            subs.append({"method": "PATCH", "url": f"/me/events/{ch['id']}", "key": ch["id"],
+                         "body": _event_payload(ch["start"], ch["end"], tz)})
+            oks.append((200, 202))
+        elif op == "delete":
+            subs.append({"method": "DELETE", "url": f"/me/events/{ch['id']}", "key": ch["id"]})
+            oks.append((204,))
+        else:
+            raise RuntimeError(f"Unknown change op: {op}")
+    return [
+        _batch_item(ch.get("id"), st, body, ok)
+        for ch, ok, (st, body) in zip(changes, oks, graph_batch(subs, ordered=True))
+    ]
+
+# ------------ JSON-RPC dispatch (transport lives in mcp_core) -------------
+def _budget(params: dict) -> float|None:
+    """Seconds this request may take: the caller's timeout less a margin for the reply."""
+    timeout = float(params.get("timeout") or CLIENT_TIMEOUT)
+    return timeout - min(DEADLINE_MARGIN, timeout / 2) if timeout > 0 else None
+
 def handle_request(req: dict):
-    method = req.get("method")
     params = req.get("params") or {}
+    budget = _budget(params)
+    token = _account.set(params.get("account") or None)
+    # From arrival, not from now: time spent queued for a slot in mcp_core counts against the caller
+    deadline = _deadline.set(None if budget is None else (arrival() or time.monotonic()) + budget)
+    try:
+        result = _dispatch(req.get("method"), params)
+        if inspect.isgenerator(result):
+            # mcp_core pulls the pages later, on executor threads: keep this request's account
+            return _in_context(result, contextvars.copy_context(), budget)
+        return result
+    finally:
+        _deadline.reset(deadline)
+        _account.reset(token)
+
+def _in_context(pages, ctx, budget: float|None=None):
+    """
+    Advance a streamed result inside ctx; its return value (e.g. a deltaLink) is kept.
+    The caller waits up to its timeout per page, so each page gets a fresh deadline.
+    """
+    try:
+        while True:
+            if budget is not None:
+                ctx.run(_deadline.set, time.monotonic() + budget)
+            try:
+                page = ctx.run(next, pages)
+            except StopIteration as stop:
+                return stop.value
+            yield page
+    finally:
+        ctx.run(pages.close)
+
+def _dispatch(method, params):
+    # stream=true (MCPClient.stream): pages go out as Graph returns them
+    stream = bool(params.get("stream"))
     if method == "email.list":
-        return list_messages(top=params.get("top", 10))
+        pages = iter_messages(params.get("top", 10), params.get("page_size", 50))
+        return pages if stream else _flatten(pages)
     if method == "email.get":
         return get_message(params["id"])
+    if method == "email.delta":
+        if stream:
+            return stream_message_delta(params.get("deltaLink"), params.get("since"), params.get("page_size", 50))
+        return message_delta(params.get("deltaLink"), params.get("since"), params.get("page_size", 50))
     if method == "calendar.list":
-        return list_events(params["start"], params["end"])
+        pages = iter_events(params["start"], params["end"], params.get("select"), params.get("page_size", 100))
+        return pages if stream else _flatten(pages)
     if method == "calendar.get":
         return get_event(params["id"])
+    if method == "calendar.delta":
+        return event_delta(params.get("start"), params.get("end"), params.get("deltaLink"), params.get("page_size", 100))
     if method == "calendar.create":
         return create_event(params["subject"], params["start"], params["end"], params.get("tz","UTC"), params.get("body"))
     if method == "calendar.update":
         return update_event_time(params["id"], params["start"], params["end"], params.get("tz","UTC"))
     if method == "calendar.delete":
         return delete_event(params["id"])
+    if method == "email.get_many":
+        return get_messages(params["ids"])
+    if method == "calendar.get_many":
+        return get_events(params["ids"])
+    if method == "calendar.apply_changes":
+        return apply_changes(params["changes"])
+    if method == "subscription.create":
+        return create_subscription(params["notificationUrl"], params.get("clientState", ""),
+                                   params.get("resource", "me/mailFolders('inbox')/messages"),
+                                   params.get("changeType", "created"), params.get("minutes"))
+    if method == "subscription.renew":
+        return renew_subscription(params["id"], params.get("minutes"))
+    if method == "subscription.delete":
+        return delete_subscription(params["id"])
     raise RuntimeError(f"Unknown method: {method}")
 
-def serve_client(conn):
-    try:
-        data = b""
-        while True:
-            chunk = conn.recv(65536)
-            if not chunk:
-                break
-            data += chunk
-        if not data:
-            return
-
-        # Take the last complete line for robustness
-        try:
-            req = json.loads(data.decode("utf-8").splitlines()[-1])
-        except Exception as e:
-            # Malformed request → proper JSON-RPC error object
-            resp = {
-                "jsonrpc": "2.0",
-                "id": None,
-                "error": {"code": -32700, "message": f"Parse error: {e}"}
-            }
-            conn.sendall((json.dumps(resp) + "\n").encode("utf-8"))
-            return
-
-        try:
-            result = handle_request(req)
-            resp = {"jsonrpc": "2.0", "id": req.get("id"), "result": result}
-        except Exception as e:
-            # Always return a JSON-RPC compliant error object
-            resp = {
-                "jsonrpc": "2.0",
-                "id": req.get("id"),
-                "error": {"code": -32000, "message": str(e)}
-            }
-
-        conn.sendall((json.dumps(resp) + "\n").encode("utf-8"))
-    finally:
-        conn.close()
-
-
 def run():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((HOST, PORT))
-        s.listen(20)
-        print(f"[MCP-Graph] Listening on {HOST}:{PORT}")
-        while True:
-            conn, _ = s.accept()
-            threading.Thread(target=serve_client, args=(conn,), daemon=True).start()
+    serve(handle_request, HOST, PORT, name="MCP-Graph", metrics_port=METRICS_PORT)
 
 if __name__ == "__main__":
-    run()
+    if len(sys.argv) == 3 and sys.argv[1] == "--login":
+        _token_manager(sys.argv[2]).get()
+        print(f"✅ Signed in; token cache at {cache_path(sys.argv[2])}")
+    else:
+        run()
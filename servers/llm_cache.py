@@ -0,0 +1,114 @@
+# servers/llm_cache.py
+# Content-addressed cache for LLM responses: key = sha256(model, normalized prompt).
+# A small in-memory LRU sits in front of a SQLite file so hits survive restarts.
+# Entries expire after `ttl` seconds; the file is trimmed (least recently used
+# first) once it holds more than `max_bytes` of responses.
+import hashlib, json, re, sqlite3, threading, time
+from collections import OrderedDict
+
+_WS = re.compile(r"\s+")
+
+def cache_key(model: str, prompt: str) -> str:
+    normalized = _WS.sub(" ", prompt).strip()
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+class LLMCache:
+    def __init__(self, path: str, ttl: float=7 * 86400, mem_entries: int=512, max_bytes: int=64 * 2**20):
+        self.ttl = ttl
+        self.mem_entries = mem_entries
+        self.max_bytes = max_bytes
+        self._mem = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, used_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache(used_at)")
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self.counters = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and now - hit[0] < self.ttl:
+                self._mem.move_to_end(key)
+                self.counters["hits_memory"] += 1
+                return hit[1]
+            row = self._db.execute("SELECT value, created_at, size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                with self._db:
+                    self._db.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (now, key))
+                value = json.loads(row[0])
+                self._remember(key, row[1], value)
+                self.counters["hits_disk"] += 1
+                return value
+            if row:  # stale
+                with self._db:
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._disk_bytes -= row[2]
+                self.counters["expired"] += 1
+            self._mem.pop(key, None)
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        now = time.time()
+        raw = json.dumps(value)
+        with self._lock:
+            old = self._db.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache(key, value, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, raw, len(raw), now, now),
+                )
+            self._disk_bytes += len(raw) - (old[0] if old else 0)
+            self._remember(key, now, value)
+            self.counters["stores"] += 1
+            self._trim_disk()
+
+    def _remember(self, key, created_at, value):
+        self._mem[key] = (created_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    def _trim_disk(self):
+        # Caller holds the lock. Drop expired rows first, then least recently used.
+        if self._disk_bytes <= self.max_bytes:
+            return
+        cutoff = time.time() - self.ttl
+        with self._db:
+            self._db.execute("DELETE FROM llm_cache WHERE created_at < ?", (cutoff,))
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        while self._disk_bytes > self.max_bytes:
+            victims = []
+            for k, size in self._db.execute("SELECT key, size FROM llm_cache ORDER BY used_at LIMIT 64"):
+                if self._disk_bytes <= self.max_bytes:
+                    break
+                victims.append(k)
+                self._mem.pop(k, None)
+                self._disk_bytes -= size
+                self.counters["evictions"] += 1
+            if not victims:
+                break
+            with self._db:
+                self._db.executemany("DELETE FROM llm_cache WHERE key = ?", [(k,) for k in victims])
+
+    def stats(self):
+        with self._lock:
+            total = self.counters["hits_memory"] + self.counters["hits_disk"] + self.counters["misses"]
+            hits = self.counters["hits_memory"] + self.counters["hits_disk"]
+            entries = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            return {
+                **self.counters,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+                "memory_entries": len(self._mem),
+                "disk_entries": entries,
+                "disk_bytes": self._disk_bytes,
+            }
@@ -0,0 +1,284 @@
+# servers/mcp_core.py
+# Shared asyncio JSON-RPC core for the Graph and Gemini MCP servers.
+#
+# Each server only provides a blocking handle_request(req) -> result. The core owns
+# the sockets (one request per line, many per connection, batches as JSON arrays),
+# runs handlers on a sized thread pool, and applies backpressure: at most
+# MAX_INFLIGHT requests run at once, at most MAX_QUEUE wait for a slot, and anything
+# beyond that is answered immediately with a "server busy" error. SIGINT/SIGTERM
+# stop accepting, drain in-flight calls (up to SHUTDOWN_GRACE seconds) and exit.
+#
+# Every request is timed into src/metrics (mcp_server_* by server and method, plus
+# slot wait and rejections); a "trace_id" param becomes the handler's trace. The
+# core itself answers metrics.get, and serve(metrics_port=...) adds a Prometheus endpoint.
+#
+# Wire format: lines by default; a client that sends mcp.negotiate first switches its
+# connection to length-prefixed, optionally zlib-compressed frames (src/wire.py).
+# A handler may return a generator to stream its result page by page: each page goes
+# out as {"id", "partial": page} as soon as it's ready, then a final
+# {"id", "result": {"stream_end": true, "pages": n, ...generator's return value}}.
+# arrival() tells a handler when its request reached the server, before any time spent
+# waiting for a slot, so it can keep its own waits inside the caller's timeout.
+
+import asyncio, contextlib, contextvars, inspect, json, os, signal, time
+from concurrent.futures import ThreadPoolExecutor
+
+from src import metrics, wire
+from src.metrics import registry
+
+MAX_WORKERS = int(os.environ.get("MCP_MAX_WORKERS", "16"))       # executor threads
+MAX_INFLIGHT = int(os.environ.get("MCP_MAX_INFLIGHT", "16"))     # requests running at once
+MAX_QUEUE = int(os.environ.get("MCP_MAX_QUEUE", "64"))           # requests waiting for a slot
+SHUTDOWN_GRACE = float(os.environ.get("MCP_SHUTDOWN_GRACE", "30"))  # seconds to drain on stop
+MAX_LINE = 64 * 1024 * 1024  # largest single request line we accept
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+SERVER_ERROR = -32000
+SERVER_BUSY = -32001
+
+
+_arrival = contextvars.ContextVar("arrival", default=None)
+
+
+def _error(rid, code, message):
+    return {"jsonrpc": "2.0", "id": rid, "error": {"code": code, "message": message}}
+
+
+def arrival():
+    """time.monotonic() when the request being handled reached the server; None outside one."""
+    return _arrival.get()
+
+
+class MCPServer:
+    def __init__(self, handler, host, port, name="MCP",
+                 max_workers=MAX_WORKERS, max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE):
+        self.handler = handler
+        self.host = host
+        self.port = port
+        self.name = name
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = None  # asyncio.Semaphore, created inside the loop
+        self._max_inflight = max_inflight
+        self._queued = 0
+        self._closing = False
+        self._tasks = set()    # request tasks in flight
+        self._conns = {}       # connection task -> writer
+
+    # ---------- request dispatch ----------
+    async def _call(self, req, emit=None):
+        if not isinstance(req, dict):
+            return _error(None, INVALID_REQUEST, "Invalid Request")
+        rid = req.get("id")
+        arrived = time.monotonic()
+        if req.get("method") == "metrics.get":
+            # Answered inline: observability must not queue behind the work it observes
+            return {"jsonrpc": "2.0", "id": rid, "result": metrics.handle_rpc(req.get("params"))}
+        if self._closing:
+            registry.inc("mcp_server_rejected_total", server=self.name, reason="closing")
+            return _error(rid, SERVER_BUSY, "Server busy: shutting down")
+        if self._slots.locked() and self._queued >= self.max_queue:
+            registry.inc("mcp_server_rejected_total", server=self.name, reason="queue_full")
+            return _error(rid, SERVER_BUSY, "Server busy: too many queued requests")
+
+        self._queued += 1
+        registry.gauge_set("mcp_server_queued", self._queued, server=self.name)
+        t0 = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._queued -= 1
+            registry.gauge_set("mcp_server_queued", self._queued, server=self.name)
+        registry.observe("mcp_server_wait_seconds", time.perf_counter() - t0, server=self.name)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, self._run, req, arrived)
+            if inspect.isgenerator(result):
+                result = await self._stream(rid, result, emit)
+            return {"jsonrpc": "2.0", "id": rid, "result": result}
+        except Exception as e:
+            # Always return a JSON-RPC compliant error object
+            return _error(rid, SERVER_ERROR, str(e))
+        finally:
+            self._slots.release()
+
+    async def _stream(self, rid, gen, emit):
+        """
+        Send a generator's pages as partial responses (the slot stays held, so a stream
+        counts as one in-flight request). Without emit (inside a batch) the pages are
+        collected into the final result instead.
+        """
+        loop = asyncio.get_running_loop()
+        pages, collected = 0, []
+        try:
+            while True:
+                done, value = await loop.run_in_executor(self._executor, _advance, gen)
+                if done:
+                    break
+                pages += 1
+                if emit is None:
+                    collected.append(value)
+                else:
+                    await emit({"jsonrpc": "2.0", "id": rid, "partial": value})
+        finally:
+            gen.close()
+        registry.inc("mcp_server_stream_pages_total", pages, server=self.name)
+        final = {"stream_end": True, "pages": pages, **(value or {})}
+        if emit is None:
+            final["partials"] = collected
+        return final
+
+    def _run(self, req, arrived=None):
+        """The handler, timed, under the caller's trace (runs on the executor)."""
+        method = req.get("method")
+        params = req.get("params")
+        trace = params.get("trace_id") if isinstance(params, dict) else None
+        traced = metrics.span(f"{self.name} {method}", trace=trace, histogram=False) if trace else contextlib.nullcontext()
+        token = _arrival.set(arrived)
+        try:
+            with registry.timed("mcp_server", server=self.name, method=method), traced:
+                return self.handler(req)
+        finally:
+            _arrival.reset(token)
+
+    async def _respond(self, req, emit=None):
+        if isinstance(req, list):
+            # JSON-RPC batch: calls are independent, so run them concurrently and
+            # answer with the responses in request order.
+            if not req:
+                return _error(None, INVALID_REQUEST, "Invalid Request: empty batch")
+            return list(await asyncio.gather(*(self._call(r) for r in req)))
+        return await self._call(req, emit)
+
+    # ---------- connections ----------
+    async def _handle_message(self, raw, flags, conn):
+        try:
+            req = wire.decode(raw, flags)
+        except Exception as e:
+            # Malformed request → proper JSON-RPC error object
+            resp = _error(None, PARSE_ERROR, f"Parse error: {e}")
+        else:
+            resp = await self._respond(req, conn.send)
+        await conn.send(resp)
+
+    async def _serve_conn(self, reader, writer):
+        self._conns[asyncio.current_task()] = writer
+        conn = _Conn(writer)
+        pending = set()
+        try:
+            while not self._closing:
+                try:
+                    if conn.framed:
+                        n, flags = wire.header(await reader.readexactly(wire.HEADER.size))
+                        raw = await reader.readexactly(n)
+                    else:
+                        raw, flags = await reader.readline(), 0
+                except asyncio.IncompleteReadError:
+                    break
+                except (ConnectionError, OSError, ValueError):
+                    break
+                if not raw:
+                    break
+                if not conn.framed:
+                    if not raw.strip():
+                        continue
+                    if wire.NEGOTIATE.encode() in raw and await self._negotiate(raw, conn):
+                        continue
+                # Pipelined requests run side by side; clients match replies by id.
+                t = asyncio.ensure_future(self._handle_message(raw, flags, conn))
+                pending.add(t)
+                self._tasks.add(t)
+                t.add_done_callback(pending.discard)
+                t.add_done_callback(self._tasks.discard)
+            # One-shot clients half-close after sending; finish their replies first.
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            self._conns.pop(asyncio.current_task(), None)
+            writer.close()
+
+    async def _negotiate(self, raw, conn):
+        """Answer mcp.negotiate (always the client's first message) and switch framing."""
+        try:
+            req = json.loads(raw)
+        except ValueError:
+            return False
+        if not isinstance(req, dict) or req.get("method") != wire.NEGOTIATE:
+            return False
+        agreed = wire.accept(req.get("params"))
+        await conn.send({"jsonrpc": "2.0", "id": req.get("id"), "result": agreed})
+        conn.framed = agreed["framing"] == wire.FRAMED
+        conn.compress = bool(agreed["compress"])
+        return True
+
+    # ---------- lifecycle ----------
+    async def serve_forever(self):
+        self._slots = asyncio.Semaphore(self._max_inflight)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # e.g. Windows: Ctrl+C still interrupts, just without draining
+
+        server = await asyncio.start_server(self._serve_conn, self.host, self.port, limit=MAX_LINE)
+        print(f"[{self.name}] Listening on {self.host}:{self.port}")
+        async with server:
+            await stop.wait()
+            await self.shutdown(server)
+
+    async def shutdown(self, server=None):
+        """Stop accepting, let in-flight requests finish, then close everything."""
+        self._closing = True
+        if server is not None:
+            server.close()
+        if self._tasks:
+            print(f"[{self.name}] Draining {len(self._tasks)} in-flight request(s)...")
+            await asyncio.wait(set(self._tasks), timeout=SHUTDOWN_GRACE)
+        conns = dict(self._conns)
+        for w in conns.values():
+            w.close()  # wakes idle readers with EOF
+        if conns:
+            await asyncio.wait(set(conns), timeout=1)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        print(f"[{self.name}] Stopped.")
+
+
+def _advance(gen):
+    """next() that reports the end instead of raising: (done, page or return value)."""
+    try:
+        return False, next(gen)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+class _Conn:
+    """One client connection's write side: its framing, compression and write lock."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.framed = False
+        self.compress = False
+        self._lock = asyncio.Lock()
+
+    async def send(self, msg):
+        payload = wire.dumps(msg)
+        parts = wire.frame(payload, self.compress) if self.framed else (payload, b"\n")
+        try:
+            async with self._lock:
+                self.writer.writelines(parts)
+                await self.writer.drain()
+        except (ConnectionError, OSError):
+            pass  # client went away
+
+
+def serve(handler, host, port, name="MCP", metrics_port: int=0, **kwargs):
+    """Run an MCP server for `handler` until SIGINT/SIGTERM (metrics_port: Prometheus endpoint, 0 = off)."""
+    if metrics_port:
+        metrics.serve_http(metrics_port)
+    try:
+        asyncio.run(MCPServer(handler, host, port, name, **kwargs).serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,71 @@
+# src/accounts.py
+# The mailboxes the agent serves.
+# - AGENT_ACCOUNTS="alice@contoso.com,bob@contoso.com", or AGENT_ACCOUNTS_FILE pointing at
+#   a JSON list of {"id": ..., "rate_per_min": ..., "max_emails": ...} for per-account overrides
+# - unset: the single legacy mailbox (account None), with its state in the working directory
+# Each account gets its own state directory (processed emails, event metadata, delta link)
+# under AGENT_STATE_DIR, and its Graph requests are tagged with the account id so the
+# Graph server picks that account's token cache.
+import json, os, re, threading, time
+from dataclasses import dataclass
+
+ACCOUNTS = os.getenv("AGENT_ACCOUNTS", "")
+ACCOUNTS_FILE = os.getenv("AGENT_ACCOUNTS_FILE", "")
+STATE_DIR = os.getenv("AGENT_STATE_DIR", "state")
+ACCOUNT_RATE = float(os.getenv("AGENT_ACCOUNT_RATE", "60"))        # emails per minute per account
+ACCOUNT_MAX_EMAILS = int(os.getenv("AGENT_ACCOUNT_MAX_EMAILS", "50"))  # per cycle, so one flood can't hog a worker
+
+@dataclass
+class Account:
+    id: str|None
+    rate_per_min: float = ACCOUNT_RATE
+    max_emails: int = ACCOUNT_MAX_EMAILS
+
+    @property
+    def label(self):
+        return self.id or "default"
+
+    @property
+    def state_dir(self):
+        """Where this account's stores live ("" = working directory, the single-mailbox layout)."""
+        if self.id is None:
+            return ""
+        return os.path.join(STATE_DIR, re.sub(r"[^\w.@-]", "_", self.id))
+
+def load_accounts() -> list:
+    """Configured accounts; an empty list means single-mailbox mode."""
+    if ACCOUNTS_FILE:
+        with open(ACCOUNTS_FILE, "r", encoding="utf-8") as f:
+            return [Account(a["id"], float(a.get("rate_per_min", ACCOUNT_RATE)), int(a.get("max_emails", ACCOUNT_MAX_EMAILS)))
+                    for a in json.load(f)]
+    return [Account(a.strip()) for a in ACCOUNTS.split(",") if a.strip()]
+
+class RateBudget:
+    """Token bucket of emails: refills at rate_per_min, holds at most a minute's worth."""
+    def __init__(self, rate_per_min: float):
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1.0, rate_per_min)
+        self.tokens = self.capacity
+        self._at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._at) * self.rate)
+        self._at = now
+
+    def available(self) -> int:
+        with self._lock:
+            self._refill()
+            return int(self.tokens)
+
+    def spend(self, n: int):
+        with self._lock:
+            self._refill()
+            self.tokens -= n
+
+    def wait_for(self, n: int=1) -> float:
+        """Seconds until n emails' worth is available."""
+        with self._lock:
+            self._refill()
+            return max(0.0, (n - self.tokens) / self.rate) if self.rate else float("inf")
@@ -0,0 +1,119 @@
+# src/availability.py
+# Free/busy index for the scheduler.
+# Busy intervals are kept sorted and merged (disjoint), so "is this free?" and
+# "earliest slot of length D before the deadline" are bisect lookups plus a short
+# walk over the gaps, instead of testing every candidate against every event.
+# Raw intervals are kept too, so a single event can be removed again (moves/deletes).
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, time as dtime, date as ddate
+
+class AvailabilityIndex:
+    def __init__(self, intervals=()):
+        self._raw = []     # sorted (start_ts, end_ts) as inserted, duplicates allowed
+        self._starts = []  # merged, disjoint busy blocks: parallel sorted lists
+        self._ends = []
+        if intervals:
+            self._raw = sorted((s.timestamp(), e.timestamp()) for s, e in intervals if e > s)
+            self._starts, self._ends = self._merge(self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    @staticmethod
+    def _merge(raw):
+        starts, ends = [], []
+        for s, e in raw:
+            if ends and s <= ends[-1]:
+                if e > ends[-1]:
+                    ends[-1] = e
+            else:
+                starts.append(s)
+                ends.append(e)
+        return starts, ends
+
+    # ---------- updates ----------
+    def add(self, start: datetime, end: datetime):
+        s, e = start.timestamp(), end.timestamp()
+        if e <= s:
+            return
+        insort(self._raw, (s, e))
+        i = bisect_left(self._ends, s)     # first block that ends at/after s
+        j = bisect_right(self._starts, e)  # blocks starting at/before e
+        if i < j:
+            s = min(s, self._starts[i])
+            e = max(e, self._ends[j - 1])
+        self._starts[i:j] = [s]
+        self._ends[i:j] = [e]
+
+    def remove(self, start: datetime, end: datetime) -> bool:
+        """Remove one interval previously added with the same bounds."""
+        s, e = start.timestamp(), end.timestamp()
+        k = bisect_left(self._raw, (s, e))
+        if k >= len(self._raw) or self._raw[k] != (s, e):
+            return False
+        del self._raw[k]
+        # Rebuild only the merged block that contained it
+        b = bisect_right(self._starts, s) - 1
+        bs, be = self._starts[b], self._ends[b]
+        lo = bisect_left(self._raw, (bs, float("-inf")))
+        hi = bisect_right(self._raw, (be, float("inf")))
+        starts, ends = self._merge(self._raw[lo:hi])
+        self._starts[b:b + 1] = starts
+        self._ends[b:b + 1] = ends
+        return True
+
+    # ---------- queries ----------
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        s, e = start.timestamp(), end.timestamp()
+        i = bisect_right(self._ends, s)  # first block ending after s
+        return i >= len(self._starts) or self._starts[i] >= e
+
+    def busy_blocks(self, start: datetime, end: datetime):
+        """Merged busy blocks overlapping [start, end), as (start_ts, end_ts)."""
+        s, e = start.timestamp(), end.timestamp()
+        i = bisect_right(self._ends, s)
+        out = []
+        while i < len(self._starts) and self._starts[i] < e:
+            out.append((self._starts[i], self._ends[i]))
+            i += 1
+        return out
+
+    def first_fit(self, window_start: datetime, window_end: datetime, duration: timedelta, step: timedelta|None=None):
+        """
+        Earliest [t, t+duration) inside the window that touches no busy block.
+        With `step`, t stays on the grid window_start + k*step (how find_slot scans).
+        """
+        ws, we, d = window_start.timestamp(), window_end.timestamp(), duration.total_seconds()
+        st = step.total_seconds() if step else 0
+        t = ws
+        i = bisect_right(self._ends, t)
+        while t + d <= we:
+            if i >= len(self._starts) or self._starts[i] >= t + d:
+                return datetime.fromtimestamp(t, window_start.tzinfo), datetime.fromtimestamp(t + d, window_start.tzinfo)
+            # Blocked: jump past this block (onto the grid) and look at the next one
+            t = self._ends[i]
+            if st:
+                t = ws + -(-(t - ws) // st) * st
+            i = bisect_right(self._ends, t, i)
+        return None
+
+    def earliest_slot(self, not_before: datetime, deadline: datetime, duration_min: int,
+                      work_start: dtime, work_end: dtime, step_min: int|None=30):
+        """Earliest free slot of `duration_min` inside daily work hours in [not_before, deadline]."""
+        tz = not_before.tzinfo
+        duration = timedelta(minutes=duration_min)
+        step = timedelta(minutes=step_min) if step_min else None
+        day, last_day = not_before.date(), deadline.date()
+        while day <= last_day:
+            day_start = datetime.combine(day, work_start, tzinfo=tz)
+            day_end = datetime.combine(day, work_end, tzinfo=tz)
+            if day == not_before.date():
+                day_start = max(day_start, not_before)
+            if day == last_day:
+                day_end = min(day_end, deadline)
+            if day_start < day_end:
+                slot = self.first_fit(day_start, day_end, duration, step)
+                if slot:
+                    return slot
+            day = ddate.fromordinal(day.toordinal() + 1)
+        return None
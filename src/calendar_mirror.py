@@ -0,0 +1,165 @@
+# src/calendar_mirror.py
+# In-process copy of the calendar over the scheduling horizon.
+#
+# CalendarMirror quacks like MCPClient for the calendar methods the scheduler uses,
+# so process_task/find_slot/_try_make_room run unchanged against it:
+# - calendar.list is answered locally (inside the horizon)
+# - calendar.create/update/delete/apply_changes go to Graph and their results are
+#   applied to the mirror (write-through), keeping it and its free/busy index current
+# - everything else is forwarded as-is
+# It is loaded once (one calendar.delta/list call) and can be refreshed cheaply
+# from Graph's calendar delta between cycles.
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from dateutil import parser as date_parser
+
+from clients.mcp_client import MCPClient
+from src.availability import AvailabilityIndex
+
+UTC = ZoneInfo("UTC")
+
+def event_time(ev, key):
+    """Aware datetime for ev[key] ("start"/"end"), honouring its timeZone field."""
+    node = ev.get(key) or {}
+    dt = date_parser.parse(node["dateTime"])
+    if dt.tzinfo is None:
+        try:
+            dt = dt.replace(tzinfo=ZoneInfo(node.get("timeZone") or "UTC"))
+        except Exception:
+            dt = dt.replace(tzinfo=UTC)
+    return dt
+
+class CalendarMirror:
+    def __init__(self, client: MCPClient, horizon_days: int=31, use_delta: bool=True, store=None):
+        self.client = client
+        self.store = store   # optional EventStore: deletions/moves seen via delta are applied to it
+        self.horizon_days = horizon_days
+        self.use_delta = use_delta
+        self._events = {}    # id -> event json
+        self._spans = {}     # id -> (start, end) as indexed
+        self._index = AvailabilityIndex()
+        self._window = None  # (start, end) covered by the mirror
+        self._delta_link = None
+        self._stale = False
+        self.loaded = False
+
+    # ---------- loading ----------
+    def load(self):
+        now = datetime.now(UTC)
+        start, end = now - timedelta(days=1), now + timedelta(days=self.horizon_days)
+        params = {"start": start.isoformat(), "end": end.isoformat()}
+        events, self._delta_link = None, None
+        if self.use_delta:
+            try:
+                res = self.client.call("calendar.delta", params) or {}
+                events, self._delta_link = res.get("events", []), res.get("deltaLink")
+            except Exception:
+                self.use_delta = False  # older server: plain listing it is
+        if events is None:
+            events = self.client.call("calendar.list", params) or []
+        self._events, self._spans, self._index = {}, {}, AvailabilityIndex()
+        for ev in events:
+            self._put(ev)
+        self._window = (start, end)
+        self._stale = False
+        self.loaded = True
+
+    def refresh(self):
+        """Pick up changes made outside the agent; reload when the window went stale."""
+        self._stale = False
+        now = datetime.now(UTC)
+        if not self.loaded or not self._delta_link or self._window[1] < now + timedelta(days=self.horizon_days - 1):
+            self.load()
+            return
+        try:
+            res = self.client.call("calendar.delta", {"deltaLink": self._delta_link}) or {}
+        except Exception:
+            self.load()
+            return
+        for ev_id in res.get("removed", []):
+            self._drop(ev_id)
+            if self.store is not None:
+                self.store.delete(ev_id)
+        for ev in res.get("events", []):
+            self._put(ev)
+            if self.store is not None and ev.get("id") in self._spans:
+                self.store.move(ev["id"], *self._spans[ev["id"]])
+        self._delta_link = res.get("deltaLink") or self._delta_link
+
+    def mark_stale(self):
+        """Refresh (via delta) before the next query, e.g. at the start of a poll cycle."""
+        self._stale = True
+
+    def _ensure(self):
+        if not self.loaded:
+            self.load()
+        elif self._stale:
+            self.refresh()
+
+    # ---------- local state ----------
+    def _put(self, ev):
+        ev_id = ev.get("id")
+        if not ev_id or "start" not in ev or "end" not in ev:
+            return
+        self._drop(ev_id)
+        span = (event_time(ev, "start"), event_time(ev, "end"))
+        self._events[ev_id] = ev
+        self._spans[ev_id] = span
+        self._index.add(*span)
+
+    def _drop(self, ev_id):
+        span = self._spans.pop(ev_id, None)
+        self._events.pop(ev_id, None)
+        if span:
+            self._index.remove(*span)
+
+    def _covers(self, start, end):
+        return self._window is not None and self._window[0] <= start and end <= self._window[1]
+
+    @property
+    def index(self) -> AvailabilityIndex:
+        """Free/busy index over every mirrored event (kept current by writes)."""
+        self._ensure()
+        return self._index
+
+    def events(self):
+        self._ensure()
+        return list(self._events.values())
+
+    def list(self, start: datetime, end: datetime):
+        self._ensure()
+        return [self._events[i] for i, (s, e) in self._spans.items() if s < end and e > start]
+
+    # ---------- MCPClient-compatible surface ----------
+    def call(self, method: str, params: dict|None=None):
+        params = params or {}
+        if method == "calendar.list":
+            self._ensure()
+            start, end = date_parser.parse(params["start"]), date_parser.parse(params["end"])
+            if self._covers(start, end):
+                return self.list(start, end)
+            return self.client.call(method, params)
+
+        result = self.client.call(method, params)
+        if not self.loaded:
+            return result
+        if method in ("calendar.create", "calendar.update") and result:
+            self._put(result)
+        elif method == "calendar.delete":
+            self._drop(params["id"])
+            if self.store is not None:
+                self.store.delete(params["id"])
+        elif method == "calendar.apply_changes":
+            for ch, res in zip(params.get("changes", []), result or []):
+                if "error" in (res or {}):
+                    continue
+                if ch.get("op") == "delete":
+                    self._drop(ch["id"])
+                    if self.store is not None:
+                        self.store.delete(ch["id"])
+                else:
+                    self._put(res)
+        return result
+
+    def call_batch(self, calls, return_exceptions=False):
+        return self.client.call_batch(calls, return_exceptions=return_exceptions)
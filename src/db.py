@@ -0,0 +1,14 @@
+# src/db.py
+# Small SQLite helper shared by the agent's local state stores.
+import sqlite3
+
+def open_db(path: str) -> sqlite3.Connection:
+    """
+    Open (or create) a SQLite file tuned for an append-mostly local store:
+    WAL journal so readers never block the writer and commits are crash-safe.
+    Writes are grouped into one transaction per `with conn:` block.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
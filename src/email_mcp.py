@@ -1,51 +1,303 @@
 import re
-from bs4 import BeautifulSoup
 from clients.mcp_client import MCPClient
-from src.extractor_mcp import extract_task_data
+from src.extractor_mcp import extract_task, extract_tasks
+from src.task_parser import ExtractedTask
 from src.scheduler_mcp import process_task
 
-PROCESSED_IDS_FILE = "processed_emails.json"
+DELTA_LINK_FILE = "mail_delta.json"
 
-import json, os
-def load_processed_ids():
-    if os.path.exists(PROCESSED_IDS_FILE):
-        with open(PROCESSED_IDS_FILE, "r") as f:
-            return set(json.load(f))
-    return set()
+import json, os, threading
+from datetime import datetime, timedelta, timezone
+from src.processed_store import ProcessedStore, PROCESSED_DB_FILE, LEGACY_JSON_FILE
+from src.pipeline import Stage, run_pipeline
+from src.calendar_mirror import CalendarMirror
+from src.event_store import default_store, store_at, EVENTS_DB_FILE
+from src.mail_clean import clean_email_body
+from src.triage import Triage
+from src.metrics import registry, span, new_trace_id, trace_for
 
-def save_processed_ids(processed_ids):
-    with open(PROCESSED_IDS_FILE, "w") as f:
-        json.dump(list(processed_ids), f)
+# "delta" = incremental sync via email.delta; "poll" = legacy top-N window
+MAIL_SYNC = os.getenv("AGENT_MAIL_SYNC", "delta")
+# How far back the very first delta sync looks (later syncs only see new mail)
+INITIAL_SYNC_HOURS = int(os.getenv("AGENT_INITIAL_SYNC_HOURS", "24"))
 
-def get_emails_with_tasks(graph_host="127.0.0.1", graph_port=8765, gemini_host="127.0.0.1", gemini_port=8766):
-    email_client = MCPClient(host=graph_host, port=graph_port)
-    processed_ids = load_processed_ids()
+# Pipelined mode: fetch → clean → extract run concurrently, scheduling stays serial
+PIPELINE = os.getenv("AGENT_PIPELINE", "0") in ("1","true","True","yes","YES")
+FETCH_WORKERS = int(os.getenv("AGENT_FETCH_WORKERS", "2"))
+CLEAN_WORKERS = int(os.getenv("AGENT_CLEAN_WORKERS", "1"))
+EXTRACT_WORKERS = int(os.getenv("AGENT_EXTRACT_WORKERS", "4"))
+PIPELINE_QUEUE = int(os.getenv("AGENT_PIPELINE_QUEUE", "16"))
+EXTRACT_BATCH = int(os.getenv("AGENT_EXTRACT_BATCH", "1"))  # >1 = emails per batched LLM call
+FETCH_CHUNK = 20  # ids per email.get_many (one Graph $batch)
 
-    emails = email_client.call("email.list", {"top": 10}) or []
-    print(f"📥 Found {len(emails)} emails.")
-    for brief in emails:
-        msg_id = brief.get("id")
-        if not msg_id or msg_id in processed_ids:
-            continue
-        full = email_client.call("email.get", {"id": msg_id}) or {}
-        subject = full.get("subject", "(No Subject)")
-        body = (full.get("body") or {}).get("content","")
-        ctype = (full.get("body") or {}).get("contentType","text")
+def load_delta_link(path: str=DELTA_LINK_FILE):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("deltaLink")
+    return None
+
+def save_delta_link(link, path: str=DELTA_LINK_FILE):
+    # Write-then-rename so a crash never leaves a half-written link behind
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"deltaLink": link}, f)
+    os.replace(tmp, path)
+
+def fetch_new_messages(email_client: MCPClient, delta_file: str=DELTA_LINK_FILE):
+    """
+    Returns (message stubs, deltaLink to save once they are handled).
+    In delta mode only new/changed mail since the last sync comes back, across
+    as many pages as needed; in poll mode it's the latest 10 and no link.
+    """
+    if MAIL_SYNC != "delta":
+        return email_client.call("email.list", {"top": 10}) or [], None
+    since = (datetime.now(timezone.utc) - timedelta(hours=INITIAL_SYNC_HOURS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    # Streamed: each Graph page arrives as its own message instead of one large reply
+    pages = email_client.stream("email.delta", {"deltaLink": load_delta_link(delta_file), "since": since})
+    messages, seen = [], set()
+    for page in pages:
+        for m in (page or {}).get("messages", []):
+            if m.get("id") not in seen:  # an expired link restarts the sync and repeats pages
+                seen.add(m.get("id"))
+                messages.append(m)
+    return messages, (pages.result or {}).get("deltaLink")
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+def _calendar(graph_host, graph_port, account: str|None=None, store=None):
+    """
+    The scheduler's view of the calendar: one mirror per Graph server and mailbox, kept
+    across cycles and refreshed via calendar delta the first time a cycle needs it.
+    """
+    key = (graph_host, graph_port, account)
+    with _mirrors_lock:
+        mirror = _mirrors.get(key)
+        created = mirror is None
+        if created:
+            mirror = _mirrors[key] = CalendarMirror(
+                MCPClient(host=graph_host, port=graph_port, account=account),
+                store=default_store() if store is None else store)
+    if not created:
+        mirror.mark_stale()
+    return mirror
+
+def _describe(extracted):
+    if extracted is None:
+        return "(NONE)"
+    if isinstance(extracted, ExtractedTask) and extracted.source == "local":
+        return f"{extracted} [local, confidence {extracted.confidence:g}]"
+    return str(extracted)
+
+def _clean_body(full):
+    subject = full.get("subject", "(No Subject)")
+    body = (full.get("body") or {}).get("content","")
+    ctype = (full.get("body") or {}).get("contentType","text")
+
+    # Plain text without markup, quoted thread, signature or disclaimer, capped in size
+    return subject, clean_email_body(body, ctype, subject=subject)
 
-        if ctype.lower() == "html":
-            soup = BeautifulSoup(body, 'html.parser')
-            body = soup.get_text()
+def get_emails_with_tasks(graph_host="127.0.0.1", graph_port=8765, gemini_host="127.0.0.1", gemini_port=8766,
+                          pipeline: bool|None=None, account: str|None=None, state_dir: str="",
+                          max_emails: int|None=None):
+    """
+    One mail cycle. Returns how many new emails it handled (the caller's poll timing uses it).
+    account/state_dir: the mailbox to serve and where its stores live (src/accounts.py);
+    the defaults are the single-mailbox layout in the working directory.
+    max_emails: handle at most this many new emails; the rest wait for a later cycle.
+    """
+    email_client = MCPClient(host=graph_host, port=graph_port, account=account)
+    if state_dir:
+        os.makedirs(state_dir, exist_ok=True)
+        processed = ProcessedStore(os.path.join(state_dir, PROCESSED_DB_FILE), os.path.join(state_dir, LEGACY_JSON_FILE))
+        store = store_at(os.path.join(state_dir, EVENTS_DB_FILE))
+    else:
+        processed, store = ProcessedStore(), default_store()
+    delta_file = os.path.join(state_dir, DELTA_LINK_FILE)
+    cal_client = _calendar(graph_host, graph_port, account, store)
+    if pipeline is None:
+        pipeline = PIPELINE
+    before = _time_split()
+    handled = 0
+    try:
+        run = _pipeline_new_emails if pipeline else _process_new_emails
+        with span("cycle", trace=new_trace_id(), account=account):
+            handled = run(email_client, processed, cal_client, gemini_host, gemini_port, delta_file, max_emails)
+        return handled
+    finally:
+        # One durable commit per cycle, even if a message blew up half-way
+        processed.commit()
+        processed.prune()
+        processed.close()
+        store.prune()
+        registry.inc("agent_emails_total", handled or 0, account=account or "default")
+        _report_cycle(before)
+
+def _cap(new_ids, max_emails):
+    """Trim to max_emails; returns (ids, whether some were left for later)."""
+    if max_emails is None or len(new_ids) <= max_emails:
+        return new_ids, False
+    print(f"⏸️ Handling {max_emails} of {len(new_ids)} new emails this cycle.")
+    return new_ids[:max(0, max_emails)], True
+
+# Which server an RPC went to, by method prefix
+_RPC_TARGETS = {"email": "Graph", "calendar": "Graph", "subscription": "Graph", "llm": "Gemini"}
+
+def _time_split():
+    target = lambda m: _RPC_TARGETS.get((m or "").split(".")[0], "other")
+    return (registry.totals("mcp_client_seconds", "method", target),
+            registry.totals("span_seconds", "span"))
+
+def _report_cycle(before):
+    """Where this cycle's time went: RPC time per server and busy time per stage."""
+    (rpc0, stage0), (rpc1, stage1) = before, _time_split()
+    delta = lambda a, b: {k: v - a.get(k, 0.0) for k, v in b.items() if v - a.get(k, 0.0) > 0.0005}
+    rpc, stages = delta(rpc0, rpc1), delta(stage0, stage1)
+    wall = stages.pop("cycle", 0.0)
+    if not wall:
+        return
+    parts = ", ".join(f"{k} {v:.2f}s" for k, v in sorted(rpc.items(), key=lambda kv: -kv[1]))
+    busy = ", ".join(f"{k} {v:.2f}s" for k, v in sorted(stages.items(), key=lambda kv: -kv[1]))
+    print(f"⏱️ Cycle {wall:.2f}s — RPC time: {parts or 'none'} | stage time: {busy or 'none'}")
+
+def _process_new_emails(email_client, processed, cal_client, gemini_host, gemini_port, delta_file, max_emails=None):
+    with span("fetch"):
+        emails, delta_link = fetch_new_messages(email_client, delta_file)
+        print(f"📥 Found {len(emails)} emails.")
+        new_ids = [b.get("id") for b in emails if b.get("id") and b.get("id") not in processed]
+        new_ids, deferred = _cap(new_ids, max_emails)
+
+        # Fetch every unseen body in one round trip (Graph $batch behind it)
+        fulls = email_client.call("email.get_many", {"ids": new_ids}) if new_ids else []
+    triage = Triage()
+    fetch_failed = False
+    for msg_id, full in zip(new_ids, fulls):
+        if "error" in full:
+            print(f"⚠️ Could not fetch email {msg_id}: {full['error']}")
+            fetch_failed = True
+            continue
+        trace = trace_for(msg_id)
+        with span("clean", trace=trace):
+            subject, body = _clean_body(full)
+            keep = triage.check(full, subject, body)
+        if not keep:
+            processed.add(msg_id)  # no task here: never sent to the LLM
+            continue
 
         print("📧 Subject:", subject)
         print("📝 Body:", (body or "").strip())
         print("=" * 70)
 
-        extracted = extract_task_data(body, host=gemini_host, port=gemini_port)
-        print("📌 Extracted:", extracted)
+        with span("extract", trace=trace):
+            extracted = extract_task(body, host=gemini_host, port=gemini_port)
+        print("📌 Extracted:", _describe(extracted))
 
         # Schedule
-        cal_client = MCPClient(host=graph_host, port=graph_port)
-        process_task(cal_client, extracted)
+        with span("schedule", trace=trace):
+            process_task(cal_client, extracted)
+
+        processed.add(msg_id)
+    triage.summary()
+
+    # Only move the sync point forward once everything it covers was handled;
+    # otherwise the next cycle replays from the old link (processed ids are skipped).
+    if delta_link and not fetch_failed and not deferred:
+        save_delta_link(delta_link, delta_file)
+    return len(new_ids)
+
+def _pipeline_new_emails(email_client, processed, cal_client, gemini_host, gemini_port, delta_file, max_emails=None):
+    """
+    Same work as _process_new_emails, as a staged pipeline:
+    fetch (get_many chunks) → clean + triage → extract (parallel, optionally batched LLM calls)
+    → schedule (one writer).
+    Each message's progress is saved after clean/extract, so a crash resumes mid-way.
+    """
+    with span("fetch"):
+        emails, delta_link = fetch_new_messages(email_client, delta_file)
+    resumed = processed.in_flight()
+    resumed_ids = {m for m, _, _ in resumed}
+    new_ids = [b.get("id") for b in emails
+               if b.get("id") and b.get("id") not in resumed_ids and b.get("id") not in processed]
+    new_ids, deferred = _cap(new_ids, None if max_emails is None else max_emails - len(resumed))
+    print(f"📥 Found {len(emails)} emails ({len(new_ids)} new, {len(resumed)} resumed).")
+
+    triage = Triage()
+    failures = []
+
+    def fetch(chunk):
+        with span("fetch", emails=len(chunk)):
+            fulls = email_client.call("email.get_many", {"ids": chunk}) or []
+        for full in fulls:
+            if "error" in full:
+                print(f"⚠️ Could not fetch email {full.get('id')}: {full['error']}")
+                failures.append(full.get("id"))
+                continue
+            yield full
+
+    def clean(full):
+        with span("clean", trace=trace_for(full["id"])):
+            subject, text = _clean_body(full)
+            keep = triage.check(full, subject, text)
+        if not keep:
+            processed.finish(full["id"])  # no task here: never sent to the LLM
+            return None
+        processed.set_stage(full["id"], "cleaned", {"subject": subject, "text": text})
+        return full["id"], subject, text
+
+    def save_extracted(msg_id, subject, extracted):
+        processed.set_stage(msg_id, "extracted", {"subject": subject,
+                                                  "extracted": extracted.to_dict() if extracted else None})
+
+    def extract(job):
+        msg_id, subject, text = job
+        with span("extract", trace=trace_for(msg_id)):
+            extracted = extract_task(text, host=gemini_host, port=gemini_port)
+        save_extracted(msg_id, subject, extracted)
+        return msg_id, subject, extracted
+
+    def extract_batch(jobs):
+        # One LLM call for several emails: the span carries the first one's trace
+        with span("extract", trace=trace_for(jobs[0][0]), emails=len(jobs)):
+            results = extract_tasks([(m, text) for m, _, text in jobs], host=gemini_host, port=gemini_port)
+        for msg_id, subject, _ in jobs:
+            save_extracted(msg_id, subject, results[msg_id])
+            yield msg_id, subject, results[msg_id]
+
+    def schedule(job):
+        # Single worker: slot decisions see every earlier booking
+        msg_id, subject, extracted = job
+        print(f"📧 {subject} → 📌 {_describe(extracted)}")
+        with span("schedule", trace=trace_for(msg_id)):
+            process_task(cal_client, extracted)
+        processed.finish(msg_id)
+
+    def on_error(stage, item, exc):
+        print(f"❌ {stage.name} failed: {exc}")
+        failures.append(item)
+
+    stages = [
+        Stage("fetch", fetch, FETCH_WORKERS, many=True),
+        Stage("clean", clean, CLEAN_WORKERS),
+        Stage("extract", extract_batch, EXTRACT_WORKERS, many=True, batch=EXTRACT_BATCH)
+        if EXTRACT_BATCH > 1 else Stage("extract", extract, EXTRACT_WORKERS),
+        Stage("schedule", schedule, 1),
+    ]
+    feeds = {0: [new_ids[i:i + FETCH_CHUNK] for i in range(0, len(new_ids), FETCH_CHUNK)]}
+    cleaned = [(m, d["subject"], d["text"]) for m, st, d in resumed if st == "cleaned"]
+    # Rows saved before extraction became structured hold the LLM string; process_task takes both
+    extracted = [(m, d["subject"], ExtractedTask.from_dict(d["extracted"]) if isinstance(d["extracted"], dict) else d["extracted"])
+                 for m, st, d in resumed if st == "extracted"]
+    if cleaned:
+        feeds[2] = cleaned
+    if extracted:
+        feeds[3] = extracted
+
+    stats = run_pipeline(stages, feeds, queue_size=PIPELINE_QUEUE, on_error=on_error)
+    print(f"🧵 Pipeline: {stats}")
+    triage.summary()
 
-        processed_ids.add(msg_id)
-        save_processed_ids(processed_ids)
+    # Any failure keeps the old link so the sync replays; messages that got past
+    # clean resume from their saved stage instead of starting over.
+    if delta_link and not failures and not deferred:
+        save_delta_link(delta_link, delta_file)
+    return len(new_ids) + len(resumed)
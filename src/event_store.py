@@ -0,0 +1,179 @@
+# src/event_store.py
+# Metadata of the events the agent created (deadline, duration), keyed by Graph event id.
+# SQLite (WAL), indexed by id, start and deadline, so the scheduler can look events up
+# by id or by time range without reading a JSON blob that grows with every task.
+# Writes are per event (create/move/delete), each in its own small transaction.
+import json, os, threading, time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from dateutil import parser as date_parser
+
+from src.db import open_db
+
+EVENTS_DB_FILE = os.getenv("AGENT_EVENTS_DB", "agent_events.db")
+LEGACY_JSON_FILE = "agent_events.json"   # pre-SQLite format, imported once
+RETENTION_DAYS = int(os.getenv("AGENT_EVENTS_RETENTION_DAYS", "90"))
+
+UTC = ZoneInfo("UTC")
+
+def _ts(dt: datetime|None):
+    return dt.timestamp() if dt is not None else None
+
+class EventStore:
+    def __init__(self, path: str=EVENTS_DB_FILE, legacy_json: str|None=LEGACY_JSON_FILE):
+        self._db = open_db(path)
+        self._lock = threading.Lock()
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " event_id TEXT PRIMARY KEY,"
+                " subject TEXT,"
+                " start_ts REAL,"        # NULL for rows imported without times
+                " end_ts REAL,"
+                " deadline TEXT NOT NULL,"  # ISO, with the offset it was scheduled in
+                " deadline_ts REAL NOT NULL,"
+                " duration_min INTEGER NOT NULL,"
+                " tz TEXT,"
+                " updated_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS events_start_idx ON events(start_ts)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS events_deadline_idx ON events(deadline_ts)")
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json)
+
+    def _import_legacy(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+        now = time.time()
+        rows = []
+        for ev_id, meta in legacy.items():
+            try:
+                deadline = date_parser.parse(meta["deadline"])
+                rows.append((ev_id, meta.get("subject"), meta["deadline"], deadline.timestamp(),
+                             int(meta["duration_min"]), meta.get("tz"), now))
+            except Exception:
+                continue
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO events(event_id, subject, deadline, deadline_ts, duration_min, tz, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", rows,
+            )
+        os.replace(path, path + ".migrated")
+        print(f"🗃️ Imported {len(rows)} agent events from {path}.")
+
+    @staticmethod
+    def _row(r):
+        ev_id, subject, start_ts, end_ts, deadline, duration_min, tz = r
+        return {
+            "id": ev_id,
+            "subject": subject,
+            "start": datetime.fromtimestamp(start_ts, UTC) if start_ts is not None else None,
+            "end": datetime.fromtimestamp(end_ts, UTC) if end_ts is not None else None,
+            "deadline": deadline,
+            "duration_min": duration_min,
+            "tz": tz,
+        }
+
+    _COLS = "event_id, subject, start_ts, end_ts, deadline, duration_min, tz"
+
+    # ---------- writes ----------
+    def upsert(self, event_id, subject, start: datetime, end: datetime, deadline: datetime, duration_min: int, tz: str|None=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO events(event_id, subject, start_ts, end_ts, deadline, deadline_ts, duration_min, tz, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (event_id, subject, _ts(start), _ts(end), deadline.isoformat(), deadline.timestamp(),
+                 int(duration_min), tz, time.time()),
+            )
+
+    def move(self, event_id, start: datetime, end: datetime) -> bool:
+        """Record new times for one of our events; False if the id isn't ours."""
+        with self._lock, self._db:
+            return self._db.execute(
+                "UPDATE events SET start_ts = ?, end_ts = ?, updated_at = ? WHERE event_id = ?",
+                (_ts(start), _ts(end), time.time(), event_id),
+            ).rowcount > 0
+
+    def delete(self, event_id) -> bool:
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM events WHERE event_id = ?", (event_id,)).rowcount > 0
+
+    def prune(self, older_than_days: int=RETENTION_DAYS):
+        """Forget events that ended (or were due) more than `older_than_days` ago."""
+        cutoff = time.time() - older_than_days * 86400
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM events WHERE COALESCE(end_ts, deadline_ts) < ?", (cutoff,)
+            ).rowcount
+
+    # ---------- reads ----------
+    def __contains__(self, event_id):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM events WHERE event_id = ?", (event_id,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    def get(self, event_id):
+        with self._lock:
+            r = self._db.execute(f"SELECT {self._COLS} FROM events WHERE event_id = ?", (event_id,)).fetchone()
+        return self._row(r) if r else None
+
+    def get_many(self, event_ids) -> dict:
+        """{event_id: row} for the ids that are ours."""
+        ids = list(dict.fromkeys(event_ids))
+        out = {}
+        with self._lock:
+            for i in range(0, len(ids), 500):  # stay under SQLite's bound-parameter limit
+                chunk = ids[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for r in self._db.execute(f"SELECT {self._COLS} FROM events WHERE event_id IN ({marks})", chunk):
+                    out[r[0]] = self._row(r)
+        return out
+
+    def overlapping(self, start: datetime, end: datetime):
+        """Our events overlapping [start, end), by start time."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLS} FROM events WHERE start_ts < ? AND end_ts > ? ORDER BY start_ts",
+                (_ts(end), _ts(start)),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def low_slack(self, max_slack: timedelta, now: datetime|None=None):
+        """Upcoming events whose end is less than `max_slack` before their deadline, tightest first."""
+        now_ts = _ts(now) if now else time.time()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLS} FROM events WHERE start_ts >= ? AND deadline_ts - end_ts < ?"
+                " ORDER BY deadline_ts - end_ts",
+                (now_ts, max_slack.total_seconds()),
+            ).fetchall()
+        return [self._row(r) for r in rows]
+
+    def close(self):
+        self._db.close()
+
+_stores = {}   # path -> EventStore
+_stores_lock = threading.Lock()
+
+def store_at(path: str) -> EventStore:
+    """The process-wide store for one database file (one per account), opened on first use."""
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            legacy = os.path.join(os.path.dirname(path), LEGACY_JSON_FILE)
+            store = _stores[path] = EventStore(path, legacy)
+        return store
+
+def default_store() -> EventStore:
+    """The single-mailbox store at EVENTS_DB_FILE."""
+    return store_at(EVENTS_DB_FILE)
+
+def close_all():
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
@@ -1,23 +1,22 @@
 from clients.mcp_client import MCPClient
+from src.task_parser import ExtractedTask, parse_local, from_llm_string
+from zoneinfo import ZoneInfo
 import datetime
+import json, os, re
 import time
 
+LOCAL_TZ = os.getenv("AGENT_TZ", "Africa/Tunis")
+# Tier 1: the local parser; emails it reads with less confidence than this go to the LLM
+LOCAL_EXTRACT = os.getenv("AGENT_LOCAL_EXTRACT", "1") in ("1","true","True","yes","YES")
+LOCAL_MIN_CONFIDENCE = float(os.getenv("AGENT_LOCAL_MIN_CONFIDENCE", "0.8"))
+
 def extract_task_data(text, retries=3, delay=5, host="127.0.0.1", port=8766):
     client = MCPClient(host=host, port=port)
-    prompt = f"""
-You are a Task Manager. Extract the task, due date, and estimate (max 4h).
-Today's datetime is: {datetime.datetime.now().strftime("%A")} {datetime.datetime.now()}.
-Return EXACTLY in this format: (TASK, YYYY-MM-DD HH:MM, DURATION)
-- Use 24h time (HH:MM)
-- Convert relative times like "tomorrow 3pm" to concrete date and 24h time
-- If no explicit time is present, use 17:00 as a reasonable default for a deadline
-
-EMAIL:
-{text}
-"""
+    # The server owns the prompt; sending only the date keeps its cache key stable all day
+    params = {"model": "gemini-2.5-flash", "text": text, "reference_date": datetime.date.today().isoformat()}
     for attempt in range(retries):
         try:
-            result = client.call("llm.generate", {"model": "gemini-2.5-flash", "prompt": prompt})
+            result = client.call("llm.extract_task", params)
             return result.get("text","").strip()
         except Exception as e:
             print(f"⚠️ MCP Gemini error: {e}")
@@ -27,3 +26,123 @@ EMAIL:
             else:
                 print("❌ Failed after multiple attempts.")
                 return "(NONE)"
+
+# Batched extraction: several cleaned emails per llm.extract_tasks call
+BATCH_TOKEN_BUDGET = int(os.getenv("AGENT_BATCH_TOKEN_BUDGET", "6000"))  # rough prompt tokens per call
+BATCH_MAX_EMAILS = int(os.getenv("AGENT_BATCH_MAX_EMAILS", "10"))
+
+def _approx_tokens(text):
+    return len(text or "") // 4 + 1  # ~4 chars per token is close enough for budgeting
+
+def _pack(items, budget=BATCH_TOKEN_BUDGET, max_emails=BATCH_MAX_EMAILS):
+    """Split [(msg_id, text)] into consecutive groups that fit the token budget."""
+    groups, cur, used = [], [], 0
+    for item in items:
+        cost = _approx_tokens(item[1])
+        if cur and (used + cost > budget or len(cur) >= max_emails):
+            groups.append(cur)
+            cur, used = [], 0
+        cur.append(item)
+        used += cost
+    if cur:
+        groups.append(cur)
+    return groups
+
+def _parse_batch_reply(text, count):
+    """
+    JSON array from the model → {index: "(TASK, YYYY-MM-DD HH:MM, DURATION)" or "(NONE)"}.
+    Raises ValueError unless every index 0..count-1 is answered exactly once.
+    """
+    text = (text or "").strip()
+    if text.startswith("```"):  # models love fencing JSON
+        text = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", text)
+    rows = json.loads(text)
+    if not isinstance(rows, list):
+        raise ValueError("batch reply is not a list")
+    out = {}
+    for row in rows:
+        idx = int(row["index"])
+        if not 0 <= idx < count or idx in out:
+            raise ValueError(f"bad or duplicate index {idx}")
+        if row.get("none"):
+            out[idx] = "(NONE)"
+        else:
+            out[idx] = f"({row['task']}, {row['deadline']}, {row['duration']})"
+    if len(out) != count:
+        raise ValueError(f"expected {count} results, got {len(out)}")
+    return out
+
+def _extract_group(client, group, host, port):
+    if len(group) == 1:
+        msg_id, text = group[0]
+        return {msg_id: extract_task_data(text, host=host, port=port)}
+    params = {
+        "model": "gemini-2.5-flash",
+        "texts": [t for _, t in group],
+        "reference_date": datetime.date.today().isoformat(),
+    }
+    try:
+        reply = client.call("llm.extract_tasks", params)
+        by_index = _parse_batch_reply(reply.get("text", ""), len(group))
+        return {group[i][0]: extracted for i, extracted in by_index.items()}
+    except Exception as e:
+        # Malformed (or failed) batch: split it and retry each half on its own
+        print(f"⚠️ Batch of {len(group)} failed ({e}); splitting.")
+        mid = len(group) // 2
+        out = _extract_group(client, group[:mid], host, port)
+        out.update(_extract_group(client, group[mid:], host, port))
+        return out
+
+def extract_task_data_batch(items, host="127.0.0.1", port=8766):
+    """
+    items: [(msg_id, cleaned text)]
+    Returns {msg_id: "(TASK, YYYY-MM-DD HH:MM, DURATION)" or "(NONE)"}, using as few
+    LLM calls as the token budget allows.
+    """
+    client = MCPClient(host=host, port=port)
+    results = {}
+    for group in _pack(list(items)):
+        results.update(_extract_group(client, group, host, port))
+    return results
+
+# ---------- tiered extraction: structured results ----------
+def _local(text):
+    if not LOCAL_EXTRACT:
+        return None
+    try:
+        task = parse_local(text, ZoneInfo(LOCAL_TZ))
+    except Exception as e:
+        print(f"⚠️ Local extraction failed: {e}")
+        return None
+    if task and task.confidence >= LOCAL_MIN_CONFIDENCE:
+        return task
+    return None
+
+def _structured(raw):
+    try:
+        return from_llm_string(raw, ZoneInfo(LOCAL_TZ))
+    except Exception as e:
+        print(f"❌ Invalid task format: {raw} → {e}")
+        return None
+
+def extract_task(text, retries=3, delay=5, host="127.0.0.1", port=8766) -> ExtractedTask|None:
+    """The local parser when it is confident, else the LLM. None = no task."""
+    return _local(text) or _structured(extract_task_data(text, retries, delay, host, port))
+
+def extract_tasks(items, host="127.0.0.1", port=8766):
+    """
+    items: [(msg_id, cleaned text)]
+    Returns {msg_id: ExtractedTask or None}; only emails the local parser can't read
+    confidently are sent (batched) to the LLM.
+    """
+    out, rest = {}, []
+    for msg_id, text in items:
+        task = _local(text)
+        if task:
+            out[msg_id] = task
+        else:
+            rest.append((msg_id, text))
+    if rest:
+        for msg_id, raw in extract_task_data_batch(rest, host=host, port=port).items():
+            out[msg_id] = _structured(raw)
+    return out
@@ -0,0 +1,156 @@
+# src/ingest.py
+# When to run the next mail cycle.
+# - NotificationReceiver: a small HTTP endpoint for Microsoft Graph change notifications
+#   (subscription validation handshake + notification POSTs). Each accepted notification
+#   wakes the agent loop immediately.
+# - AdaptivePoll: the fallback timer. Short right after activity, doubling while idle,
+#   jittered exponential backoff after errors. Idle waits stay at the old fixed 60s
+#   interval unless a Graph subscription is there to wake the agent sooner.
+#
+# Stand-in sender for local testing (no Graph subscription needed):
+#   python -m src.ingest --url http://127.0.0.1:8770/notifications --id <message id>
+import argparse, json, os, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+NOTIFY_HOST = os.getenv("AGENT_NOTIFY_HOST", "127.0.0.1")
+NOTIFY_PORT = int(os.getenv("AGENT_NOTIFY_PORT", "8770"))
+NOTIFY_PATH = "/notifications"
+NOTIFY_CLIENT_STATE = os.getenv("AGENT_NOTIFY_CLIENT_STATE", "")  # shared secret echoed by Graph
+
+POLL_MIN = float(os.getenv("AGENT_POLL_MIN", "5"))        # seconds, right after activity
+POLL_MAX = float(os.getenv("AGENT_POLL_MAX", "60"))       # idle ceiling when only polling
+POLL_MAX_PUSH = float(os.getenv("AGENT_POLL_MAX_PUSH", "300"))  # idle ceiling while subscribed to notifications
+POLL_ERROR_MAX = float(os.getenv("AGENT_POLL_ERROR_MAX", "600"))
+
+class NotificationReceiver:
+    """
+    Accepts Graph change notifications on POST {path}:
+    - ?validationToken=... → echo the token (subscription creation handshake)
+    - {"value": [{"clientState", "changeType", "resourceData": {"id"}}, ...]} → 202,
+      message ids are queued and `wake` is set
+    Notifications with the wrong clientState are ignored.
+    """
+    def __init__(self, host: str=NOTIFY_HOST, port: int=NOTIFY_PORT, client_state: str=NOTIFY_CLIENT_STATE,
+                 path: str=NOTIFY_PATH):
+        self.host, self.port, self.path = host, port, path
+        self.client_state = client_state
+        self.wake = threading.Event()
+        self._lock = threading.Lock()
+        self._ids = []
+        self.received = 0
+        self.rejected = 0
+        self.last_notified_at = None
+        self._server = None
+
+    def start(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path != receiver.path:
+                    self._reply(404)
+                    return
+                token = parse_qs(url.query).get("validationToken")
+                if token:
+                    self._reply(200, token[0].encode("utf-8"), "text/plain")
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                except Exception:
+                    self._reply(400)
+                    return
+                self._reply(202)  # answer fast; Graph retries slow endpoints
+                receiver._accept(payload.get("value") or [])
+
+            def _reply(self, status, body=b"", ctype="application/json"):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="notify-http", daemon=True).start()
+        print(f"📬 Listening for Graph notifications on http://{self.host}:{self.port}{self.path}")
+        return self
+
+    def _accept(self, items):
+        accepted = 0
+        with self._lock:
+            for n in items:
+                if self.client_state and n.get("clientState") != self.client_state:
+                    self.rejected += 1
+                    continue
+                accepted += 1
+                msg_id = (n.get("resourceData") or {}).get("id")
+                if msg_id:
+                    self._ids.append(msg_id)
+            self.received += accepted
+            if accepted:
+                self.last_notified_at = time.time()
+        if accepted:
+            self.wake.set()
+
+    def take(self):
+        """Message ids notified since the last call (and re-arm the wake event)."""
+        with self._lock:
+            ids, self._ids = self._ids, []
+            self.wake.clear()
+        return ids
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+class AdaptivePoll:
+    """Seconds to wait before the next cycle, from what the last cycles saw."""
+    def __init__(self, min_s: float=POLL_MIN, max_s: float=POLL_MAX, error_max_s: float=POLL_ERROR_MAX):
+        self.min_s, self.max_s, self.error_max_s = min_s, max_s, error_max_s
+        self.interval = min_s
+        self.errors = 0
+
+    def activity(self):
+        """A cycle handled mail: look again soon, more is often on the way."""
+        self.errors = 0
+        self.interval = self.min_s
+        return self.interval
+
+    def idle(self):
+        self.errors = 0
+        self.interval = min(self.max_s, self.interval * 2)
+        return self.interval
+
+    def error(self):
+        # Exponential backoff with full jitter, so restarted agents don't retry in lockstep
+        self.errors += 1
+        ceiling = min(self.error_max_s, self.min_s * 2 ** self.errors)
+        return random.uniform(self.min_s, max(self.min_s, ceiling))
+
+def send_notification(url: str, message_ids, client_state: str=NOTIFY_CLIENT_STATE):
+    """Post a Graph-shaped "created" notification (local stand-in for Graph)."""
+    import requests
+    value = [{
+        "subscriptionId": "local-test",
+        "clientState": client_state,
+        "changeType": "created",
+        "resource": f"me/mailFolders('inbox')/messages/{i}",
+        "resourceData": {"@odata.type": "#Microsoft.Graph.Message", "id": i},
+    } for i in message_ids]
+    return requests.post(url, json={"value": value}, timeout=10).status_code
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Send a stand-in Graph change notification")
+    ap.add_argument("--url", default=f"http://{NOTIFY_HOST}:{NOTIFY_PORT}{NOTIFY_PATH}")
+    ap.add_argument("--id", action="append", default=[], help="message id (repeatable)")
+    ap.add_argument("--client-state", default=NOTIFY_CLIENT_STATE)
+    args = ap.parse_args()
+    print(send_notification(args.url, args.id or ["test"], args.client_state))
@@ -0,0 +1,205 @@
+# src/mail_clean.py
+# Email body -> the short plain text the LLM actually needs.
+# - HTML: drop <style>/<script>/<head> and quoted blocks, keep block structure as newlines
+#   (lxml when installed, otherwise a streaming stdlib parser; both much faster than bs4)
+# - cut quoted reply chains ("On ... wrote:", "-----Original Message-----", Outlook headers);
+#   only a forward with nothing written above it keeps the quoted message
+# - cut signatures, sign-offs and disclaimers near the end
+# - collapse whitespace and cap the result at AGENT_CLEAN_MAX_CHARS
+import os, re
+from html.parser import HTMLParser
+
+try:
+    import lxml.html as _lxml_html
+except ImportError:  # optional speed-up
+    _lxml_html = None
+
+CLEAN_MAX_CHARS = int(os.getenv("AGENT_CLEAN_MAX_CHARS", "4000"))  # ~1k tokens
+CLEAN_PARSER = os.getenv("AGENT_CLEAN_PARSER", "auto")  # "auto" | "lxml" | "stdlib"
+
+_SKIP_TAGS = {"style", "script", "head", "title", "noscript", "template"}
+_BLOCK_TAGS = {"p", "div", "br", "tr", "li", "ul", "ol", "table", "h1", "h2", "h3", "h4", "h5", "h6",
+               "hr", "section", "article", "header", "footer", "pre", "td", "th", "dd", "dt", "blockquote"}
+_VOID_TAGS = {"br", "hr", "img", "meta", "link", "input", "col", "area", "base", "wbr", "source"}
+# Where the quoted part of a reply starts in Outlook / Gmail / Apple Mail HTML
+_QUOTE_IDS = {"divrplyfwdmsg", "appendonsend", "mail-editor-reference-message-container"}
+_QUOTE_CLASSES = ("gmail_quote", "yahoo_quoted", "moz-cite-prefix", "ms-outlook-mobile-reference-message")
+
+# ---------- HTML -> text ----------
+class _TextExtractor(HTMLParser):
+    def __init__(self, keep_quotes=False):
+        super().__init__(convert_charrefs=True)
+        self.keep_quotes = keep_quotes
+        self.parts = []
+        self._skip = []     # stack of tags whose content we're dropping
+        self.done = False   # reached the quoted part of a reply
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self._skip:
+            if tag not in _VOID_TAGS:
+                self._skip.append(tag)
+            return
+        a = dict(attrs)
+        if not self.keep_quotes:
+            if (a.get("id") or "").lower() in _QUOTE_IDS:
+                self.done = True
+                return
+            if tag == "blockquote" or any(c in (a.get("class") or "") for c in _QUOTE_CLASSES):
+                self._skip.append(tag)
+                return
+        if tag in _SKIP_TAGS:
+            if tag not in _VOID_TAGS:
+                self._skip.append(tag)
+            return
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if self.done:
+            return
+        if self._skip:
+            # pop back to the matching open tag (tolerates unclosed children)
+            if tag in self._skip:
+                while self._skip and self._skip.pop() != tag:
+                    pass
+            return
+        if tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.done and not self._skip:
+            self.parts.append(data)
+
+def _html_to_text_stdlib(html: str, keep_quotes=False) -> str:
+    p = _TextExtractor(keep_quotes)
+    p.feed(html)
+    p.close()
+    return "".join(p.parts)
+
+def _is_quote(el):
+    return el.tag == "blockquote" or any(c in (el.get("class") or "") for c in _QUOTE_CLASSES)
+
+def _html_to_text_lxml(html: str, keep_quotes=False) -> str:
+    try:
+        root = _lxml_html.fromstring(html)
+    except Exception:  # empty or unparseable document
+        return _html_to_text_stdlib(html, keep_quotes)
+    for el in ([] if keep_quotes else root.iter()):
+        if not isinstance(el.tag, str):
+            continue
+        if (el.get("id") or "").lower() in _QUOTE_IDS:
+            # Everything from here on is the quoted message
+            node = el
+            while node is not None and node is not root:
+                parent = node.getparent()
+                for sib in list(node.itersiblings()):
+                    parent.remove(sib)
+                node = parent
+            if el is not root:
+                el.getparent().remove(el)
+            break
+    drop = [el for el in root.iter()
+            if isinstance(el.tag, str) and (el.tag in _SKIP_TAGS or (not keep_quotes and _is_quote(el)))]
+    for el in drop:
+        parent = el.getparent()
+        if parent is not None:
+            el.drop_tree()
+    for el in root.iter():
+        if isinstance(el.tag, str) and el.tag in _BLOCK_TAGS:
+            el.tail = "\n" + (el.tail or "")
+            if el.tag in ("br", "hr"):
+                continue
+            el.text = "\n" + (el.text or "")
+    return root.text_content()
+
+def html_to_text(html: str, parser: str|None=None, keep_quotes: bool=False) -> str:
+    parser = parser or CLEAN_PARSER
+    if parser == "lxml" or (parser == "auto" and _lxml_html is not None):
+        if _lxml_html is None:
+            raise RuntimeError("AGENT_CLEAN_PARSER=lxml but lxml is not installed")
+        return _html_to_text_lxml(html, keep_quotes)
+    return _html_to_text_stdlib(html, keep_quotes)
+
+# ---------- quoted replies, signatures ----------
+_REPLY_HEADER = re.compile(
+    r"^(?:"
+    r"On .{0,200}\bwrote:|"                     # Gmail / Apple Mail
+    r"Le .{0,200}\ba écrit ?:|"                 # French clients
+    r"-{2,}\s*(?:Original Message|Forwarded message|Message d'origine)\s*-{2,}|"
+    r"_{10,}"                                   # Outlook separator line
+    r")\s*$",
+    re.IGNORECASE,
+)
+_HEADER_FROM = re.compile(r"^(?:From|De)\s*:", re.IGNORECASE)
+_HEADER_NEXT = re.compile(r"^(?:Sent|Date|Envoyé|To|À|Subject|Objet)\s*:", re.IGNORECASE)
+_SIG_HARD = re.compile(r"^(?:--\s*|Sent from my .*|Envoyé de mon .*|Get Outlook for .*)$", re.IGNORECASE)
+_SIGN_OFF = re.compile(
+    r"^(?:best(?: regards)?|kind regards|regards|warm regards|many thanks|thanks(?: again)?|thank you|cheers|"
+    r"cordialement|bien cordialement|bien à vous|merci)[,.!]?$",
+    re.IGNORECASE,
+)
+_DISCLAIMER = re.compile(r"^(?:confidentiality notice|disclaimer|this (?:e-?mail|message)\b.{0,80}\bconfidential)", re.IGNORECASE)
+_FORWARD_MARK = re.compile(r"-{2,}\s*Forwarded message\s*-{2,}|^\s*Begin forwarded message:", re.IGNORECASE | re.MULTILINE)
+_FORWARD_SUBJECT = re.compile(r"^\s*fwd?\s*:", re.IGNORECASE)
+_TAIL_LINES = 12  # sign-offs/disclaimers only count this close to the end
+MIN_KEEP = 40     # a forward leaving less than this above the quote (e.g. "FYI") keeps the quoted message
+
+def is_forward(content: str, subject: str|None=None) -> bool:
+    """A 'Forwarded message' marker in the body or a Fw:/Fwd: subject."""
+    return bool(_FORWARD_SUBJECT.match(subject or "") or _FORWARD_MARK.search(content or ""))
+
+def strip_quoted(text: str, cut_replies: bool=True) -> str:
+    """Keep only the new part of a message: cut the quoted chain, signature and disclaimer."""
+    lines = text.split("\n")
+    end = len(lines)
+    kept = 0  # non-blank chars above line i
+    for i, raw in enumerate(lines if cut_replies else []):
+        line = raw.strip()
+        if (_REPLY_HEADER.match(line)
+                or (_HEADER_FROM.match(line) and any(_HEADER_NEXT.match(l.strip()) for l in lines[i + 1:i + 4]))
+                or (kept and _SIG_HARD.match(line))):
+            end = i
+            break
+        kept += len(line)
+    if cut_replies:
+        lines = [l for l in lines[:end] if not l.lstrip().startswith(">")]
+
+    # Sign-off / disclaimer: the first one within the last few non-empty lines
+    content = [i for i, l in enumerate(lines) if l.strip()]
+    for i in content[-_TAIL_LINES:]:
+        line = lines[i].strip()
+        if _SIGN_OFF.match(line) or _DISCLAIMER.match(line):
+            if i != content[0]:  # never cut the whole message
+                lines = lines[:i]
+            break
+    return "\n".join(lines)
+
+# ---------- whitespace, cap ----------
+_INVISIBLE = re.compile("[\u200b\u200c\u200d\u2060\ufeff\u00ad]")
+_SPACES = re.compile("[ \t\r\f\v\u00a0\u2000-\u200a\u202f\u3000]+")
+_BLANKS = re.compile(r"\n{3,}")
+
+def collapse_whitespace(text: str) -> str:
+    text = _INVISIBLE.sub("", text)
+    text = "\n".join(_SPACES.sub(" ", l).strip() for l in text.split("\n"))
+    return _BLANKS.sub("\n\n", text).strip()
+
+def cap(text: str, max_chars: int) -> str:
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " …"
+
+def clean_email_body(content: str, content_type: str="text", max_chars: int|None=None, parser: str|None=None,
+                     subject: str|None=None) -> str:
+    is_html = (content_type or "").lower() == "html"
+    text = html_to_text(content or "", parser) if is_html else (content or "")
+    cleaned = collapse_whitespace(strip_quoted(collapse_whitespace(text)))
+    if len(cleaned) < MIN_KEEP and is_forward(content, subject):
+        # Little or nothing above a forwarded message: the forwarded part is the message
+        if is_html:
+            text = html_to_text(content or "", parser, keep_quotes=True)
+        cleaned = collapse_whitespace(strip_quoted(collapse_whitespace(text), cut_replies=False))
+    return cap(cleaned, CLEAN_MAX_CHARS if max_chars is None else max_chars)
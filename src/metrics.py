@@ -0,0 +1,247 @@
+# src/metrics.py
+# In-process metrics and tracing shared by the agent, MCPClient and the MCP servers.
+# - counters, gauges and fixed-bucket latency histograms, labelled like Prometheus
+# - spans: timed stages tagged with a trace id; the current trace id rides along in
+#   JSON-RPC params ("trace_id"), so a server's spans line up with the email's
+# - exposed as a JSON snapshot (the metrics.get RPC) or Prometheus text (serve_http)
+# Recording is a dict lookup + bisect under one lock (a few µs; ~15 µs for a timed RPC),
+# next to nothing beside millisecond RPCs, so it stays on.
+# AGENT_METRICS=0 turns recording off.
+import bisect, contextvars, functools, hashlib, json, os, threading, time, uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("AGENT_METRICS", "1") in ("1", "true", "True", "yes", "YES")
+TRACE_BUFFER = int(os.getenv("AGENT_TRACE_BUFFER", "2000"))  # finished spans kept for metrics.get
+
+# Seconds; covers in-memory work (sub-ms) up to slow LLM calls
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_trace = contextvars.ContextVar("trace_id", default=None)
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(BUCKETS, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate from the buckets (linear inside the bucket), like histogram_quantile()."""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = BUCKETS[i - 1] if i else 0.0
+                hi = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lo + (hi - lo) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._hists = {}
+        self.spans = deque(maxlen=TRACE_BUFFER)
+
+    # ---------- recording ----------
+    def inc(self, name, value=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        k = _key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0) + value
+
+    def gauge_add(self, name, delta, **labels):
+        if not METRICS_ENABLED:
+            return
+        k = _key(name, labels)
+        with self._lock:
+            self._gauges[k] = self._gauges.get(k, 0) + delta
+
+    def gauge_set(self, name, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        if not METRICS_ENABLED:
+            return
+        k = _key(name, labels)
+        with self._lock:
+            h = self._hists.get(k)
+            if h is None:
+                h = self._hists[k] = _Histogram()
+            h.observe(seconds)
+
+    @contextmanager
+    def timed(self, prefix, **labels):
+        """{prefix}_seconds histogram, {prefix}_inflight gauge, {prefix}_errors_total counter."""
+        self.gauge_add(f"{prefix}_inflight", 1, **labels)
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc(f"{prefix}_errors_total", **labels)
+            raise
+        finally:
+            self.observe(f"{prefix}_seconds", time.perf_counter() - t0, **labels)
+            self.gauge_add(f"{prefix}_inflight", -1, **labels)
+
+    # ---------- reading ----------
+    def totals(self, name, label, group=None):
+        """Seconds recorded in histogram family `name`, summed per value of `label` (mapped through group)."""
+        out = {}
+        with self._lock:
+            for (n, labels), h in self._hists.items():
+                if n == name:
+                    v = dict(labels).get(label)
+                    v = group(v) if group else v
+                    out[v] = out.get(v, 0.0) + h.sum
+        return out
+
+    def snapshot(self, spans: int=100):
+        with self._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._counters.items())]
+            gauges = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in sorted(self._gauges.items())]
+            hists = []
+            for (n, l), h in sorted(self._hists.items()):
+                hists.append({
+                    "name": n, "labels": dict(l), "count": h.count, "sum": round(h.sum, 6),
+                    "p50": _round(h.quantile(0.5)), "p95": _round(h.quantile(0.95)), "p99": _round(h.quantile(0.99)),
+                })
+            recent = list(self.spans)[-spans:] if spans else []
+        return {"counters": counters, "gauges": gauges, "histograms": hists, "spans": recent}
+
+    def prometheus(self):
+        """Text exposition format (version 0.0.4)."""
+        out, typed = [], set()
+
+        def head(name, kind):
+            if name not in typed:
+                typed.add(name)
+                out.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (n, l), v in sorted(self._counters.items()):
+                head(n, "counter")
+                out.append(f"{n}{_labels(l)} {v}")
+            for (n, l), v in sorted(self._gauges.items()):
+                head(n, "gauge")
+                out.append(f"{n}{_labels(l)} {v}")
+            for (n, l), h in sorted(self._hists.items()):
+                head(n, "histogram")
+                cum = 0
+                for le, c in zip(BUCKETS + ("+Inf",), h.counts):
+                    cum += c
+                    out.append(f"{n}_bucket{_labels(l + (('le', str(le)),))} {cum}")
+                out.append(f"{n}_sum{_labels(l)} {h.sum:.6f}")
+                out.append(f"{n}_count{_labels(l)} {h.count}")
+        return "\n".join(out) + "\n"
+
+def _round(v):
+    return None if v is None else round(v, 6)
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+registry = Registry()
+
+# ---------- tracing ----------
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+def trace_for(key: str):
+    """Stable trace id for an email id, so a message resumed in a later cycle keeps its trace."""
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+def current_trace():
+    return _trace.get()
+
+@contextmanager
+def span(name, trace: str|None=None, histogram: bool=True, **attrs):
+    """
+    Time a stage as `span_seconds{span=name}` and keep it in the recent-spans buffer.
+    trace: make this the current trace id inside the block (MCPClient forwards it).
+    histogram=False: buffer only, when the caller already records the latency.
+    """
+    token = _trace.set(trace) if trace else None
+    tid = _trace.get()
+    start, t0, error = time.time(), time.perf_counter(), None
+    try:
+        yield
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        if token is not None:
+            _trace.reset(token)
+        if METRICS_ENABLED:
+            if histogram:
+                registry.observe("span_seconds", elapsed, span=name)
+            if error:
+                registry.inc("span_errors_total", span=name)
+            registry.spans.append({"trace_id": tid, "span": name, "start": round(start, 6),
+                                   "ms": round(elapsed * 1000, 3), "error": error, **attrs})
+
+def traced(name):
+    """Decorator form of span() for a whole function."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+# ---------- exposure ----------
+def handle_rpc(params: dict):
+    """metrics.get: {"format": "json" (default) | "prometheus", "spans": recent spans to include}."""
+    if (params or {}).get("format") == "prometheus":
+        return {"text": registry.prometheus()}
+    return registry.snapshot(int((params or {}).get("spans", 100)))
+
+def serve_http(port: int, host: str="127.0.0.1"):
+    """GET /metrics (Prometheus text) and /metrics.json on a background thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics.json"):
+                body, ctype = json.dumps(registry.snapshot()).encode("utf-8"), "application/json"
+            elif self.path.startswith("/metrics"):
+                body, ctype = registry.prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
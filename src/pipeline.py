@@ -0,0 +1,115 @@
+# src/pipeline.py
+# Tiny staged pipeline: each stage has its own worker threads and a bounded input
+# queue, so a slow stage (the LLM) overlaps with the others instead of blocking them,
+# and a fast stage can't run arbitrarily far ahead of a slow one.
+import queue, threading
+
+_STOP = object()
+
+class Stage:
+    """
+    - fn(item) -> output, or None to drop the item
+    - many=True: fn returns an iterable and each element is forwarded
+    - workers: threads running fn; use 1 for stages that must stay serialized
+    - batch > 1: fn receives a list of up to `batch` items, gathered for at most
+      `linger` seconds after the first one arrives
+    """
+    def __init__(self, name: str, fn, workers: int=1, many: bool=False, batch: int=1, linger: float=0.05):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.many = many
+        self.batch = max(1, batch)
+        self.linger = linger
+        self.ok = 0
+        self.failed = 0
+
+def run_pipeline(stages: list, feeds: dict, queue_size: int=16, on_error=None):
+    """
+    Run items through `stages` in order and block until everything drained.
+    - feeds: {stage_index: iterable of items} — usually {0: sources}, but items can
+      also enter at a later stage (e.g. work resumed after a crash)
+    - on_error(stage, item, exc): called when fn raises; the item is dropped
+    Returns {stage name: {"ok": n, "failed": n}}.
+    """
+    n = len(stages)
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    lock = threading.Lock()
+    # Producers still feeding each stage: the previous stage (as a whole) + its feeder.
+    producers = [(1 if i > 0 else 0) + (1 if i in feeds else 0) for i in range(n)]
+    live_workers = [s.workers for s in stages]
+
+    def producer_done(i):
+        if i >= n:
+            return
+        with lock:
+            producers[i] -= 1
+            last = producers[i] == 0
+        if last:
+            for _ in range(stages[i].workers):
+                queues[i].put(_STOP)
+
+    def emit(i, out):
+        if i < n:
+            queues[i].put(out)
+
+    def worker(i):
+        stage = stages[i]
+        while True:
+            item = queues[i].get()
+            if item is _STOP:
+                break
+            stopping = False
+            if stage.batch > 1:
+                item = [item]
+                while len(item) < stage.batch:
+                    try:
+                        nxt = queues[i].get(timeout=stage.linger)
+                    except queue.Empty:
+                        break
+                    if nxt is _STOP:
+                        stopping = True
+                        break
+                    item.append(nxt)
+            try:
+                out = stage.fn(item)
+                if out is not None:
+                    for o in (out if stage.many else (out,)):
+                        emit(i + 1, o)
+                with lock:
+                    stage.ok += 1
+            except Exception as e:
+                with lock:
+                    stage.failed += 1
+                if on_error:
+                    on_error(stage, item, e)
+            if stopping:
+                break
+        with lock:
+            live_workers[i] -= 1
+            last = live_workers[i] == 0
+        if last:
+            producer_done(i + 1)
+
+    def feeder(i, items):
+        try:
+            for item in items:
+                queues[i].put(item)
+        finally:
+            producer_done(i)
+
+    threads = []
+    for i, stage in enumerate(stages):
+        for w in range(stage.workers):
+            threads.append(threading.Thread(target=worker, args=(i,), name=f"{stage.name}-{w}", daemon=True))
+    for i, items in feeds.items():
+        threads.append(threading.Thread(target=feeder, args=(i, items), name=f"feed-{i}", daemon=True))
+    for t in threads:
+        t.start()
+    for i in range(n):
+        if producers[i] == 0:  # nothing will ever feed this stage
+            producers[i] = 1
+            producer_done(i)
+    for t in threads:
+        t.join()
+    return {s.name: {"ok": s.ok, "failed": s.failed} for s in stages}
@@ -0,0 +1,110 @@
+# src/planner.py
+# In-memory rescheduling for "make room" requests.
+# Input: the busy time that can't move, our movable [AGENT] events (each with a
+# deadline and duration) and a window that has to become free. Output: a list of
+# moves after which the window is free and every moved event still ends before its
+# deadline inside work hours — or None when no such plan was found. Nothing is
+# written here; the caller applies the diff only when a plan exists.
+#
+# Search, bounded by a time budget:
+#   round 0: move only the events overlapping the window, earliest deadline first
+#   round k: additionally re-place the k movable events nearest to the window,
+#            EDF-compacted; then every event whose old slot is still free stays put
+# The first feasible round wins, so the diff stays as small as the search allows.
+import time
+from datetime import datetime, time as dtime
+
+from src.availability import AvailabilityIndex
+
+def _overlaps(a_start, a_end, b_start, b_end):
+    return a_start < b_end and a_end > b_start
+
+def _edf(index, todo, not_before, work_start, work_end, step_min, deadline_of):
+    """Put each of `todo` at its earliest slot, earliest deadline first; {id: (start, end)} or None."""
+    placed = {}
+    for m in sorted(todo, key=deadline_of):
+        slot = index.earliest_slot(not_before, m["deadline"], m["duration_min"], work_start, work_end, step_min)
+        if slot is None:
+            return None
+        index.add(*slot)
+        placed[m["id"]] = slot
+    return placed
+
+def _place(base, keep, todo, not_before, work_start, work_end, step_min, deadline_of):
+    """Re-place `todo` around `base` + `keep`; returns {id: (start, end)} or None."""
+    fixed = list(base) + [(m["start"], m["end"]) for m in keep]
+    placed = _edf(AvailabilityIndex(fixed), todo, not_before, work_start, work_end, step_min, deadline_of)
+    if placed is None:
+        return None
+    # Feasible. Now shrink the diff: keep the conflicts where EDF put them, leave every
+    # other event where it was if that is still free, and re-place only the rest.
+    must = [m for m in todo if m["_must_move"]]
+    index = AvailabilityIndex(fixed + [placed[m["id"]] for m in must])
+    smaller = {m["id"]: placed[m["id"]] for m in must}
+    rest = []
+    for m in sorted((m for m in todo if not m["_must_move"]), key=deadline_of):
+        if index.is_free(m["start"], m["end"]):
+            index.add(m["start"], m["end"])
+            smaller[m["id"]] = (m["start"], m["end"])
+        else:
+            rest.append(m)
+    moved = _edf(index, rest, not_before, work_start, work_end, step_min, deadline_of)
+    if moved is None:
+        return placed
+    smaller.update(moved)
+    return smaller
+
+def plan_make_room(fixed, movables, want_start: datetime, want_end: datetime, not_before: datetime,
+                   work_start: dtime, work_end: dtime, step_min: int=30, budget_s: float=0.5):
+    """
+    - fixed: [(start, end)] busy time that can't move
+    - movables: [{"id", "subject", "start", "end", "deadline", "duration_min"}], aware datetimes;
+      events already started (start < not_before) are treated as fixed
+    Returns {"moves": [{"id", "subject", "from": (s, e), "to": (s, e)}] or None,
+             "reason": str|None, "rounds": n, "elapsed_ms": x}.
+    """
+    t0 = time.perf_counter()
+
+    def result(moves, reason=None, rounds=0):
+        return {"moves": moves, "reason": reason, "rounds": rounds,
+                "elapsed_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+    fixed = list(fixed)
+    movable = []
+    for m in movables:
+        if m["start"] < not_before:
+            fixed.append((m["start"], m["end"]))
+        else:
+            movable.append(dict(m, _must_move=_overlaps(m["start"], m["end"], want_start, want_end)))
+
+    if not AvailabilityIndex(fixed).is_free(want_start, want_end):
+        return result(None, "window overlaps events that can't be moved")
+
+    conflicts = [m for m in movable if m["_must_move"]]
+    if not conflicts:
+        return result([])
+    base = fixed + [(want_start, want_end)]  # the window stays reserved while planning
+    deadline_of = lambda m: (m["deadline"], m["start"])
+
+    # Free up neighbours nearest to the window first: they block the slots conflicts want
+    mid = want_start + (want_end - want_start) / 2
+    others = sorted((m for m in movable if not m["_must_move"]), key=lambda m: abs(m["start"] - mid))
+
+    # k = 0, 1, 2, 4, ... len(others): few rounds even when many events could move
+    sizes = [0]
+    while sizes[-1] < len(others):
+        sizes.append(min(len(others), max(1, 2 * sizes[-1])))
+    for rounds, k in enumerate(sizes, 1):
+        if time.perf_counter() - t0 > budget_s:
+            return result(None, "time budget exhausted", rounds - 1)
+        todo = conflicts + others[:k]
+        placed = _place(base, others[k:], todo, not_before, work_start, work_end, step_min, deadline_of)
+        if placed is None:
+            continue
+        moves = [
+            {"id": m["id"], "subject": m.get("subject"), "from": (m["start"], m["end"]), "to": placed[m["id"]]}
+            for m in sorted(todo, key=deadline_of)
+            if placed[m["id"]] != (m["start"], m["end"])
+        ]
+        return result(moves, None, rounds)
+    return result(None, "no placement meets every deadline", len(sizes))
@@ -0,0 +1,101 @@
+# src/processed_store.py
+# Durable record of which emails the agent already handled.
+# SQLite (WAL) with the message id as primary key: O(1)-ish membership checks,
+# one transaction per poll cycle, and time-based pruning so it doesn't grow forever.
+import json, os, threading, time
+
+from src.db import open_db
+
+PROCESSED_DB_FILE = os.getenv("AGENT_PROCESSED_DB", "processed_emails.db")
+LEGACY_JSON_FILE = "processed_emails.json"   # pre-SQLite format, imported once
+RETENTION_DAYS = int(os.getenv("AGENT_PROCESSED_RETENTION_DAYS", "180"))
+
+class ProcessedStore:
+    def __init__(self, path: str=PROCESSED_DB_FILE, legacy_json: str|None=LEGACY_JSON_FILE):
+        self._db = open_db(path)
+        self._lock = threading.Lock()
+        self._staged = {}  # msg_id -> processed_at, written on commit()
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS processed ("
+                " msg_id TEXT PRIMARY KEY,"
+                " processed_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS processed_at_idx ON processed(processed_at)")
+            # Messages part-way through the pipeline, so a crash resumes where it stopped
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS in_flight ("
+                " msg_id TEXT PRIMARY KEY,"
+                " stage TEXT NOT NULL,"
+                " data TEXT NOT NULL,"
+                " updated_at REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+        if legacy_json and os.path.exists(legacy_json):
+            self._import_legacy(legacy_json)
+
+    def _import_legacy(self, path):
+        with open(path, "r") as f:
+            ids = json.load(f)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO processed(msg_id, processed_at) VALUES (?, ?)",
+                [(i, now) for i in ids],
+            )
+        os.replace(path, path + ".migrated")
+        print(f"🗃️ Imported {len(ids)} processed ids from {path}.")
+
+    def __contains__(self, msg_id):
+        with self._lock:
+            if msg_id in self._staged:
+                return True
+            row = self._db.execute("SELECT 1 FROM processed WHERE msg_id = ?", (msg_id,)).fetchone()
+        return row is not None
+
+    def add(self, msg_id):
+        """Stage an id; it becomes durable on the next commit()."""
+        with self._lock:
+            self._staged[msg_id] = time.time()
+
+    def commit(self):
+        with self._lock:
+            if not self._staged:
+                return
+            rows, self._staged = list(self._staged.items()), {}
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO processed(msg_id, processed_at) VALUES (?, ?)", rows
+                )
+
+    # ---------- per-message pipeline state (written immediately) ----------
+    def set_stage(self, msg_id, stage: str, data: dict):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO in_flight(msg_id, stage, data, updated_at) VALUES (?, ?, ?, ?)",
+                (msg_id, stage, json.dumps(data), time.time()),
+            )
+
+    def finish(self, msg_id):
+        """Mark processed and drop its pipeline state in one transaction."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO processed(msg_id, processed_at) VALUES (?, ?)", (msg_id, time.time())
+            )
+            self._db.execute("DELETE FROM in_flight WHERE msg_id = ?", (msg_id,))
+
+    def in_flight(self):
+        """[(msg_id, stage, data)] for messages a previous run left mid-pipeline."""
+        with self._lock:
+            rows = self._db.execute("SELECT msg_id, stage, data FROM in_flight").fetchall()
+        return [(m, st, json.loads(d)) for m, st, d in rows]
+
+    def prune(self, older_than_days: int=RETENTION_DAYS):
+        cutoff = time.time() - older_than_days * 86400
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM processed WHERE processed_at < ?", (cutoff,)).rowcount
+
+    def close(self):
+        self.commit()
+        self._db.close()
@@ -1,37 +1,40 @@
 from clients.mcp_client import MCPClient
-from datetime import datetime, timedelta, time as dtime, date as ddate
+from src.availability import AvailabilityIndex
+from src.calendar_mirror import event_time
+from src.planner import plan_make_room
+from src.event_store import default_store
+from src.task_parser import ExtractedTask, from_llm_string
+from src.metrics import traced
+from datetime import datetime, timedelta, time as dtime
 from dateutil import parser as date_parser
 from zoneinfo import ZoneInfo
-import re, os, json
+import re, os
 
 busy_slots = []
 
 LOCAL_TZ = os.getenv("AGENT_TZ", "Africa/Tunis")
 TAG = "[AGENT]"  # marker so we only move our own events
-DB_FILE = "agent_events.json"
+LIST_SELECT = ["id", "subject", "start", "end", "body"]
 
 # New: working window + preference
 WORK_START = os.getenv("AGENT_WORK_START", "09:00")  # HH:MM
 WORK_END   = os.getenv("AGENT_WORK_END",   "18:00")  # HH:MM
 PREFER_MORNING = os.getenv("AGENT_PREFER_MORNING", "1") in ("1","true","True","yes","YES")
+PLANNER_BUDGET_MS = int(os.getenv("AGENT_PLANNER_BUDGET_MS", "500"))
+PLANNER_DRY_RUN = os.getenv("AGENT_PLANNER_DRY_RUN", "0") in ("1","true","True","yes","YES")
 
 def _tz():
     return ZoneInfo(LOCAL_TZ)
 
+def _store(client):
+    """The calendar's metadata store: a CalendarMirror carries its account's, else the single-mailbox one."""
+    store = getattr(client, "store", None)
+    return default_store() if store is None else store  # (an empty store is falsy: it has __len__)
+
 def _parse_hhmm(s: str) -> dtime:
     hh, mm = s.split(":")
     return dtime(int(hh), int(mm))
 
-def load_db():
-    if os.path.exists(DB_FILE):
-        with open(DB_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
-
-def save_db(db):
-    with open(DB_FILE, "w", encoding="utf-8") as f:
-        json.dump(db, f, indent=2)
-
 def event_exists(client: MCPClient, task, start, end):
     events = client.call("calendar.list", {
         "start": start.astimezone(ZoneInfo("UTC")).isoformat(),
@@ -44,11 +47,23 @@ def event_exists(client: MCPClient, task, start, end):
             return True
     return False
 
-def find_slot(client: MCPClient, due, duration, exclude_windows=None):
+def _event_span(ev):
+    return event_time(ev, "start").astimezone(_tz()), event_time(ev, "end").astimezone(_tz())
+
+def _busy_index(events, exclude_windows=None):
+    busy_ranges = [_event_span(ev) for ev in events]
+    busy_ranges += busy_slots
+    if exclude_windows:
+        busy_ranges += exclude_windows
+    return AvailabilityIndex(busy_ranges)
+
+def find_slot(client: MCPClient, due, duration, exclude_windows=None, index: AvailabilityIndex|None=None):
     """
     Search day-by-day within work hours, preferring mornings.
     - due: aware datetime in LOCAL_TZ (deadline at/before which it must fit)
     - duration: minutes
+    - index: prebuilt AvailabilityIndex to query instead of listing the calendar
+      (defaults to client.index when client is a CalendarMirror)
     """
     tz = _tz()
     now = datetime.now(tz)
@@ -60,56 +75,29 @@ def find_slot(client: MCPClient, due, duration, exclude_windows=None):
         print("⚠️ Task too far in the future, skipping.")
         return None
 
-    # Build a quick busy map from Graph between now and due
-    events = client.call("calendar.list", {
-        "start": now.astimezone(ZoneInfo("UTC")).isoformat(),
-        "end":   due.astimezone(ZoneInfo("UTC")).isoformat()
-    }) or []
-
-    busy_ranges = [
-        (date_parser.parse(ev["start"]["dateTime"]).astimezone(tz),
-         date_parser.parse(ev["end"]["dateTime"]).astimezone(tz))
-        for ev in events
-    ]
-    busy_ranges += busy_slots
-    if exclude_windows:
-        busy_ranges += exclude_windows
-
-    ws = _parse_hhmm(WORK_START)
-    we = _parse_hhmm(WORK_END)
-    step = timedelta(minutes=30)
-
-    # Iterate days from today to deadline day (inclusive if time allows)
-    day = now.date()
-    last_day = due.date()
-
-    while day <= last_day:
-        # Day window in local tz
-        day_start = datetime.combine(day, ws, tzinfo=tz)
-        day_end   = datetime.combine(day, we, tzinfo=tz)
-
-        # Clip today's window to "now"
-        if day == now.date():
-            day_start = max(day_start, now)
-
-        # Clip the last day to the deadline time
-        if day == last_day:
-            day_end = min(day_end, due)
-
-        if day_start < day_end:
-            # If we prefer mornings, we already start from work start (earliest first).
-            # Otherwise you could set PREFER_MORNING=0 and we still scan from day_start forward.
-            slot_start = day_start
-            while slot_start + timedelta(minutes=duration) <= day_end:
-                slot_end = slot_start + timedelta(minutes=duration)
-                is_busy = any(s < slot_end and e > slot_start for s, e in busy_ranges)
-                if not is_busy:
-                    return slot_start, slot_end
-                slot_start += step
-
-        day = ddate.fromordinal(day.toordinal() + 1)
-
-    return None
+    extra = list(exclude_windows or [])
+    if index is None:
+        index = getattr(client, "index", None)  # a CalendarMirror keeps one current
+        if index is not None:
+            extra += busy_slots
+    if index is None:
+        # Build a busy index from Graph between now and due (sorted + merged once)
+        events = client.call("calendar.list", {
+            "start": now.astimezone(ZoneInfo("UTC")).isoformat(),
+            "end":   due.astimezone(ZoneInfo("UTC")).isoformat()
+        }) or []
+        index = _busy_index(events, extra)
+        extra = []
+
+    # Temporary exclusions on a shared index are added for this query only
+    for ws_, we_ in extra:
+        index.add(ws_, we_)
+    try:
+        # Earliest first, on the same 30-minute grid the scan always used
+        return index.earliest_slot(now, due, duration, _parse_hhmm(WORK_START), _parse_hhmm(WORK_END), step_min=30)
+    finally:
+        for ws_, we_ in extra:
+            index.remove(ws_, we_)
 
 def _build_body_meta(task, due, duration_min):
     # Put metadata in the body so we can relocate later respecting its deadline.
@@ -142,131 +130,157 @@ def _parse_meta_from_event(event_json):
         return deadline, duration_min
     return None, None
 
-def _get_full_event(client: MCPClient, event_id: str):
-    try:
-        return client.call("calendar.get", {"id": event_id})
-    except Exception:
-        return None
-
-def _our_event_with_meta(client: MCPClient, event_stub):
-    """Check if event has our TAG and extract meta by fetching full event."""
-    ev_id = event_stub.get("id")
-    full = _get_full_event(client, ev_id)
-    if not full:
-        return None
+def _meta_from_full(ev_id, full):
     deadline, duration_min = _parse_meta_from_event(full)
     if deadline and duration_min:
         return {
             "id": ev_id,
             "subject": full.get("subject"),
-            "start": date_parser.parse(full["start"]["dateTime"]),
-            "end": date_parser.parse(full["end"]["dateTime"]),
+            "start": event_time(full, "start"),
+            "end": event_time(full, "end"),
             "deadline": deadline,
             "duration_min": duration_min
         }
     return None
 
-def _overlaps(a_start, a_end, b_start, b_end):
-    return a_start < b_end and a_end > b_start
-
-def _try_make_room(client: MCPClient, want_start, want_end, depth=2):
+def _meta_from_local(stub, local):
+    tz = _tz()
+    try:
+        deadline = date_parser.parse(local["deadline"])
+    except Exception:
+        return None
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=tz)
+    return {
+        "id": stub["id"],
+        "subject": stub.get("subject") or local.get("subject"),
+        "start": event_time(stub, "start"),
+        "end": event_time(stub, "end"),
+        "deadline": deadline,
+        "duration_min": int(local["duration_min"])
+    }
+
+def _our_events_with_meta(client: MCPClient, event_stubs):
     """
-    Try to move our own events (with metadata) to free [want_start, want_end).
-    Greedy, limited recursion depth.
+    Our events among `event_stubs`, with their metadata.
+    Resolved locally when possible: first the local metadata store, then the stub's
+    own body (when listed with a body projection). Only stubs that are neither
+    known locally nor carry a body are fetched, in one calendar.get_many.
     """
+    store = _store(client)
+    local = store.get_many(ev.get("id") for ev in event_stubs if ev.get("id"))
+    metas, ids = [], []
+    for ev in event_stubs:
+        ev_id = ev.get("id")
+        if not ev_id:
+            continue
+        meta = None
+        if ev_id in local:
+            meta = _meta_from_local(ev, local[ev_id])
+            if meta and (local[ev_id]["start"], local[ev_id]["end"]) != (meta["start"], meta["end"]):
+                store.move(ev_id, meta["start"], meta["end"])  # moved outside the agent (or legacy row)
+        elif "body" in ev:
+            meta = _meta_from_full(ev_id, ev)
+            if meta is None:
+                continue  # body seen, no tag: not ours
+        if meta:
+            metas.append(meta)
+        else:
+            ids.append(ev_id)
+    if not ids:
+        return metas
+    try:
+        fulls = client.call("calendar.get_many", {"ids": ids}) or []
+    except Exception:
+        return metas
+    for ev_id, full in zip(ids, fulls):
+        if not full or "error" in full:
+            continue
+        meta = _meta_from_full(ev_id, full)
+        if meta:
+            metas.append(meta)
+            store.upsert(ev_id, meta["subject"], meta["start"], meta["end"], meta["deadline"], meta["duration_min"], LOCAL_TZ)
+    return metas
+
+@traced("make_room")
+def _try_make_room(client: MCPClient, want_start, want_end, dry_run: bool|None=None):
+    """
+    Free [want_start, want_end) by moving our own events (those with metadata).
+    The whole rearrangement is planned in memory (src/planner.py) and applied as one
+    batch only if every moved event still fits before its deadline.
+    dry_run (default AGENT_PLANNER_DRY_RUN): print the plan without applying it.
+    """
+    if dry_run is None:
+        dry_run = PLANNER_DRY_RUN
     tz = _tz()
+    now = datetime.now(tz)
     window = (want_start.astimezone(tz), want_end.astimezone(tz))
-    # List all events that overlap this window
+
+    # Snapshot of the scheduling horizon, bodies included so our tags come along
+    horizon_end = max(window[1], now + timedelta(days=30))  # find_slot's reach
     events = client.call("calendar.list", {
-        "start": want_start.astimezone(ZoneInfo("UTC")).isoformat(),
-        "end":   want_end.astimezone(ZoneInfo("UTC")).isoformat()
+        "start": now.astimezone(ZoneInfo("UTC")).isoformat(),
+        "end":   horizon_end.astimezone(ZoneInfo("UTC")).isoformat(),
+        "select": LIST_SELECT
     }) or []
-
-    # Collect our movable events with metadata
-    candidates = []
-    for ev in events:
-        cand = _our_event_with_meta(client, ev)
-        if not cand:
-            continue  # not ours, don't touch
-        if not _overlaps(cand["start"].astimezone(tz), cand["end"].astimezone(tz), *window):
-            continue
-        candidates.append(cand)
-
-    # Sort by slack = (deadline - current_end), smallest first (least flexible first)
-    def slack(c):
-        return (c["deadline"] - c["end"].astimezone(_tz())).total_seconds()
-    candidates.sort(key=slack)
-
-    for cand in candidates:
-        # Try to find a new slot for cand before its own deadline
-        dur = cand["duration_min"]
-        exclude = [(window[0], window[1])]  # don't re-use the wanted window
-        new_slot = find_slot(client, cand["deadline"].astimezone(tz), dur, exclude_windows=exclude)
-        if new_slot:
-            new_start, new_end = new_slot
-            # Move it
-            client.call("calendar.update", {
-                "id": cand["id"],
-                "start": new_start.isoformat(),
-                "end":   new_end.isoformat(),
-                "tz":    LOCAL_TZ
-            })
-            print(f"↪️ Moved '{cand['subject']}' to {new_start}–{new_end} to make room.")
-            return True
-
-    # If depth allows, try recursive chain move: temporarily try to move a conflicting event,
-    # then see if that frees the window; if not, revert (best-effort).
-    if depth > 0:
-        for cand in candidates:
-            dur = cand["duration_min"]
-            exclude = [(window[0], window[1])]
-            new_slot = find_slot(client, cand["deadline"].astimezone(tz), dur, exclude_windows=exclude)
-            if not new_slot:
-                # Maybe we can make room for cand itself (chain)
-                c_start, c_end = cand["start"].astimezone(tz), cand["end"].astimezone(tz)
-                if _try_make_room(client, c_start, c_end, depth-1):
-                    # After freeing cand's own window, try again to place cand
-                    new_slot2 = find_slot(client, cand["deadline"].astimezone(tz), dur, exclude_windows=exclude)
-                    if new_slot2:
-                        ns, ne = new_slot2
-                        client.call("calendar.update", {
-                            "id": cand["id"],
-                            "start": ns.isoformat(),
-                            "end":   ne.isoformat(),
-                            "tz":    LOCAL_TZ
-                        })
-                        print(f"↪️ (chain) Moved '{cand['subject']}' to {ns}–{ne}.")
-                        return True
+    movables = []
+    for m in _our_events_with_meta(client, events):
+        movables.append(dict(m, start=m["start"].astimezone(tz), end=m["end"].astimezone(tz),
+                             deadline=m["deadline"].astimezone(tz)))
+    movable_ids = {m["id"] for m in movables}
+    fixed = [_event_span(ev) for ev in events if ev.get("id") not in movable_ids]
+    fixed += busy_slots
+
+    plan = plan_make_room(fixed, movables, window[0], window[1], now,
+                          _parse_hhmm(WORK_START), _parse_hhmm(WORK_END), step_min=30,
+                          budget_s=PLANNER_BUDGET_MS / 1000)
+    moves = plan["moves"]
+    if moves is None:
+        print(f"🧩 No feasible plan: {plan['reason']} ({plan['rounds']} rounds, {plan['elapsed_ms']} ms).")
+        return False
+    for mv in moves:
+        print(f"🧩 Plan: '{mv['subject']}' {mv['from'][0]} → {mv['to'][0]}–{mv['to'][1]}")
+    if dry_run:
+        print(f"🧪 Dry run: {len(moves)} move(s) planned, nothing applied.")
+        return False
+    if not moves:
+        return True
+
+    results = client.call("calendar.apply_changes", {"changes": [
+        {"op": "update", "id": mv["id"], "start": mv["to"][0].isoformat(), "end": mv["to"][1].isoformat(), "tz": LOCAL_TZ}
+        for mv in moves
+    ]}) or []
+    failed = [mv for mv, res in zip(moves, results) if "error" in (res or {})]
+    store = _store(client)
+    if not failed and len(results) == len(moves):
+        for mv in moves:
+            store.move(mv["id"], *mv["to"])
+            print(f"↪️ Moved '{mv['subject']}' to {mv['to'][0]}–{mv['to'][1]} to make room.")
+        return True
+
+    # Partial failure: put the moved ones back so the calendar stays consistent
+    done = [mv for mv, res in zip(moves, results) if "error" not in (res or {})]
+    print(f"⚠️ {len(failed) or len(moves) - len(results)} move(s) failed; reverting {len(done)}.")
+    if done:
+        client.call("calendar.apply_changes", {"changes": [
+            {"op": "update", "id": mv["id"], "start": mv["from"][0].isoformat(), "end": mv["from"][1].isoformat(), "tz": LOCAL_TZ}
+            for mv in done
+        ]})
     return False
 
-def process_task(client: MCPClient, extracted):
-    if not extracted or extracted.lower().strip() == "(none)":
+def process_task(client: MCPClient, extracted: ExtractedTask|str|None):
+    """Schedule one extracted task (an LLM-style "(TASK, DATE, DURATION)" string is accepted too)."""
+    if isinstance(extracted, str):
+        try:
+            extracted = from_llm_string(extracted, _tz())
+        except Exception as e:
+            print(f"❌ Invalid task format: {extracted} → {e}")
+            return
+    if extracted is None:
         print("✅ No task to schedule.")
         return
 
-    try:
-        task, date_str, duration_str = [p.strip() for p in extracted.strip("()").split(",")]
-
-        tz = _tz()
-        has_time = bool(re.search(r"\d{1,2}:\d{2}", date_str))
-        due = date_parser.parse(date_str)
-        if due.tzinfo is None:
-            due = due.replace(tzinfo=tz)
-        if not has_time:
-            due = due.replace(hour=17, minute=0)
-
-        ds = duration_str.lower()
-        if re.fullmatch(r"\d+(\.\d+)?", ds):
-            duration = int(float(ds) * 60)   # bare number = hours
-        elif ds.endswith("h"):
-            duration = int(float(ds[:-1]) * 60)
-        elif ds.endswith("min"):
-            duration = int(float(ds[:-3]))
-        else:
-            duration = 60
-    except Exception as e:
-        print(f"❌ Invalid task format: {extracted} → {e}")
-        return
+    task, due, duration, has_time = extracted.task, extracted.due, extracted.duration_min, extracted.has_time
 
     if has_time:
         start = due
@@ -279,7 +293,7 @@ def process_task(client: MCPClient, extracted):
         })
         if events:
             print("⚠️ Time busy. Trying to make room...")
-            if not _try_make_room(client, start, end, depth=2):
+            if not _try_make_room(client, start, end):
                 print("⛔ Could not make room without violating other deadlines.")
                 return
 
@@ -296,14 +310,7 @@ def process_task(client: MCPClient, extracted):
         })
         if created:
             # store metadata locally too
-            db = load_db()
-            db[created["id"]] = {
-                "subject": task,
-                "deadline": due.isoformat(),
-                "duration_min": duration,
-                "tz": LOCAL_TZ
-            }
-            save_db(db)
+            _store(client).upsert(created["id"], task, start, end, due, duration, LOCAL_TZ)
             print(f"📆 Scheduled (fixed time): {task} at {start}")
     else:
         # Find a free working slot before the deadline
@@ -313,7 +320,7 @@ def process_task(client: MCPClient, extracted):
             # target the last 'duration' block before the deadline
             start = (due - timedelta(minutes=duration))
             end = due
-            if not _try_make_room(client, start, end, depth=2):
+            if not _try_make_room(client, start, end):
                 print("⛔ Could not make room before deadline.")
                 return
             # After making room, the desired final window should be free
@@ -332,12 +339,6 @@ def process_task(client: MCPClient, extracted):
             "body":  body
         })
         if created:
-            db = load_db()
-            db[created["id"]] = {
-                "subject": task,
-                "deadline": due.isoformat(),
-                "duration_min": duration,
-                "tz": LOCAL_TZ
-            }
-            save_db(db)
+            # store metadata locally too
+            _store(client).upsert(created["id"], task, start, end, due, duration, LOCAL_TZ)
             print(f"📆 Scheduled: {task} on {start} (before deadline {due})")
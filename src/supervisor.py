@@ -0,0 +1,135 @@
+# src/supervisor.py
+# Multi-mailbox mode: serves every account from src/accounts.py with a pool of workers.
+# - accounts are sharded across AGENT_WORKERS processes by a stable hash of the id, so a
+#   mailbox always lands on the same worker (its stores are only ever opened by one process)
+# - inside a worker, AGENT_WORKER_THREADS threads run cycles for due accounts round-robin;
+#   an account never has two cycles at once, so a slow or failing mailbox holds one thread
+#   and backs off on its own AdaptivePoll while the others keep going
+# - each account has a RateBudget (emails/min); a cycle takes at most what's left of it
+# - a worker that dies is restarted with backoff; the rest of the shards are unaffected
+# Push notifications are single-mailbox only for now: workers rely on the adaptive poll.
+import multiprocessing as mp
+import os, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from src.accounts import Account, RateBudget, load_accounts
+from src.ingest import AdaptivePoll
+
+WORKERS = int(os.getenv("AGENT_WORKERS", "2"))                # processes
+WORKER_THREADS = int(os.getenv("AGENT_WORKER_THREADS", "4"))  # concurrent cycles per process
+RESTART_MAX = 60.0  # seconds; cap on the crashed-worker restart backoff
+
+def shard(account_id: str, n: int) -> int:
+    """Stable across runs and processes (unlike hash())."""
+    return zlib.crc32(account_id.encode("utf-8")) % n
+
+def shards(accounts: list, n: int) -> list:
+    out = [[] for _ in range(n)]
+    for a in accounts:
+        out[shard(a.id, n)].append(a)
+    return [s for s in out if s]
+
+class _Slot:
+    """One account's scheduling state inside a worker."""
+    def __init__(self, account: Account):
+        self.account = account
+        self.poll = AdaptivePoll()
+        self.budget = RateBudget(account.rate_per_min)
+        self.due = 0.0
+        self.running = False
+
+def run_worker(accounts: list, threads: int=WORKER_THREADS, stop: threading.Event|None=None,
+               cycle=None, tick: float=0.5):
+    """
+    Serve `accounts` until stop is set. cycle(account, max_emails) -> handled runs one
+    mail cycle (get_emails_with_tasks by default).
+    """
+    if cycle is None:
+        from src.email_mcp import get_emails_with_tasks
+        cycle = lambda a, n: get_emails_with_tasks(account=a.id, state_dir=a.state_dir, max_emails=n)
+    stop = stop or threading.Event()
+    slots = [_Slot(a) for a in accounts]
+    lock = threading.Lock()
+    wake = threading.Event()
+    nxt = 0  # round-robin start, so no account always goes first
+
+    def run(slot):
+        a = slot.account
+        try:
+            handled = cycle(a, min(slot.budget.available(), a.max_emails)) or 0
+            slot.budget.spend(handled)
+            wait = slot.poll.activity() if handled else slot.poll.idle()
+            if handled and slot.budget.available() < 1:
+                wait = max(wait, slot.budget.wait_for(1))
+            print(f"⏳ [{a.label}] handled {handled}; next check in {wait:.0f} seconds")
+        except Exception as e:
+            wait = slot.poll.error()
+            print(f"❌ [{a.label}] {e} (retrying in {wait:.0f} seconds)")
+        with lock:
+            slot.due = time.monotonic() + wait
+            slot.running = False
+        wake.set()
+
+    with ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="mailbox") as pool:
+        while not stop.is_set():
+            now = time.monotonic()
+            with lock:
+                free = threads - sum(s.running for s in slots)
+                order = slots[nxt:] + slots[:nxt]
+                launch = [s for s in order if not s.running and s.due <= now][:max(0, free)]
+                for slot in launch:
+                    slot.running = True
+                    pool.submit(run, slot)
+                if launch:
+                    nxt = (slots.index(launch[-1]) + 1) % len(slots)
+                idle = [s.due for s in slots if not s.running]
+            wake.clear()
+            wake.wait(max(0.0, min(idle) - now) if idle and free > len(launch) else tick)
+            if stop.is_set():
+                break
+        print("🛑 Worker stopping; waiting for running cycles...")
+
+def _worker_main(accounts):
+    try:
+        run_worker(accounts)
+    except KeyboardInterrupt:
+        pass
+
+def supervise(accounts: list|None=None, workers: int=WORKERS):
+    """Start one process per shard and keep them running; Ctrl+C stops all of them."""
+    accounts = accounts if accounts is not None else load_accounts()
+    parts = shards(accounts, max(1, min(workers, len(accounts))))
+    ctx = mp.get_context("spawn")  # clean interpreter per worker: no inherited sockets or locks
+    procs, backoff, restart_at = {}, {}, {}
+
+    def start(i):
+        p = ctx.Process(target=_worker_main, args=(parts[i],), name=f"agent-worker-{i}", daemon=True)
+        p.start()
+        procs[i] = (p, time.monotonic())
+        print(f"👷 Worker {i} (pid {p.pid}): {', '.join(a.label for a in parts[i])}")
+
+    print(f"🟢 Serving {len(accounts)} mailboxes with {len(parts)} worker(s)... (Ctrl+C to stop)")
+    for i in range(len(parts)):
+        start(i)
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for i, (p, started) in list(procs.items()):
+                if p.is_alive() or i in restart_at:
+                    continue
+                # A worker that ran for a while before dying starts over at 1s
+                delay = 1.0 if now - started > RESTART_MAX else min(RESTART_MAX, backoff.get(i, 0.5) * 2)
+                backoff[i] = delay
+                restart_at[i] = now + delay
+                print(f"⚠️ Worker {i} exited ({p.exitcode}); restarting in {delay:.0f}s")
+            for i, at in list(restart_at.items()):
+                if now >= at:
+                    del restart_at[i]
+                    start(i)
+    except KeyboardInterrupt:
+        print("🛑 Stopped by user.")
+    finally:
+        for p, _ in procs.values():
+            p.terminate()
+        for p, _ in procs.values():
+            p.join(5)
@@ -0,0 +1,271 @@
+# src/task_parser.py
+# Structured tasks, and a local rule-based extractor for the easy cases.
+# ExtractedTask is what process_task schedules: no more "(TASK, DATE, DURATION)"
+# strings split on commas (which broke on tasks containing commas).
+# parse_local() handles well-formed requests ("finish the report by Friday 3pm, ~2h")
+# deterministically, with a confidence score; callers send low-confidence emails to the LLM.
+import os, re
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta, date as ddate
+from zoneinfo import ZoneInfo
+from dateutil import parser as date_parser
+
+DAYFIRST = os.getenv("AGENT_DAYFIRST", "1") in ("1", "true", "True", "yes", "YES")  # 05/03 = 5 March
+MAX_DURATION_MIN = 240   # same cap the LLM prompt uses ("max 4h")
+DEFAULT_DURATION_MIN = 60
+DEFAULT_DUE_HOUR = 17    # deadline time when only a date is given
+
+@dataclass
+class ExtractedTask:
+    task: str
+    due: datetime          # aware
+    duration_min: int
+    has_time: bool         # the deadline names a time of day (fixed-time booking)
+    confidence: float = 1.0
+    source: str = "llm"    # "llm" | "local"
+
+    def __str__(self):
+        return f"({self.task}, {self.due.strftime('%Y-%m-%d %H:%M')}, {self.duration_min}min)"
+
+    def to_dict(self):
+        return {**asdict(self), "due": self.due.isoformat()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{**d, "due": datetime.fromisoformat(d["due"])})
+
+def parse_duration(s: str) -> int:
+    """LLM-style duration ("2h", "1.5", "30min", "45 minutes") → minutes; 60 when unreadable."""
+    ds = (s or "").strip().lower()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*(h|hr|hrs|hours?|m|min|mins|minutes?)?", ds)
+    if not m:
+        return DEFAULT_DURATION_MIN
+    value, unit = float(m.group(1)), (m.group(2) or "h")  # bare number = hours
+    return int(value if unit.startswith("m") else value * 60)
+
+def from_llm_string(extracted: str, tz: ZoneInfo) -> ExtractedTask|None:
+    """
+    "(TASK, YYYY-MM-DD HH:MM, DURATION)" → ExtractedTask; None for "(NONE)".
+    The task may itself contain commas: date and duration are the last two fields.
+    Raises ValueError when the string doesn't have that shape.
+    """
+    s = (extracted or "").strip()
+    if not s or s.lower() == "(none)":
+        return None
+    parts = [p.strip() for p in s.strip("()").rsplit(",", 2)]
+    if len(parts) != 3:
+        raise ValueError(f"expected (TASK, DATE, DURATION), got {extracted!r}")
+    task, date_str, duration_str = parts
+    has_time = bool(re.search(r"\d{1,2}:\d{2}", date_str))
+    due = date_parser.parse(date_str)
+    if due.tzinfo is None:
+        due = due.replace(tzinfo=tz)
+    if not has_time:
+        due = due.replace(hour=DEFAULT_DUE_HOUR, minute=0)
+    return ExtractedTask(task, due, parse_duration(duration_str), has_time)
+
+# ---------- local rule-based extraction ----------
+_WEEKDAYS = {d: i for i, d in enumerate(("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"))}
+_WEEKDAYS.update({d[:3]: i for d, i in list(_WEEKDAYS.items())})
+_MONTHS = {m: i + 1 for i, m in enumerate(("january", "february", "march", "april", "may", "june", "july",
+                                           "august", "september", "october", "november", "december"))}
+_MONTHS.update({m[:3]: i for m, i in list(_MONTHS.items())})
+_MONTHS["sept"] = 9
+
+_MONTH_RE = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+# Full names only: "mon"/"sun"/"sat" are too common as words
+_WD_RE = r"(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)"
+
+_DATE_PATTERNS = [
+    ("iso", re.compile(r"\b(?P<y>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(?P<a>\d{1,2})[/.](?P<b>\d{1,2})(?:[/.](?P<y>\d{2,4}))?\b")),
+    ("month_day", re.compile(rf"\b(?P<mon>{_MONTH_RE})\.?\s+(?P<d>\d{{1,2}})(?:st|nd|rd|th)?(?:,?\s+(?P<y>\d{{4}}))?\b", re.I)),
+    ("day_month", re.compile(rf"\b(?P<d>\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?(?P<mon>{_MONTH_RE})\.?(?:,?\s+(?P<y>\d{{4}}))?\b", re.I)),
+    ("weekday", re.compile(rf"\b(?:(?P<rel>this|next|coming)\s+)?(?P<wd>{_WD_RE})\b", re.I)),
+    ("relative", re.compile(r"\b(?P<rel>today|tonight|tomorrow|day after tomorrow|end of (?:the )?day|eod|"
+                            r"end of (?:the )?week|eow|in (?P<n>\d+) days?)\b", re.I)),
+]
+_TIME_RE = re.compile(
+    r"\b(?:(?P<h>\d{1,2})(?::(?P<mi>\d{2}))?\s*(?P<ap>a\.?m\.?|p\.?m\.?)|(?P<h24>[01]?\d|2[0-3])[:h](?P<mi24>[0-5]\d)|(?P<noon>noon|midday))(?!\w)",
+    re.I)
+_DURATION_RE = re.compile(
+    r"\(?\s*(?:(?:it\s+)?(?:should|will|would|might)?\s*(?:take|takes)\s+|~\s*|(?:about|around|approx\.?|roughly)\s+|,\s*)?"
+    r"(?:(?P<num>\d+(?:\.\d+)?)\s*(?P<unit>h|hrs?|hours?|min|mins|minutes?)\b|(?P<half>half an hour)|(?P<one>an hour))"
+    r"(?:\s+(?:of work|job|task))?\)?",
+    re.I)
+_ITS_A_JOB = re.compile(r",?\s*it'?s\s+an?\s+(?P<num>\d+(?:\.\d+)?)\s*(?P<unit>h|hrs?|hours?|min|mins|minutes?)\s+(?:job|task)\b", re.I)
+
+_GREETING = re.compile(r"^(?:hi|hello|hey|dear|bonjour|salut)\b[^,\n]{0,40}[,!]?\s*", re.I)
+_CUE = re.compile(
+    r"^(?:(?:could|can|would|will) you(?: please)?|please|kindly|i need you to|we need you to|i need to|we need to|"
+    r"need you to|remember to|don't forget to|do not forget to|make sure (?:to|you)|"
+    r"merci de|pourriez-vous|pouvez-vous|peux-tu|il faut)\s+", re.I)
+_IMPERATIVE = re.compile(
+    r"^(?:prepare|send|review|finish|submit|complete|draft|write|update|book|schedule|call|fix|create|organi[sz]e|"
+    r"check|email|plan|set up|finalize|finalise|compile|share|approve|sign|renew|pay|order|reply)\b", re.I)
+_CONNECT = r"(?:\s*,)?\s*(?:(?:no later than|by|before|until|till|on|at|due|for|this|next|avant le|pour le|d'ici)\s+)*"
+
+def _resolve_date(kind, m, ref: datetime):
+    """(date, ambiguous: bool) for one date match, or (None, False)."""
+    today = ref.date()
+    g = m.groupdict()
+    try:
+        if kind == "iso":
+            return ddate(int(g["y"]), int(g["m"]), int(g["d"])), False
+        if kind == "numeric":
+            a, b = int(g["a"]), int(g["b"])
+            d, mo = (a, b) if DAYFIRST else (b, a)
+            y = int(g["y"]) if g["y"] else today.year
+            if y < 100:
+                y += 2000
+            out = ddate(y, mo, d)
+            if not g["y"] and out < today:
+                out = ddate(y + 1, mo, d)
+            return out, (a <= 12 and b <= 12 and a != b)
+        if kind in ("month_day", "day_month"):
+            mo = _MONTHS[g["mon"].lower().rstrip(".")]
+            y = int(g["y"]) if g["y"] else today.year
+            out = ddate(y, mo, int(g["d"]))
+            if not g["y"] and out < today:
+                out = ddate(y + 1, mo, int(g["d"]))
+            return out, False
+        if kind == "weekday":
+            wd = _WEEKDAYS[g["wd"].lower()[:3]]
+            ahead = (wd - today.weekday()) % 7
+            rel = (g["rel"] or "").lower()
+            if rel == "next" and wd >= today.weekday():
+                ahead += 7  # "next Friday" said on Monday, "next Monday" said on Monday: a week on
+            return today + timedelta(days=ahead), rel == "next"
+        if kind == "relative":
+            rel = g["rel"].lower()
+            if g["n"]:
+                return today + timedelta(days=int(g["n"])), False
+            if rel in ("today", "tonight") or "day" in rel and "end" in rel or rel == "eod":
+                return today, False
+            if rel == "tomorrow":
+                return today + timedelta(days=1), False
+            if rel == "day after tomorrow":
+                return today + timedelta(days=2), False
+            return today + timedelta(days=(4 - today.weekday()) % 7), False  # end of week → Friday
+    except (ValueError, KeyError):
+        pass
+    return None, False
+
+def _find_dates(text, ref):
+    """[(start, end, date, ambiguous)] for every date expression, overlapping matches dropped."""
+    found = []
+    for kind, rx in _DATE_PATTERNS:
+        for m in rx.finditer(text):
+            if any(m.start() < e and m.end() > s for s, e, _, _ in found):
+                continue
+            if kind == "numeric" and _TIME_RE.fullmatch(m.group(0)):
+                continue
+            d, amb = _resolve_date(kind, m, ref)
+            if d:
+                found.append((m.start(), m.end(), d, amb))
+    return sorted(found)
+
+def _find_time(text, taken):
+    for m in _TIME_RE.finditer(text):
+        if any(m.start() < e and m.end() > s for s, e in taken):
+            continue
+        g = m.groupdict()
+        if g["noon"]:
+            return m.start(), m.end(), 12, 0
+        if g["h24"] is not None:
+            return m.start(), m.end(), int(g["h24"]), int(g["mi24"])
+        h = int(g["h"]) % 12 + (12 if g["ap"].lower().startswith("p") else 0)
+        if h < 24:
+            return m.start(), m.end(), h, int(g["mi"] or 0)
+    return None
+
+def _find_duration(text):
+    m = _ITS_A_JOB.search(text) or _DURATION_RE.search(text)
+    if not m:
+        return None
+    g = m.groupdict()
+    if g.get("half"):
+        minutes = 30
+    elif g.get("one"):
+        minutes = 60
+    else:
+        value = float(g["num"])
+        minutes = value if g["unit"].lower().startswith("m") else value * 60
+    return m.start(), m.end(), int(minutes)
+
+def _action_sentence(text):
+    """First sentence that reads like a request to us, with greeting/cue stripped."""
+    for raw in re.split(r"(?<=[.!?])\s+|\n+", text):
+        s = _GREETING.sub("", raw.strip())
+        if not s:
+            continue
+        cue = _CUE.match(s)
+        if cue:
+            return s[cue.end():], True
+        if _IMPERATIVE.match(s):
+            return s, True
+    return None, False
+
+def parse_local(text: str, tz: ZoneInfo, now: datetime|None=None) -> ExtractedTask|None:
+    """
+    Rule-based extraction for explicit requests. Returns None when there is no
+    recognizable request with a deadline; otherwise an ExtractedTask whose confidence
+    (0..1) says how much of it was read rather than guessed.
+    """
+    now = now or datetime.now(tz)
+    sentence, _ = _action_sentence(text or "")
+    if not sentence:
+        return None
+
+    # Deadline: prefer a date in the request itself, else anywhere in the email
+    confidence = 0.35
+    dates = _find_dates(sentence, now) or _find_dates(text, now)
+    in_sentence = bool(_find_dates(sentence, now))
+    if not dates:
+        return None
+    start, end, due_date, ambiguous = dates[0]
+    confidence += 0.35
+    if ambiguous:
+        confidence -= 0.15
+    if len({d for _, _, d, _ in dates}) > 1:
+        confidence -= 0.3  # several dates: which one is the deadline?
+
+    spans = [(start, end)] if in_sentence else []
+    time_src = sentence if in_sentence else text
+    t = _find_time(time_src, [(s, e) for s, e, _, _ in (_find_dates(time_src, now))])
+    if t:
+        confidence += 0.1
+        if in_sentence:
+            spans.append(t[:2])
+        due = datetime(due_date.year, due_date.month, due_date.day, t[2], t[3], tzinfo=tz)
+        has_time = True
+    else:
+        due = datetime(due_date.year, due_date.month, due_date.day, DEFAULT_DUE_HOUR, 0, tzinfo=tz)
+        has_time = False
+    if due <= now:
+        return None
+
+    dur = _find_duration(sentence) or _find_duration(text)
+    if dur:
+        confidence += 0.2
+        duration = max(5, min(dur[2], MAX_DURATION_MIN))
+        if _find_duration(sentence):
+            spans.append(dur[:2])
+    else:
+        duration = DEFAULT_DURATION_MIN
+
+    # Task = the request minus the deadline/duration phrases and their connectives
+    task = sentence
+    for s, e in sorted(spans, reverse=True):
+        pre = re.search(_CONNECT + r"$", task[:s], re.I)
+        task = task[:pre.start() if pre else s] + " " + task[e:]
+    task = _ITS_A_JOB.sub("", task)
+    task = re.sub(r"\s*\(\s*\)\s*", " ", task)
+    task = re.sub(r"\s{2,}", " ", task).strip(" \t,;:-–—.!?~")
+    if len(task) < 3:
+        return None
+    if len(task) > 80:
+        confidence -= 0.2
+        task = task[:80].rsplit(" ", 1)[0]
+    task = task[0].upper() + task[1:]
+    return ExtractedTask(task, due, duration, has_time, round(max(0.0, min(confidence, 1.0)), 2), "local")
@@ -0,0 +1,122 @@
+# src/triage.py
+# Cheap local scoring of an email before it goes to the LLM.
+# Newsletters, receipts and notifications almost never contain a task for us; a few
+# sender/header rules plus action-keyword and date/time detection catch most of them.
+# Emails scoring below AGENT_TRIAGE_THRESHOLD are marked processed without an LLM call.
+# Counts and a sample of decisions (with reasons) are logged for tuning the threshold.
+import json, os, random, re, threading, time
+
+TRIAGE_ENABLED = os.getenv("AGENT_TRIAGE", "1") in ("1", "true", "True", "yes", "YES")
+TRIAGE_THRESHOLD = float(os.getenv("AGENT_TRIAGE_THRESHOLD", "2"))
+TRIAGE_SAMPLE = float(os.getenv("AGENT_TRIAGE_SAMPLE", "0.1"))     # share of decisions logged in detail
+TRIAGE_LOG_FILE = os.getenv("AGENT_TRIAGE_LOG", "triage_log.jsonl")  # "" = console only
+
+_BULK_SENDER = re.compile(
+    r"^(?:no-?reply|do-?not-?reply|notifications?|newsletters?|news|marketing|mailer-daemon|postmaster|"
+    r"updates|alerts?|info|hello|team|support|billing|receipts?|orders?)[@+.\-_]", re.IGNORECASE)
+_BULK_SUBJECT = re.compile(
+    r"\b(?:newsletter|digest|receipt|your order|order confirmation|invoice\s*#|shipped|delivery|"
+    r"verify your|password reset|security alert|sign-?in|webinar|% off|sale|unsubscribe|"
+    r"out of office|automatic reply|réponse automatique|absent du bureau)\b", re.IGNORECASE)
+_BULK_BODY = re.compile(r"\b(?:unsubscribe|se désabonner|view (?:this email )?in (?:your )?browser|"
+                        r"manage (?:your )?(?:email )?preferences)\b", re.IGNORECASE)
+_ACTION = re.compile(
+    r"\b(?:please|could you|can you|would you|need(?:s)? to|have to|must|deadline|due|asap|urgent|"
+    r"prepare|send|review|submit|finish|complete|draft|update|schedule|book|call|remind|follow up|"
+    r"merci de|pouvez-vous|pourriez-vous|il faut|avant le|échéance|urgent)\b", re.IGNORECASE)
+_WHEN = re.compile(
+    r"\b(?:today|tonight|tomorrow|next week|this week|end of (?:the )?(?:day|week|month)|eod|eow|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|"
+    r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may\s+\d{1,2}|june?|july?|aug(?:ust)?|sep(?:tember)?|"
+    r"oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|"
+    r"aujourd'hui|demain|lundi|mardi|mercredi|jeudi|vendredi|semaine prochaine)\b|"
+    r"\b\d{4}-\d{2}-\d{2}\b|\b\d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?\b|\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b|\b\d{1,2}[:h]\d{2}\b",
+    re.IGNORECASE)
+_DURATION = re.compile(r"\b\d+(?:\.\d+)?\s?(?:h|hrs?|hours?|min|mins|minutes?|heures?)\b", re.IGNORECASE)
+
+def _sender(full):
+    return (((full.get("from") or full.get("sender") or {}).get("emailAddress") or {}).get("address") or "").lower()
+
+def _headers(full):
+    return {h.get("name", "").lower(): h.get("value", "") for h in full.get("internetMessageHeaders") or []}
+
+def score_email(full: dict, subject: str, text: str):
+    """(score, reasons): higher = more likely to contain a task for us."""
+    score, reasons = 0.0, []
+
+    def rule(points, why):
+        nonlocal score
+        score += points
+        reasons.append(f"{why} {points:+g}")
+
+    sender = _sender(full)
+    headers = _headers(full)
+    if _BULK_SENDER.match(sender):
+        rule(-3, "bulk sender")
+    if "list-unsubscribe" in headers or "list-id" in headers:
+        rule(-2, "mailing list")
+    if headers.get("precedence", "").lower() in ("bulk", "list", "junk") or "auto-submitted" in headers:
+        rule(-2, "automated")
+    if (full.get("inferenceClassification") or "").lower() == "other":
+        rule(-1, "not focused")
+    if _BULK_SUBJECT.search(subject or ""):
+        rule(-2, "bulk subject")
+    if _BULK_BODY.search(text or ""):
+        rule(-2, "unsubscribe footer")
+    if (full.get("importance") or "").lower() == "high":
+        rule(1, "high importance")
+
+    haystack = f"{subject or ''}\n{text or ''}"
+    actions = len(set(m.lower() for m in _ACTION.findall(haystack)))
+    if actions:
+        rule(min(actions, 3), "action words")
+    if _WHEN.search(haystack):
+        rule(2, "date/time")
+    if _DURATION.search(haystack):
+        rule(1, "duration")
+    if "?" in (text or ""):
+        rule(0.5, "question")
+    return score, reasons
+
+class Triage:
+    """One per poll cycle: decides, counts, and samples decisions to the log."""
+    def __init__(self, threshold: float=TRIAGE_THRESHOLD, enabled: bool=TRIAGE_ENABLED,
+                 sample: float=TRIAGE_SAMPLE, log_file: str|None=TRIAGE_LOG_FILE):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.sample = sample
+        self.log_file = log_file
+        self.passed = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def check(self, full: dict, subject: str, text: str) -> bool:
+        """True if the email should go to the LLM."""
+        if not self.enabled:
+            return True
+        score, reasons = score_email(full, subject, text)
+        keep = score >= self.threshold
+        with self._lock:
+            if keep:
+                self.passed += 1
+            else:
+                self.skipped += 1
+            if random.random() < self.sample:
+                self._log(full, subject, score, reasons, keep)
+        return keep
+
+    def _log(self, full, subject, score, reasons, keep):
+        # Caller holds the lock
+        verdict = "pass" if keep else "skip"
+        print(f"🔎 Triage {verdict} ({score:g} vs {self.threshold:g}): {subject!r} [{', '.join(reasons) or 'no signals'}]")
+        if self.log_file:
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), "id": full.get("id"), "from": _sender(full), "subject": subject,
+                                    "score": score, "threshold": self.threshold, "decision": verdict,
+                                    "reasons": reasons}) + "\n")
+
+    def summary(self):
+        if self.enabled and (self.passed or self.skipped):
+            total = self.passed + self.skipped
+            print(f"🔎 Triage: {self.passed} passed to extraction, {self.skipped} skipped "
+                  f"({100 * self.skipped / total:.0f}%, threshold {self.threshold:g}).")
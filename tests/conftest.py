@@ -0,0 +1,25 @@
+# tests/conftest.py
+# Run from the repo root: python -m pytest -q
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import pytest
+from bench.graph_stub import GraphStub, serve
+
+@pytest.fixture
+def graph_stub(monkeypatch):
+    """Factory: point the Graph server at a fresh GraphStub(**kw) with clean limits and tokens."""
+    import servers.graph_mcp_server as graph
+
+    def make(**kw):
+        stub = GraphStub(**dict({"limit": 10**6, "window": 1.0, "concurrency": 0, "latency_ms": 0}, **kw))
+        monkeypatch.setattr(graph, "GRAPH_BASE", serve(stub))
+        for name in ("_buckets", "_breakers", "_mailbox_slots", "_tokens"):
+            monkeypatch.setattr(graph, name, {})
+        for account in (None, "a", "b"):
+            mgr = graph._token_manager(account)  # the stub only reads the bearer token
+            mgr._token, mgr._expires_at = {"access_token": f"tok-{account}"}, time.time() + 3600
+        return stub
+    return make
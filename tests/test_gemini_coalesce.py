@@ -0,0 +1,90 @@
+# tests/test_gemini_coalesce.py
+import threading, time
+from types import SimpleNamespace
+import pytest
+import servers.gemini_mcp_server as gemini
+
+class _GatedModel:
+    """generate_content blocks until `gate` is set, so concurrent callers pile up behind it."""
+    def __init__(self, gate, fail=False):
+        self.gate, self.fail, self.prompts = gate, fail, []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        self.gate.wait(5)
+        if self.fail:
+            raise RuntimeError("upstream exploded")
+        return SimpleNamespace(text=f"answer to {prompt}")
+
+@pytest.fixture
+def model(monkeypatch):
+    gate = threading.Event()
+    m = _GatedModel(gate)
+    monkeypatch.setattr(gemini, "_cache", None)
+    monkeypatch.setattr(gemini, "_counters", {"upstream_calls": 0, "coalesced": 0, "queue_timeouts": 0})
+    gemini.set_model_factory(lambda name: m)
+    yield m
+    gate.set()
+    gemini.set_model_factory(None)
+
+def _run(prompts):
+    out, threads = [None] * len(prompts), []
+    def call(i, p):
+        try:
+            out[i] = gemini.llm_generate("gemini-test", p)
+        except Exception as e:
+            out[i] = e
+    for i, p in enumerate(prompts):
+        threads.append(threading.Thread(target=call, args=(i, p)))
+        threads[-1].start()
+    return out, threads
+
+def _wait_for(cond):
+    deadline = time.monotonic() + 5
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cond()
+
+def test_identical_concurrent_requests_share_one_upstream_call(model):
+    out, threads = _run(["same prompt"] * 5)
+    _wait_for(lambda: gemini._counters["coalesced"] == 4)
+    model.gate.set()
+    for t in threads: t.join()
+    assert model.prompts == ["same prompt"]
+    assert out == [{"text": "answer to same prompt"}] * 5
+    assert gemini._inflight == {}
+
+def test_different_prompts_are_not_coalesced(model):
+    out, threads = _run(["one", "two"])
+    _wait_for(lambda: len(model.prompts) == 2)
+    model.gate.set()
+    for t in threads: t.join()
+    assert gemini._counters == {"upstream_calls": 2, "coalesced": 0, "queue_timeouts": 0}
+    assert sorted(r["text"] for r in out) == ["answer to one", "answer to two"]
+
+def test_followers_get_the_leaders_error(model):
+    model.fail = True
+    out, threads = _run(["same prompt"] * 3)
+    _wait_for(lambda: gemini._counters["coalesced"] == 2)
+    model.gate.set()
+    for t in threads: t.join()
+    assert len(model.prompts) == 1
+    assert all(isinstance(r, RuntimeError) and "exploded" in str(r) for r in out)
+    assert gemini._inflight == {}
+
+def test_use_cache_false_does_not_write_the_cache(model, tmp_path, monkeypatch):
+    from servers.llm_cache import LLMCache, cache_key
+    cache = LLMCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(gemini, "_cache", cache)
+    model.gate.set()
+    key = cache_key("gemini-test", "fresh prompt")
+    assert gemini.llm_generate("gemini-test", "fresh prompt", use_cache=False) == {"text": "answer to fresh prompt"}
+    assert cache.get(key) is None
+    gemini.llm_generate("gemini-test", "fresh prompt")
+    assert cache.get(key) == {"text": "answer to fresh prompt"}
+
+def test_counts_are_not_lost_across_threads(model):
+    model.gate.set()
+    out, threads = _run([f"prompt {i}" for i in range(200)])
+    for t in threads: t.join()
+    assert gemini.llm_stats()["upstream_calls"] == 200
@@ -0,0 +1,67 @@
+# tests/test_graph_batch.py
+import time
+import servers.graph_mcp_server as graph
+
+def test_get_many_retries_throttled_sub_requests(graph_stub):
+    stub = graph_stub(limit=5, window=1.0)
+    ids = [f"msg-{i:05d}" for i in range(12)]
+    items = graph.get_messages(ids)
+    assert [it["id"] for it in items] == ids
+    assert not [it for it in items if "error" in it]
+    assert stub.status[429] >= 7
+
+def test_apply_changes_retries_behind_a_failed_dependency(graph_stub):
+    stub = graph_stub(limit=1, window=1.0)
+    stub.events["evt-a"] = {"id": "evt-a", "subject": "Review"}
+    changes = [{"op": "update", "id": "evt-a", "start": "2026-01-05T09:00:00", "end": "2026-01-05T10:00:00"},
+               {"op": "update", "id": "evt-a", "start": "2026-01-05T11:00:00", "end": "2026-01-05T12:00:00"},
+               {"op": "delete", "id": "evt-a"}]
+    out = graph.apply_changes(changes)
+    assert out[0]["id"] == out[1]["id"] == "evt-a"
+    assert out[2] == {"ok": True}
+    assert stub.status[424] >= 1  # the delete waited on the throttled update and went again
+    assert "evt-a" not in stub.events
+
+def test_batch_retry_stops_at_the_callers_deadline(graph_stub):
+    graph_stub(limit=1, window=30)
+    t0 = time.monotonic()
+    items = graph.handle_request({"method": "email.get_many",
+                                  "params": {"ids": ["msg-00000", "msg-00001"], "timeout": 4, "account": "a"}})
+    assert time.monotonic() - t0 < 1
+    assert set(graph._buckets) == {("a", "mail")}
+    assert "error" not in items[0]
+    assert items[1]["error"]["status"] == 429
+
+def test_apply_changes_chains_changes_to_one_event(graph_stub, monkeypatch):
+    stub = graph_stub()
+    stub.events.update({"evt-a": {"id": "evt-a"}, "evt-b": {"id": "evt-b"}})
+    sent, send = [], graph._send
+    monkeypatch.setattr(graph, "_send", lambda *a, **kw: sent.append(kw.get("json")) or send(*a, **kw))
+    changes = [{"op": "update", "id": "evt-a", "start": "2026-01-05T09:00:00", "end": "2026-01-05T10:00:00"},
+               {"op": "update", "id": "evt-b", "start": "2026-01-05T09:00:00", "end": "2026-01-05T10:00:00"},
+               {"op": "delete", "id": "evt-a"},
+               {"op": "create", "subject": "Focus", "start": "2026-01-05T09:00:00", "end": "2026-01-05T10:00:00"}]
+    out = graph.apply_changes(changes)
+    (batch,) = sent
+    assert [r.get("dependsOn") for r in batch["requests"]] == [None, None, ["0"], None]
+    assert out[0]["id"] == "evt-a" and out[1]["id"] == "evt-b" and out[2] == {"ok": True}
+    assert out[3]["subject"] == "Focus"
+    assert set(stub.events) == {"evt-b", out[3]["id"]}
+
+def test_get_many_keeps_input_order_across_chunks(graph_stub):
+    graph_stub(messages=50)
+    ids = [f"msg-{i:05d}" for i in reversed(range(45))] + ["missing"]
+    items = graph.get_messages(ids)
+    assert [it["id"] for it in items] == ids
+    assert items[-1]["error"]["status"] == 404
+
+def test_get_many_selects_the_fields_triage_reads(graph_stub, monkeypatch):
+    graph_stub()
+    sent, send = [], graph._send
+    monkeypatch.setattr(graph, "_send", lambda *a, **kw: sent.append(kw.get("json")) or send(*a, **kw))
+    items = graph.get_messages(["msg-00000", "msg-00001"])
+    assert [it["id"] for it in items] == ["msg-00000", "msg-00001"]
+    for r in sent[0]["requests"]:
+        path, _, query = r["url"].partition("?$select=")
+        assert path.startswith("/me/messages/")
+        assert {"internetMessageHeaders", "inferenceClassification", "importance", "body"} <= set(query.split(","))
@@ -0,0 +1,116 @@
+# tests/test_graph_limits.py
+# The Graph server's request layer against bench/graph_stub.py (no tenant, no MSAL sign-in).
+import asyncio, contextvars, threading, time
+import pytest
+from bench.fake_servers import free_port
+from clients.mcp_client import MCPClient
+from servers import mcp_core
+import servers.graph_mcp_server as graph
+
+@pytest.fixture
+def stub(graph_stub):
+    return graph_stub(messages=120)
+
+def test_streamed_pages_count_against_the_callers_mailbox(stub):
+    pages = {}
+    for account in ("a", "b"):
+        gen = graph.handle_request({"method": "email.list", "params": {"top": 120, "page_size": 50,
+                                                                      "stream": True, "account": account}})
+        # mcp_core pulls pages on executor threads, after handle_request has returned
+        t = threading.Thread(target=lambda a=account, g=gen: pages.__setitem__(a, [len(p) for p in g]))
+        t.start()
+        t.join()
+    assert pages == {"a": [50, 50, 20], "b": [50, 50, 20]}
+    assert set(graph._buckets) == {("a", "mail"), ("b", "mail")}
+    assert set(stub.seen) == {"Bearer tok-a", "Bearer tok-b"}
+
+def test_streamed_delta_keeps_its_return_value(stub, monkeypatch):
+    monkeypatch.setattr(graph, "_inbox_delta_url", lambda since: lambda: f"{graph.GRAPH_BASE}/me/messages?$top=50")
+    gen = graph.handle_request({"method": "email.delta", "params": {"stream": True, "account": "a"}})
+    pages = []
+    while True:
+        try:
+            pages.append(next(gen))
+        except StopIteration as stop:
+            final = stop.value
+            break
+    assert sum(len(p["messages"]) for p in pages) == 120
+    assert "deltaLink" in final
+    assert set(graph._buckets) == {("a", "mail")}
+
+def test_retry_after_past_the_callers_timeout_fails_at_once(graph_stub):
+    stub = graph_stub(limit=1, window=30)
+    graph.get_message("msg-00000")  # uses up the window
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match=r"HTTP 429 \(retry after \d+s\)"):
+        graph.handle_request({"method": "email.get", "params": {"id": "msg-00001", "timeout": 4}})
+    assert time.monotonic() - t0 < 1
+    assert stub.status[429] == 1
+
+def test_limiter_wait_past_the_callers_timeout_fails_at_once(graph_stub, monkeypatch):
+    graph_stub()
+    monkeypatch.setattr(graph, "GRAPH_RATE", 0.1)
+    monkeypatch.setattr(graph, "GRAPH_BURST", 1)
+    graph.get_message("msg-00000")  # the bucket's only token
+    t0 = time.monotonic()
+    with pytest.raises(graph.GraphThrottled, match="retry after"):
+        graph.handle_request({"method": "email.get", "params": {"id": "msg-00001", "timeout": 4}})
+    assert time.monotonic() - t0 < 1
+
+def test_trial_throttled_locally_does_not_keep_the_circuit_open(graph_stub, monkeypatch):
+    graph_stub()
+    monkeypatch.setattr(graph, "BREAKER_COOLDOWN", 0)
+    monkeypatch.setattr(graph, "GRAPH_RATE", 0.1)
+    monkeypatch.setattr(graph, "GRAPH_BURST", 1)
+    graph.get_message("msg-00000")  # the bucket's only token
+    breaker = graph._limits("mail")[2]
+    breaker.failures, breaker.opened_at = graph.BREAKER_FAILURES, time.monotonic()  # open, cooldown over
+    with pytest.raises(graph.GraphThrottled):
+        graph.handle_request({"method": "email.get", "params": {"id": "msg-00001", "timeout": 4}})
+    graph._limits("mail")[0].rate = 0  # limiter out of the way: the next call is the trial
+    assert graph.get_message("msg-00001")["id"] == "msg-00001"
+    assert breaker.opened_at is None
+
+def test_deadline_counts_from_arrival_not_from_the_handler(graph_stub):
+    graph_stub(limit=1, window=2)
+    graph.get_message("msg-00000")  # the next call gets Retry-After 1-2s
+    req = {"method": "email.get", "params": {"id": "msg-00001", "timeout": 10}}
+    ctx = contextvars.copy_context()
+    ctx.run(mcp_core._arrival.set, time.monotonic() - 9)  # queued in mcp_core for 9 of the caller's 10s
+    t0 = time.monotonic()
+    with pytest.raises(RuntimeError, match="HTTP 429"):
+        ctx.run(graph.handle_request, req)
+    assert time.monotonic() - t0 < 1
+
+def test_core_stamps_arrival_before_the_slot_wait():
+    def handler(req):
+        if req["method"] == "slow":
+            time.sleep(0.5)
+            return None
+        return time.monotonic() - mcp_core.arrival()
+    server = mcp_core.MCPServer(handler, "127.0.0.1", free_port(), "MCP-test", max_inflight=1)
+    threading.Thread(target=lambda: asyncio.run(server.serve_forever()), daemon=True).start()
+    time.sleep(0.2)
+    client = MCPClient(port=server.port)
+    slow = threading.Thread(target=client.call, args=("slow",))
+    slow.start()
+    time.sleep(0.1)
+    queued_for = client.call("probe")  # waits for the slow call's slot
+    slow.join()
+    assert queued_for >= 0.3
+
+def test_429_without_retry_after_pauses_and_sleeps_the_same_backoff(graph_stub, monkeypatch):
+    stub = graph_stub(concurrency=1)
+    draws = []
+    monkeypatch.setattr(graph, "_backoff", lambda attempt: draws.append(0.05) or 0.05)
+    paused, pause = [], graph._TokenBucket.pause
+
+    def pause_and_free(self, seconds):
+        paused.append(seconds)
+        stub.inflight["Bearer tok-None"] = 0  # the other request is done: the retry goes through
+        pause(self, seconds)
+    monkeypatch.setattr(graph._TokenBucket, "pause", pause_and_free)
+    stub.inflight["Bearer tok-None"] = 1  # another request in flight: the next one gets 429, no Retry-After
+    assert graph.get_message("msg-00000")["id"] == "msg-00000"
+    assert stub.status[429] == 1
+    assert draws == paused == [0.05]  # one draw, used for the pause and the sleep
@@ -0,0 +1,28 @@
+# tests/test_ingest.py
+import main_mcp
+from src.ingest import AdaptivePoll, NotificationReceiver, send_notification
+from src.processed_store import ProcessedStore
+
+def test_idle_poll_stays_within_its_ceiling():
+    poll = AdaptivePoll(min_s=5, max_s=60)
+    assert [poll.idle() for _ in range(6)] == [10, 20, 40, 60, 60, 60]
+    assert poll.activity() == 5
+
+def test_notified_ids_reach_the_loop(tmp_path, monkeypatch):
+    receiver = NotificationReceiver(port=0, client_state="s3cret").start()
+    try:
+        url = f"http://127.0.0.1:{receiver.port}{receiver.path}"
+        assert send_notification(url, ["m-1"], client_state="wrong") == 202
+        assert send_notification(url, ["m-1", "m-2"], client_state="s3cret") == 202
+        assert receiver.wake.wait(5)
+        notified = receiver.take()
+    finally:
+        receiver.stop()
+    assert notified == ["m-1", "m-2"]
+
+    monkeypatch.chdir(tmp_path)  # the single-mailbox stores live in the working directory
+    processed = ProcessedStore()
+    processed.add("m-1")
+    processed.commit()
+    processed.close()
+    assert main_mcp._not_processed(notified) == ["m-2"]
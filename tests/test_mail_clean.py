@@ -0,0 +1,44 @@
+# tests/test_mail_clean.py
+import pytest
+from src import mail_clean
+from src.mail_clean import clean_email_body
+
+PARSERS = ["stdlib", pytest.param("lxml", marks=pytest.mark.skipif(mail_clean._lxml_html is None, reason="lxml not installed"))]
+
+def test_short_plain_reply_drops_quote():
+    body = ("Yes, works for me.\n\n"
+            "On Mon, 5 Jan 2026 at 09:00, Alice <alice@contoso.com> wrote:\n"
+            "> Can we meet Thursday at 3pm to review the budget?\n"
+            "> Alice\n")
+    assert clean_email_body(body, "text") == "Yes, works for me."
+
+def test_short_plain_reply_above_outlook_headers():
+    body = ("OK\n\nFrom: Alice <alice@contoso.com>\nSent: Monday, January 5, 2026 9:00 AM\n"
+            "To: Bob\nSubject: Budget\n\nCan we meet Thursday at 3pm to review the budget?")
+    assert clean_email_body(body, "text") == "OK"
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_short_html_reply_drops_quote(parser):
+    body = ("<html><body><div>Sounds good</div>"
+            "<div class=\"gmail_quote\">On Mon, Alice wrote:<blockquote>Can we meet Thursday at 3pm "
+            "to review the budget for next quarter?</blockquote></div></body></html>")
+    assert clean_email_body(body, "html", parser=parser) == "Sounds good"
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_forward_keeps_forwarded_message(parser):
+    body = ("<div>FYI</div><div id=\"divRplyFwdMsg\"><b>From:</b> Alice<br><b>Sent:</b> Monday<br></div>"
+            "<div>Please book the review with finance for Thursday at 3pm.</div>")
+    text = clean_email_body(body, "html", parser=parser, subject="FW: Budget review")
+    assert "Please book the review with finance for Thursday at 3pm." in text
+    assert "FYI" in text
+
+def test_plain_forward_marker_keeps_forwarded_message():
+    body = ("FYI\n\n---------- Forwarded message ---------\nFrom: Alice <alice@contoso.com>\n"
+            "Date: Mon, 5 Jan 2026\nSubject: Budget\nTo: Bob\n\nPlease book the review with finance for Thursday.")
+    assert "Please book the review with finance for Thursday." in clean_email_body(body, "text")
+
+@pytest.mark.parametrize("parser", PARSERS)
+def test_blockquote_is_a_line_break(parser):
+    body = "<div>Forwarded note:</div><blockquote>Line one</blockquote><div>after</div>"
+    text = clean_email_body(body, "html", parser=parser, subject="Fwd: note")
+    assert [l for l in text.split("\n") if l] == ["Forwarded note:", "Line one", "after"]
@@ -0,0 +1,18 @@
+# tests/test_task_parser.py
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import pytest
+from src.task_parser import parse_local
+
+TZ = ZoneInfo("UTC")
+MONDAY = datetime(2026, 1, 5, 9, 0, tzinfo=TZ)
+
+def test_next_monday_said_on_a_monday_is_a_week_on():
+    t = parse_local("Could you prepare the slides for next Monday at 10:00? It should take 2 hours.", TZ, MONDAY)
+    assert t.due == datetime(2026, 1, 12, 10, 0, tzinfo=TZ)
+    assert t.duration_min == 120
+
+@pytest.mark.parametrize("phrase, day", [("next Friday", 16), ("this Friday", 9), ("Friday", 9), ("Monday", 5)])
+def test_weekday_deadlines(phrase, day):
+    t = parse_local(f"Could you send the budget report by {phrase} at 15:00?", TZ, MONDAY)
+    assert t.due == datetime(2026, 1, day, 15, 0, tzinfo=TZ)